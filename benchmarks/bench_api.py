@@ -0,0 +1,270 @@
+'''
+Benchmark suite for where time goes in a request, runnable offline.
+
+Micro benchmarks time the pieces of the login flow on the captured pages in `benchmarks/pages`:
+payload extraction, collecting methods, finding the default method, classifying a rejected otp and
+session serialization round trips. Macro benchmarks drive `/login`, `/change_method` and
+`/step_two_login` through falcon's test client against the local stand-in for google
+(`py_google_auth.stub`).
+
+Results can be saved as json and compared with the results of another version:
+
+    python benchmarks/bench_api.py --output before.json
+    python benchmarks/bench_api.py --compare before.json [--only micro|macro] [--number N]
+'''
+
+import json
+import optparse
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the API reads these when it is imported; errors logged on the way go to a temporary directory.
+os.environ.setdefault('PY_GOOGLE_AUTH_LOG_PATH', tempfile.mkdtemp(prefix='py_google_auth-bench'))
+os.environ.setdefault('PY_GOOGLE_AUTH_TOKEN', 'bench')
+
+from py_google_auth import login_utils  # noqa: E402
+from py_google_auth import session_store  # noqa: E402
+from py_google_auth import step_two_utils  # noqa: E402
+from py_google_auth import stub  # noqa: E402
+from py_google_auth import transport  # noqa: E402
+from py_google_auth import utils  # noqa: E402
+from py_google_auth.version import __version__  # noqa: E402
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name)) as f:
+        return f.read()
+
+
+class CapturedResponse(object):
+    '''
+    A captured page in place of a `requests.Response`; a new one is made for every call so the
+    page parsed on it is not reused.
+    '''
+
+    def __init__(self, text, url):
+        self.text = text
+        self.url = url
+
+
+def make_session():
+    '''
+    A session as it is between two steps of a login.
+    '''
+    session = transport.new_session()
+
+    for index in range(6):
+        session.cookies.set('COOKIE%d' % index, 'v' * 60, domain='.google.com', path='/')
+
+    session.next_url = otp_url('totp') + '?service=androiddeveloper'
+    session.prev_payload = utils.make_payload(read_page('challenge_totp.html'))
+    session.query_params = {'key': 'AIzaSyStubKey', 'txId': 'x' * 24}
+    session.select_method_url = 'https://accounts.google.com/signin/selectchallenge/1'
+
+    return session
+
+
+def serialization_case(format, store):
+    '''
+    A round trip of a session through `serialize_session` and `deserialize_session` with the given
+    session format and store.
+    '''
+
+    def setup():
+        os.environ['PY_GOOGLE_AUTH_SESSION_FORMAT'] = format
+
+        if store:
+            os.environ['PY_GOOGLE_AUTH_SESSION_STORE'] = store
+        else:
+            os.environ.pop('PY_GOOGLE_AUTH_SESSION_STORE', None)
+
+        session_store._store = None
+
+    def round_trip(session):
+        return utils.deserialize_session(utils.serialize_session(session))
+
+    return setup, round_trip
+
+
+def otp_url(method):
+    return 'https://accounts.google.com/signin/challenge/%s/2' % method
+
+
+def get_micro_cases():
+    '''
+    Returns `(name, setup, function)` for every micro benchmark.
+    '''
+    pages = {name[:-len('.html')]: read_page(name) for name in os.listdir(PAGES_DIR)
+             if name.endswith('.html')}
+    session = make_session()
+    cases = []
+
+    for name in ('service_login', 'challenge_az', 'challenge_ipp'):
+        cases.append(('make_payload[%s]' % name, None,
+                      lambda text=pages[name]: utils.make_payload(text)))
+
+    cases.append(('get_available_methods', None,
+                  lambda: utils.get_available_methods(pages['challenge_selection'])))
+
+    for name in ('challenge_az', 'challenge_totp', 'challenge_ipp', 'challenge_bc'):
+        cases.append(('get_default_method[%s]' % name, None,
+                      lambda text=pages[name]: login_utils.get_default_method(text)))
+
+    # branches of `handle_otp_error` which don't make requests: wrong code, resend code (text
+    # message) and timeout.
+    otp_errors = [('wrong_code', pages['challenge_totp_wrong_code'], otp_url('totp')),
+                  ('resend_code', pages['challenge_ipp'], otp_url('ipp')),
+                  ('timeout', pages['service_login'],
+                   'https://accounts.google.com/ServiceLogin?service=androiddeveloper')]
+
+    for name, text, url in otp_errors:
+        cases.append(('handle_otp_error[%s]' % name, None,
+                      lambda text=text, url=url: step_two_utils.handle_otp_error(
+                          CapturedResponse(text, url), session)))
+
+    for format, store in [('jsonpickle', None), ('json', None), ('compact', None),
+                          ('compact', 'memory')]:
+        setup, round_trip = serialization_case(format, store)
+        cases.append(('session_round_trip[%s%s]' % (format, '+' + store if store else ''), setup,
+                      lambda round_trip=round_trip: round_trip(session)))
+
+    return cases
+
+
+def run_micro(number):
+    results = {}
+    environ = dict(os.environ)
+
+    try:
+        for name, setup, function in get_micro_cases():
+            if setup is not None:
+                setup()
+
+            function()
+            seconds = min(timeit.repeat(function, number=number, repeat=3)) / number
+            results[name] = {'seconds': seconds}
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        session_store._store = None
+
+    return results
+
+
+def run_macro(number):
+    '''
+    Times every endpoint over `number` complete logins against the stand-in: login with Google
+    Authenticator as default method, change to text message and verify the code.
+    '''
+    import falcon.testing
+
+    server, url = stub.start()
+    os.environ['PY_GOOGLE_AUTH_ACCOUNTS_URL'] = url
+    os.environ['PY_GOOGLE_AUTH_CONTENT_URL'] = url
+
+    from py_google_auth import app
+
+    client = falcon.testing.TestClient(app.app)
+    token = os.environ['PY_GOOGLE_AUTH_TOKEN']
+    timings = {'NormalLogin': [], 'ChangeMethod': [], 'StepTwoLogin': []}
+
+    def post(resource, path, data, expected):
+        data['token'] = token
+
+        start = time.perf_counter()
+        response = client.simulate_post(path, body=json.dumps(data))
+        timings[resource].append(time.perf_counter() - start)
+
+        if not response.status.startswith(expected):
+            raise AssertionError("%s responded with %s" % (path, response.status))
+
+        return response.json
+
+    try:
+        # the first login opens the connections, it is not counted.
+        for index in range(number + 1):
+            data = post('NormalLogin', '/login',
+                        {'email': 'bench+totp@example.com', 'password': 'secret'}, '303')
+            method = [m for m in data['methods'] if 'text message' in m][0]
+
+            data = post('ChangeMethod', '/change_method',
+                        {'session': data['session'], 'method': method}, '200')
+            post('StepTwoLogin', '/step_two_login',
+                 {'session': data['session'], 'method': data['method'], 'otp': '123456'}, '200')
+
+            if index == 0:
+                for values in timings.values():
+                    del values[:]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    results = {}
+
+    for resource, values in timings.items():
+        values.sort()
+        results[resource] = {'seconds': sum(values) / len(values),
+                             'min': values[0],
+                             'median': values[len(values) // 2]}
+
+    return results
+
+
+def print_results(results, baseline=None):
+    print("%-44s %10s %10s" % ('benchmark', 'ms', 'change' if baseline else ''))
+
+    for name, result in results.items():
+        change = ''
+
+        if baseline and name in baseline:
+            change = '%+.1f%%' % ((result['seconds'] / baseline[name]['seconds'] - 1) * 100)
+
+        print("%-44s %10.3f %10s" % (name, result['seconds'] * 1000, change))
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [--only micro|macro] [--output FILE] '
+                                         '[--compare FILE]')
+    parser.add_option('--number', '-n', type='int', default=20,
+                      help='calls per timing round, or logins for macro benchmarks (default 20)')
+    parser.add_option('--only', choices=['micro', 'macro'],
+                      help='run only micro or macro benchmarks')
+    parser.add_option('--output', '-o', help='save results as json to this file')
+    parser.add_option('--compare', '-c', help='json results of an earlier run to compare with')
+    options, arguments = parser.parse_args()
+
+    results = {}
+
+    if options.only in (None, 'micro'):
+        results.update(run_micro(options.number))
+
+    if options.only in (None, 'macro'):
+        results.update(run_macro(options.number))
+
+    baseline = None
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+    print_results(results, baseline)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'version': __version__,
+                       'python': platform.python_version(),
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'number': options.number,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+'''
+Benchmark for form payload extraction on the captured login pages in `benchmarks/pages`.
+
+Compares the old approach (a full BeautifulSoup tree for every call) with the streaming
+extractor in `py_google_auth.forms` for each available backend.
+
+Run with:
+
+    python benchmarks/bench_forms.py [--number N]
+'''
+
+import optparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from py_google_auth import forms  # noqa: E402
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+# page name and index of the form the login flow reads from it.
+CASES = [('service_login.html', 0),
+         ('challenge_az.html', 0),
+         ('challenge_ipp.html', 0),
+         ('challenge_selection.html', 2)]
+
+
+def read_page(name):
+    with open(os.path.join(PAGES_DIR, name)) as f:
+        return f.read()
+
+
+def soup_payload(page, form_index, features):
+    '''
+    The extraction as it was done before `forms` existed.
+    '''
+    payload = {}
+    form = BeautifulSoup(page, features).find_all('form')[form_index]
+
+    for item in form.find_all('input'):
+        if item.has_attr('value') and item.has_attr('name'):
+            payload[item['name']] = item['value']
+
+    return payload
+
+
+def get_extractors():
+    extractors = [('bs4 tree (html.parser)',
+                   lambda page, index: soup_payload(page, index, 'html.parser'))]
+
+    if forms.etree is not None:
+        extractors.append(('bs4 tree (lxml)', lambda page, index: soup_payload(page, index, 'lxml')))
+
+    for backend in forms.BACKENDS:
+        if backend == 'lxml' and forms.etree is None:
+            continue
+        extractors.append(('streaming (%s)' % backend,
+                           lambda page, index, backend=backend: forms.get_form_inputs(page, index,
+                                                                                      backend)))
+
+    return extractors
+
+
+def run(number):
+    '''
+    Times every extractor on every page, returns a list of `(page, extractor, seconds per call)`.
+    '''
+    results = []
+
+    for name, form_index in CASES:
+        page = read_page(name)
+        extractors = get_extractors()
+        expected = extractors[0][1](page, form_index)
+
+        for label, extract in extractors:
+            if extract(page, form_index) != expected:
+                raise AssertionError("%s extracted a different payload from %s" % (label, name))
+
+            seconds = min(timeit.repeat(lambda: extract(page, form_index), number=number,
+                                        repeat=3)) / number
+            results.append((name, label, seconds))
+
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [--number N]')
+    parser.add_option('--number', '-n', type='int', default=20,
+                      help='calls per timing round (default 20)')
+    options, arguments = parser.parse_args()
+
+    results = run(options.number)
+    baseline = {}
+
+    print("%-26s %-26s %10s %8s" % ('page', 'extractor', 'ms/call', 'speedup'))
+    for name, label, seconds in results:
+        baseline.setdefault(name, seconds)
+        print("%-26s %-26s %10.3f %7.1fx" % (name, label, seconds * 1000,
+                                             baseline[name] / seconds))
+
+
+if __name__ == '__main__':
+    main()
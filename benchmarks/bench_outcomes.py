@@ -0,0 +1,181 @@
+'''
+Benchmark for telling the outcome of the captured login pages in `benchmarks/pages`.
+
+Every page is classified with all the tables of `py_google_auth.outcomes`, by:
+    * the chains of substring tests the login flow had before `outcomes` existed;
+    * the classifiers of `outcomes`;
+    * a single scan of the page per table with a regex alternation of its phrases;
+    * a single scan per table with an Aho-Corasick automaton, if pyahocorasick is installed.
+
+Run with:
+
+    python benchmarks/bench_outcomes.py [--number N]
+'''
+
+import optparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from py_google_auth import outcomes  # noqa: E402
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+CLASSIFIERS = (outcomes.LOGIN, outcomes.UNAVAILABLE, outcomes.DEFAULT_METHOD, outcomes.OTP,
+               outcomes.PROMPT)
+
+
+def read_pages():
+    return [(name, open(os.path.join(PAGES_DIR, name)).read())
+            for name in sorted(os.listdir(PAGES_DIR)) if name.endswith('.html')]
+
+
+def chains(text):
+    '''
+    The checks as they were done before `outcomes` existed.
+    '''
+    if "Google doesn't recognize that email" in text or "Wrong password" in text:
+        login = 'wrong_credentials'
+    elif "captcha" in text:
+        login = 'captcha'
+    else:
+        login = None
+
+    if "Please try again later" in text or "Something went wrong" in text:
+        unavailable = 'unavailable'
+    else:
+        unavailable = None
+
+    methods = {1: "Google prompt", 2: "Google Authenticator", 3: "text message", 4: "backup code"}
+
+    if "prompt to sign in" in text:
+        method = 1
+    else:
+        method = ([m for m in methods if methods[m] in text] or [None])[0]
+
+    if "Unavailable because of too many failed attempts" in text:
+        otp = 'blocked'
+    elif "Resend code" in text:
+        otp = 'resend'
+    else:
+        otp = None
+
+    prompt = 'canceled' if "Sign-in canceled" in text else None
+
+    return [login, unavailable, method, otp, prompt]
+
+
+def classifiers(text):
+    return [classifier.classify(text) for classifier in CLASSIFIERS]
+
+
+def get_priorities(classifier):
+    '''
+    Maps every phrase of a classifier to the priority and outcome of its rule.
+    '''
+    return {phrase: (priority, outcome)
+            for priority, (outcome, phrases) in enumerate(classifier.rules)
+            for phrase in phrases}
+
+
+def make_regex_scan():
+    tables = []
+
+    for classifier in CLASSIFIERS:
+        priorities = get_priorities(classifier)
+        pattern = re.compile('|'.join(re.escape(phrase) for phrase in priorities))
+        tables.append((pattern, priorities))
+
+    def scan(text):
+        results = []
+
+        for pattern, priorities in tables:
+            found = [priorities[match.group()] for match in pattern.finditer(text)]
+            results.append(min(found)[1] if found else None)
+
+        return results
+
+    return scan
+
+
+def make_automaton_scan():
+    tables = []
+
+    for classifier in CLASSIFIERS:
+        automaton = ahocorasick.Automaton()
+
+        for phrase, value in get_priorities(classifier).items():
+            automaton.add_word(phrase, value)
+
+        automaton.make_automaton()
+        tables.append(automaton)
+
+    def scan(text):
+        results = []
+
+        for automaton in tables:
+            found = [value for end, value in automaton.iter(text)]
+            results.append(min(found)[1] if found else None)
+
+        return results
+
+    return scan
+
+
+def get_scanners():
+    scanners = [('substring chains', chains),
+                ('outcomes classifiers', classifiers),
+                ('regex alternation', make_regex_scan())]
+
+    if ahocorasick is not None:
+        scanners.append(('aho-corasick', make_automaton_scan()))
+
+    return scanners
+
+
+def run(number):
+    '''
+    Times every scanner on every page, returns a list of `(page, scanner, seconds per page)`.
+    '''
+    results = []
+
+    for name, text in read_pages():
+        scanners = get_scanners()
+        expected = scanners[0][1](text)
+
+        for label, scan in scanners:
+            if scan(text) != expected:
+                raise AssertionError("%s found other outcomes on %s" % (label, name))
+
+            seconds = min(timeit.repeat(lambda: scan(text), number=number, repeat=3)) / number
+            results.append((name, label, seconds))
+
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [--number N]')
+    parser.add_option('--number', '-n', type='int', default=100,
+                      help='calls per timing round (default 100)')
+    options, arguments = parser.parse_args()
+
+    results = run(options.number)
+    baseline = {}
+
+    print("%-32s %-22s %10s %8s" % ('page', 'scanner', 'ms/page', 'speedup'))
+    for name, label, seconds in results:
+        baseline.setdefault(name, seconds)
+        print("%-32s %-22s %10.3f %7.1fx" % (name, label, seconds * 1000,
+                                             baseline[name] / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+'''
+Benchmark of how long it takes to start: importing the package as the command line does, running
+`py_google_auth --version`, importing the library and importing the app as a worker does.
+
+Every case runs in a new interpreter, which is what a new worker or command is. The third-party
+modules each case ended up importing are listed, since those are most of the time.
+
+    python benchmarks/bench_startup.py --output before.json
+    python benchmarks/bench_startup.py --compare before.json [--number N]
+'''
+
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from py_google_auth.version import __version__  # noqa: E402
+
+HEAVY_MODULES = ('bs4', 'jsonpickle', 'requests', 'falcon', 'lxml', 'aiohttp', 'gevent')
+
+# code run by the interpreter of every case, it prints the heavy modules imported.
+REPORT = ("import sys; print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,))
+
+CASES = [('import py_google_auth', ['-c', 'import py_google_auth; ' + REPORT]),
+         ('py_google_auth --version', ['-m', 'py_google_auth', '--version']),
+         ('import py_google_auth.utils', ['-c', 'import py_google_auth.utils; ' + REPORT]),
+         ('import py_google_auth.app', ['-c', 'import py_google_auth.app; ' + REPORT])]
+
+
+def run_case(arguments, number):
+    '''
+    Runs the interpreter `number` times; returns the best time and what the last run printed.
+    '''
+    environ = dict(os.environ)
+    environ['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, environ.get('PYTHONPATH')]))
+    environ.setdefault('PY_GOOGLE_AUTH_TOKEN', 'bench')
+
+    times = []
+    output = ''
+
+    for _ in range(number):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable] + arguments, env=environ,
+                                         stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    return min(times), output.decode('utf-8').strip()
+
+
+def get_baseline_seconds():
+    '''
+    Time to start a bare interpreter, which the cases can not go below.
+    '''
+    seconds, output = run_case(['-c', 'pass'], 5)
+    return seconds
+
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [--output FILE] [--compare FILE]')
+    parser.add_option('--number', '-n', type='int', default=10,
+                      help='runs of every case, the best is kept (default 10)')
+    parser.add_option('--output', '-o', help='save results as json to this file')
+    parser.add_option('--compare', '-c', help='json results of an earlier run to compare with')
+    options, arguments = parser.parse_args()
+
+    baseline = None
+
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+    interpreter = get_baseline_seconds()
+    print("bare interpreter: %.1f ms\n" % (interpreter * 1000))
+    print("%-30s %10s %10s  %s" % ('case', 'ms', 'change' if baseline else '', 'imported'))
+
+    results = {}
+
+    for name, case_arguments in CASES:
+        seconds, output = run_case(case_arguments, options.number)
+        results[name] = {'seconds': seconds}
+
+        change = ''
+        if baseline and name in baseline:
+            change = '%+.1f%%' % ((seconds / baseline[name]['seconds'] - 1) * 100)
+
+        # `--version` prints the version rather than the modules.
+        imported = '' if output.startswith('py-google-auth') else output
+        print("%-30s %10.1f %10s  %s" % (name, seconds * 1000, change, imported))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'version': __version__,
+                       'python': platform.python_version(),
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'number': options.number,
+                       'interpreter': interpreter,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
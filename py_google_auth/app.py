@@ -1,17 +1,44 @@
 import falcon
+import gc
 
 from wsgiref import simple_server
 
+from . import batch
 from . import login
+from . import metrics
+from . import profiler
+from . import stats
+from . import tracing
+from . import validate
 
 
 # create API
-api = app = falcon.API()
+api = app = falcon.API(middleware=[metrics.ResponseCounter(), tracing.TraceMiddleware(),
+                                   profiler.ProfileMiddleware()])
 
 # create endpoints for API.
 api.add_route('/login', login.NormalLogin())
+api.add_route('/login/batch', batch.BatchLogin())
 api.add_route('/step_two_login', login.StepTwoLogin())
 api.add_route('/change_method', login.ChangeMethod())
+api.add_route('/methods', login.Methods())
+api.add_route('/jobs/{job_id}', login.Job())
+api.add_route('/jobs/{job_id}/events', login.JobEvents())
+api.add_route('/keepalive/{session_id}', login.KeepAlive())
+api.add_route('/sessions/validate', validate.ValidateSessions())
+api.add_route('/stats/pool', stats.PoolStats())
+api.add_route('/metrics', stats.Metrics())
+api.add_route('/debug/profile', stats.Profile())
+
+# the library imports these on first use; the server needs them anyway, so they are loaded here
+# and with `--preload` the master loads them once for all the workers.
+import bs4  # noqa: E402, F401
+import jsonpickle  # noqa: E402, F401
+
+# everything loaded so far lives as long as the process. Freezing it keeps the garbage collector
+# of forked workers from touching it, which would copy the memory it is in into every worker.
+if hasattr(gc, 'freeze'):
+    gc.freeze()
 
 # This block is required if running the file using `python app.py` to run the server.
 # else if running using gunicorn; can ignore this block.
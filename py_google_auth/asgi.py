@@ -0,0 +1,223 @@
+'''
+ASGI entry point of the API, running the login flow on the asyncio engine in `async_utils`.
+
+It serves `/login`, `/step_two_login` and `/change_method` with the same request data and
+responses as the falcon app in `app`, but a single process can serve many logins at once while
+they wait on google. Building responses (encoding sessions, the session store) and parsing pages
+run on the default executor, off the event loop. Run it with any ASGI server, for example:
+
+    uvicorn py_google_auth.asgi:app --host localhost --port 8001
+
+Only the basic login flow is implemented here: the other endpoints of the falcon app (`/methods`,
+`/jobs`, `/login/batch`, `/sessions/validate`, `/keepalive`, `/metrics`, ...) are not served, and
+the session cache, two factor auth profiles, keep alive and the method discovery modes (methods
+are always collected on login, as in `sequential` mode) are not used. Sessions are not registered
+for keep alive even if `PY_GOOGLE_AUTH_KEEPALIVE` is set, as `/keepalive` is not served here.
+'''
+
+import functools
+import json
+
+import falcon
+
+from . import async_utils
+from . import login
+from . import login_utils
+from . import metrics
+from . import tracing
+from . import utils
+
+
+async def normal_login(data):
+    '''
+    Handles initial login request; see `login.NormalLogin`.
+    '''
+    login.check_credentials(data)
+
+    response, error, session = await async_utils.login(data['email'], data['password'])
+
+    try:
+        # if two factor auth detected
+        if error and error == 303:
+            response_default, error_default = await async_utils.run_blocking(
+                login_utils.get_default_method, utils.parse_page(response))
+
+            response_alternate, error_alternate, session = \
+                await async_utils.select_alternate_method(session, response.url)
+
+            return await async_utils.run_blocking(
+                login.prepare_two_factor_response, response, session.to_requests_session(),
+                response_default, error_default, response_alternate, error_alternate)
+
+        return await async_utils.run_blocking(
+            functools.partial(login.prepare_login_response, keep_alive=False), response, error,
+            session.to_requests_session())
+
+    finally:
+        await session.close()
+
+
+async def step_two_login(data):
+    '''
+    Handles two factor authentication; see `login.StepTwoLogin`.
+    '''
+    method = data['method']
+    session = await async_utils.run_blocking(login.load_session, data['session'])
+
+    if method != 1:
+        otp = data['otp']
+        query_params = None
+    else:
+        otp = None
+        query_params = session.query_params
+
+    tfa_url = session.next_url
+    payload = session.prev_payload
+
+    session = async_utils.AsyncSession.from_requests_session(utils.clean_session(session))
+
+    try:
+        response, error, session = await async_utils.second_step_login(session, method, tfa_url,
+                                                                       payload, query_params, otp)
+
+        return await async_utils.run_blocking(
+            functools.partial(login.prepare_step_two_response, keep_alive=False), response, error,
+            session.to_requests_session())
+
+    finally:
+        await session.close()
+
+
+async def change_method(data):
+    '''
+    Handles changing the two factor method; see `login.ChangeMethod`.
+    '''
+    method = data['method']
+    session = await async_utils.run_blocking(login.load_session, data['session'])
+
+    select_method_url = getattr(session, 'select_method_url', None)
+    next_url = getattr(session, 'next_url', None)
+
+    session = async_utils.AsyncSession.from_requests_session(utils.clean_session(session))
+
+    try:
+        # methods were not collected on login, get them now.
+        if select_method_url is None:
+            response, error, session = await async_utils.select_alternate_method(session,
+                                                                                 next_url)
+            if error:
+                return await async_utils.run_blocking(login.prepare_change_method_response,
+                                                      response, error,
+                                                      session.to_requests_session(), method)
+
+            select_method_url = response['select_method_url']
+
+        response, error, session = await async_utils.get_alternate_method(session, method,
+                                                                          select_method_url)
+
+        return await async_utils.run_blocking(login.prepare_change_method_response, response,
+                                              error, session.to_requests_session(), method)
+
+    finally:
+        await session.close()
+
+
+routes = {
+    '/login': normal_login,
+    '/step_two_login': step_two_login,
+    '/change_method': change_method,
+}
+
+# names the responses are counted under in metrics, as for the resources of the falcon app.
+resource_names = {
+    '/login': 'NormalLogin',
+    '/step_two_login': 'StepTwoLogin',
+    '/change_method': 'ChangeMethod',
+}
+
+
+async def read_body(receive):
+    body = b''
+
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status, data, headers=()):
+    '''
+    Sends a response; `status` is a falcon status string like '303 See Other'.
+    '''
+    body = b'' if data is None else json.dumps(data).encode('utf-8')
+
+    await send({'type': 'http.response.start',
+                'status': int(status.split(' ')[0]),
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('ascii'))] + list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def handle_request(handler, receive):
+    '''
+    Parses and validates the request and returns status and data of the response.
+    '''
+    body = await read_body(receive)
+
+    try:
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise falcon.HTTPBadRequest('Empty payload', 'No valid json was supplied with request')
+
+        login.check_token(data)
+
+        return await handler(data)
+
+    except falcon.HTTPError as e:
+        return e.status, e.to_dict()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+
+        elif message['type'] == 'lifespan.shutdown':
+            await async_utils.close_connector()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    '''
+    The ASGI application.
+    '''
+
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    handler = routes.get(scope['path'])
+
+    if handler is None:
+        return await send_json(send, falcon.HTTP_404, None)
+
+    if scope['method'] != 'POST':
+        return await send_json(send, falcon.HTTP_405, None)
+
+    trace = tracing.start()
+    status, data = await handle_request(handler, receive)
+
+    resource = resource_names[scope['path']]
+    metrics.increment(metrics.RESPONSES, resource=resource, status=status.split(' ')[0])
+
+    headers = []
+    if trace is not None:
+        timing = tracing.finish(trace, resource, int(status.split(' ')[0]))
+        headers.append((b'server-timing', timing.encode('ascii')))
+
+    await send_json(send, status, data, headers)
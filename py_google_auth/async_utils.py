@@ -0,0 +1,453 @@
+'''
+Asyncio implementation of the login flow.
+
+The functions here are coroutines with the same arguments and the same `(response, error, session)`
+results as their blocking counterparts in `login_utils`, `step_two_utils` and
+`change_method_utils`; they only differ in using aiohttp for requests to google, so that a single
+process can have many logins waiting on google at once. Parsing and the decisions made on the
+responses are shared with the blocking implementation.
+
+`session` here is an `AsyncSession`, which can be converted to and from a `requests.Session` for
+serialization. aiohttp is an optional dependency, install it with `pip install aiohttp`.
+
+Parsing pages takes milliseconds of CPU, during which the event loop could not serve anything else,
+so it is done on the default executor (see `run_blocking`).
+'''
+
+import asyncio
+import contextvars
+import functools
+import http.cookiejar
+import http.cookies
+import json
+import time
+import weakref
+
+import aiohttp
+import requests
+import yarl
+
+from requests.cookies import create_cookie
+
+from . import change_method_utils
+from . import login_utils
+from . import metrics
+from . import step_two_utils
+from . import upstream
+from . import utils
+
+# errors on which blocking implementation gets a `requests.exceptions.ConnectionError`.
+CONNECTION_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+# connectors are bound to an event loop, so one is shared by all the sessions of each loop.
+_connectors = weakref.WeakKeyDictionary()
+
+
+def get_connector():
+    '''
+    Returns the connector (connection pool) shared by the sessions on the running event loop.
+    '''
+    loop = asyncio.get_running_loop()
+    connector = _connectors.get(loop)
+
+    if connector is None or connector.closed:
+        connector = aiohttp.TCPConnector(limit=0)
+        _connectors[loop] = connector
+
+    return connector
+
+
+async def run_blocking(func, *args):
+    '''
+    Runs a blocking function (e.g. parsing a page, encoding a session) on the default executor of
+    the running event loop and returns its result. It runs in the context of the caller, so that it
+    is in the trace of the request (see `tracing`).
+    '''
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args)
+    return await loop.run_in_executor(None, call)
+
+
+async def close_connector():
+    '''
+    Closes the connector of the running event loop, used when the application shuts down.
+    '''
+    connector = _connectors.pop(asyncio.get_running_loop(), None)
+
+    if connector is not None:
+        await connector.close()
+
+
+class AsyncResponse(object):
+    '''
+    A completely read aiohttp response, with the attributes of `requests.Response` used by the
+    login flow.
+    '''
+
+    def __init__(self, url, status_code, content, text):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.text = text
+
+
+class AsyncSession(object):
+    '''
+    An aiohttp client session with its own cookie jar, used like a `requests.Session` for one
+    login. Variables for next step of login are stuffed in it as in a requests session.
+    '''
+
+    def __init__(self):
+        # cookies from ip addresses are accepted as well, for a local stand-in for google (see
+        # `stub`).
+        self.client = aiohttp.ClientSession(connector=get_connector(), connector_owner=False,
+                                            cookie_jar=aiohttp.CookieJar(unsafe=True))
+
+    @property
+    def cookies(self):
+        return self.client.cookie_jar
+
+    async def request(self, method, url, data=None, headers=None):
+        start = time.perf_counter()
+
+        try:
+            async with self.client.request(method, url, data=data, headers=headers) as resp:
+                content = await resp.read()
+                text = await resp.text(errors='replace')
+                return AsyncResponse(str(resp.url), resp.status, content, text)
+        finally:
+            metrics.observe_upstream(method, url, time.perf_counter() - start)
+
+    async def get(self, url, headers=None):
+        return await self.request('GET', url, headers=headers)
+
+    async def post(self, url, data=None, headers=None):
+        return await self.request('POST', url, data=data, headers=headers)
+
+    async def close(self):
+        await self.client.close()
+
+    def flow_variables(self):
+        return {name: value for name, value in self.__dict__.items() if name != 'client'}
+
+    def to_requests_session(self):
+        '''
+        Returns a `requests.Session` with the cookies and stuffed variables of this session.
+        '''
+        session = requests.session()
+
+        for morsel in self.client.cookie_jar:
+            expires = None
+            if morsel['expires']:
+                expires = http.cookiejar.http2time(morsel['expires'])
+
+            rest = {'HttpOnly': None} if morsel['httponly'] else {}
+            session.cookies.set_cookie(create_cookie(morsel.key, morsel.value,
+                                                     domain=morsel['domain'],
+                                                     path=morsel['path'] or '/',
+                                                     secure=bool(morsel['secure']),
+                                                     expires=expires, rest=rest))
+
+        session.__dict__.update(self.flow_variables())
+        return session
+
+    @classmethod
+    def from_requests_session(cls, session):
+        '''
+        Creates an async session with the cookies and stuffed variables of a `requests.Session`.
+        Must be called with an event loop running.
+        '''
+        async_session = cls()
+
+        for cookie in session.cookies:
+            morsel = http.cookies.Morsel()
+            morsel.set(cookie.name, cookie.value, cookie.value)
+            morsel['domain'] = cookie.domain
+            morsel['path'] = cookie.path
+            if cookie.secure:
+                morsel['secure'] = True
+
+            host = cookie.domain.lstrip('.')
+            async_session.client.cookie_jar.update_cookies({cookie.name: morsel},
+                                                           yarl.URL('https://' + host))
+
+        for name, value in session.__dict__.items():
+            if name not in requests.Session.__attrs__:
+                setattr(async_session, name, value)
+
+        return async_session
+
+
+async def normal_login(session, username, password, continue_url):
+    '''
+    Coroutine for login to a normal account without TFA; see `login_utils.normal_login`.
+    '''
+
+    # TODO: remove hard coded service name
+    # url to the login form page.
+    base_url_login = upstream.get_accounts_url() + "/ServiceLogin?"
+    url_login = base_url_login + "service=androiddeveloper"
+
+    # url to post login credentials and other data.
+    url_auth = upstream.get_accounts_url() + "/ServiceLoginAuth?service=androiddeveloper"
+
+    try:
+        form_html = await session.get(url_login)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    payload = await run_blocking(utils.make_payload, form_html)
+
+    # if the page did not have the form it won't have payload, that shows the response page has
+    # changed or the request was not appropriate.
+    if not payload:
+        file_name, hostname = utils.log_error("normal login", form_html.text)
+        error = 500
+        response = {'file_name': file_name, 'hostname': hostname}
+        return response, error, session
+
+    # add email, password and target url in payload
+    payload['Email'] = username
+    payload['Passwd'] = password
+    payload['continue'] = continue_url
+
+    try:
+        response = await session.post(url_auth, data=payload)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    response, error = await run_blocking(login_utils.check_login_response, response,
+                                         session.cookies)
+
+    return response, error, session
+
+
+async def login(username, password):
+    '''
+    Coroutine to log into user's google account; see `login_utils.login`.
+    The returned session has to be closed by the caller.
+    '''
+    session = AsyncSession()
+
+    return await normal_login(session, username, password, login_utils.CONTINUE_URL)
+
+
+async def select_alternate_method(session, current_form_page_url):
+    '''
+    Coroutine to find the list of enabled methods on a google account for TFA; see
+    `login_utils.select_alternate_method`.
+    '''
+
+    # url to make a POST request to get the available methods page
+    skip_url = upstream.get_accounts_url() + "/signin/challenge/skip"
+
+    try:
+        # current form will give necessary data to send as payload to skip_url
+        form_html = await session.get(current_form_page_url)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    payload = await run_blocking(utils.make_payload, form_html)
+
+    if not payload:
+        file_name, hostname = utils.log_error("select alternate", form_html.text)
+        error = 500
+        response = {'file_name': file_name, 'hostname': hostname}
+        return response, error, session
+
+    try:
+        # this will return the select challenge url and necessary parameters
+        select_method_page = await session.post(skip_url, data=payload)
+
+        # get the page where all enabled method are listed for selection
+        login_html = await session.get(select_method_page.url)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    login_page = utils.parse_page(login_html)
+
+    # everything read from the page below is parsed here, off the event loop.
+    await run_blocking(login_page.preload, 'has_challenge_picker', 'methods', 'form_payloads')
+
+    # check whether page contains list of methods
+    error = login_utils.check_response(login_page)
+
+    if error:
+        file_name, hostname = utils.log_error("select alternate", login_html.text)
+        response = {'file_name': file_name, 'hostname': hostname}
+        return response, error, session
+
+    # find all the available methods from the response page.
+    response, error = utils.get_available_methods(login_page)
+    available_methods = response['available_methods']
+
+    response = {'methods': available_methods, 'select_method_url': select_method_page.url,
+                'forms': login_page.form_payloads}
+
+    return response, error, session
+
+
+async def handle_otp_error(response, session):
+    '''
+    Coroutine to check for errors after submitting an otp; see `step_two_utils.handle_otp_error`.
+    '''
+
+    if not await run_blocking(step_two_utils.otp_error_needs_methods, response):
+        return await run_blocking(step_two_utils.handle_otp_error, response, session)
+
+    response, error, session = await select_alternate_method(session, response.url)
+
+    if not error:
+        methods = response['methods']
+        url = response['select_method_url']
+        response = {'methods': methods, 'url': url}
+        error = 503
+
+    return response, error, session
+
+
+async def two_step_login_with_prompt(session, payload, query_params, url_to_challenge_signin):
+    '''
+    Coroutine for two step authentication with Google prompt; see
+    `step_two_utils.two_step_login_with_prompt`.
+    '''
+
+    # url to make a POST call to check if a user responded on prompt.
+    await_url = upstream.get_content_url() + "/cryptauth/v1/authzen/awaittx?alt=json&key=%s"
+
+    # headers are necessary to specify the referer and content type else request fails.
+    headers = {"Referer": url_to_challenge_signin, "Content-Type": "application/json"}
+
+    if not query_params:
+        error = 500
+        return None, error, session
+
+    try:
+        # make call to wait for user response
+        reply_from_user = await session.post(await_url % query_params['key'], headers=headers,
+                                             data=json.dumps({"txId": query_params['txId']}))
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    payload, response, error = step_two_utils.prepare_prompt_verification(
+        reply_from_user.content.decode('utf-8'), payload)
+
+    if error:
+        return response, error, session
+
+    try:
+        # make final call to sign in
+        resp_page = await session.post(url_to_challenge_signin, data=payload)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    return resp_page, error, session
+
+
+async def two_step_login_with_code(session, payload, url_to_challenge_signin, code):
+    '''
+    Coroutine for two step authentication with a code, i.e. from Google Authenticator, a text
+    message or a backup code.
+    '''
+
+    error = None
+
+    # add otp to payload
+    payload['Pin'] = code
+
+    try:
+        resp_page = await session.post(url_to_challenge_signin, data=payload)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    return resp_page, error, session
+
+
+async def second_step_login(session, method, url, payload, query_params, otp):
+    '''
+    Coroutine calling appropriate functions based upon the two factor method; see
+    `step_two_utils.second_step_login`.
+    '''
+
+    # the url to make POST request to send otp to user
+    url_to_challenge_signin = url.split('?')[0]
+
+    # login with Google prompt
+    if method == 1:
+        response, error, session = await two_step_login_with_prompt(session, payload, query_params,
+                                                                    url_to_challenge_signin)
+
+        # if login was not successful, appropriate cookies will not get set
+        if not error and len(session.cookies) < 7:
+            response, error = step_two_utils.handle_prompt_error(response)
+
+        return response, error, session
+
+    if method not in (2, 3, 4):
+        error = 400
+        return None, error, session
+
+    # text message payload has an action to send otp, it needs to be removed so that otp is
+    # not sent again; see `step_two_utils.two_step_login_with_text_msg`.
+    if method == 3:
+        try:
+            payload.pop('SendMethod')
+        except KeyError:
+            file_name, hostname = utils.log_error("second step login", json.dumps(payload))
+            error = 500
+            response = {'file_name': file_name, 'hostname': hostname}
+            return response, error, session
+
+    response, error, session = await two_step_login_with_code(session, payload,
+                                                              url_to_challenge_signin, otp)
+
+    # if login was not successful, appropriate cookies will not get set
+    if not error and len(session.cookies) < 7:
+        response, error, session = await handle_otp_error(response, session)
+
+    return response, error, session
+
+
+async def get_alternate_method(session, method, select_challenge_url):
+    '''
+    Coroutine to select an alternate two factor method; see
+    `change_method_utils.get_alternate_method`.
+    '''
+
+    error = None
+
+    try:
+        form_html = await session.get(select_challenge_url)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    next_challenge_post_url, payload, response, error = await run_blocking(
+        change_method_utils.prepare_challenge_request, form_html, method)
+
+    if error:
+        return response, error, session
+
+    try:
+        challenge_resp = await session.post(next_challenge_post_url, data=payload)
+
+    except CONNECTION_ERRORS:
+        error = 504
+        return None, error, session
+
+    return challenge_resp, error, session
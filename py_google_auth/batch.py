@@ -0,0 +1,137 @@
+'''
+Login to many accounts with one request.
+
+`/login/batch` takes a list of credentials and logs into the accounts concurrently, on a thread
+pool of its own so that the logins of one batch don't hold up other requests. Result of each
+account is written to the response as a line of json as soon as its login finishes, so a slow
+account (or one that got a captcha) doesn't hold up the others:
+
+    {"index": 0, "email": "...", "status": 303, "body": {...}}
+
+`status` and `body` are what `/login` would have responded with for the account.
+
+Limits are configured with environment variables:
+    * `PY_GOOGLE_AUTH_BATCH_CONCURRENCY`: logins of a batch made at once (default 8); a request can
+      ask for less with `concurrency`.
+    * `PY_GOOGLE_AUTH_BATCH_SIZE`: accounts accepted in a batch (default 100).
+'''
+
+import concurrent.futures
+import json
+import os
+
+import falcon
+
+from . import login
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_SIZE = 100
+
+
+def get_concurrency(requested=None):
+    '''
+    Number of logins of a batch to make at once.
+    '''
+    concurrency = int(os.environ.get('PY_GOOGLE_AUTH_BATCH_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+    if requested is not None:
+        concurrency = min(concurrency, requested)
+
+    return max(concurrency, 1)
+
+
+def verify_accounts(req, resp, resource, params):
+    '''
+    Decorator method to verify that a valid list of accounts was sent with the request.
+    '''
+    data = req.stream
+
+    accounts = data.get('accounts')
+    size = int(os.environ.get('PY_GOOGLE_AUTH_BATCH_SIZE', DEFAULT_SIZE))
+
+    if not isinstance(accounts, list) or not accounts:
+        msg = 'Send a list of accounts, each with an email and a password.'
+        raise falcon.HTTPBadRequest('No accounts', msg)
+
+    if len(accounts) > size:
+        msg = 'At most %d accounts can be sent in a batch.' % size
+        raise falcon.HTTPBadRequest('Too many accounts', msg)
+
+    concurrency = data.get('concurrency')
+
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        msg = 'Concurrency should be a positive number.'
+        raise falcon.HTTPBadRequest('Invalid concurrency', msg)
+
+
+def login_account(account):
+    '''
+    Logs into an account of a batch and returns status and data of its result.
+    '''
+
+    try:
+        if not isinstance(account, dict):
+            raise falcon.HTTPBadRequest('Incomplete credentials',
+                                        'Each account should have an email and a password.')
+
+        login.check_credentials(account)
+        status, response_data = login.attempt_login(account['email'], account['password'])
+
+    # errors which `/login` would have responded with.
+    except falcon.HTTPError as e:
+        status, response_data = e.status, e.to_dict()
+
+    return int(status.split(' ')[0]), response_data
+
+
+def stream_results(accounts, concurrency):
+    '''
+    Generates a line of json for every account, in the order their logins finish.
+    '''
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    futures = {executor.submit(login_account, account): index
+               for index, account in enumerate(accounts)}
+
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            account = accounts[index]
+
+            try:
+                status, response_data = future.result()
+            except Exception:
+                status = 500
+                response_data = {'title': 'Internal error', 'description': 'Login failed.'}
+
+            result = {'index': index,
+                      'email': account.get('email') if isinstance(account, dict) else None,
+                      'status': status,
+                      'body': response_data}
+
+            yield (json.dumps(result) + '\n').encode('utf-8')
+
+    finally:
+        # if client went away, logins which have not started yet are not made.
+        for future in futures:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+
+@falcon.before(login.verify_data_exist)
+@falcon.before(login.validate_request)
+@falcon.before(verify_accounts)
+class BatchLogin(object):
+    '''
+    Handles login to many accounts at once.
+    '''
+    def on_post(self, req, resp):
+
+        # set in the decorator method for request validation.
+        data = req.stream
+
+        accounts = data['accounts']
+        concurrency = get_concurrency(data.get('concurrency'))
+
+        resp.content_type = 'application/x-ndjson'
+        resp.stream = stream_results(accounts, concurrency)
@@ -1,7 +1,7 @@
+import json
 import requests
 
-from bs4 import BeautifulSoup
-
+from . import upstream
 from . import utils
 
 
@@ -13,20 +13,12 @@ def get_payload_for_select_page(form_html, form_key):
     You can read payload field details in `utils.make_payload` function.
     '''
 
-    payload = {}
-
-    # find all the forms
-    forms = BeautifulSoup(form_html).find_all('form')
-
-    # collect all inputs from the appropriate form, these contains the parameters for payload.
-    inputs = forms[form_key].find_all('input')
 
-    # create a payload dictionary
-    for item in inputs:
-        if item.has_attr('value') and item.has_attr('name'):
-            payload[item['name']] = item['value']
+    # inputs of all the forms, collect the ones from the appropriate form, these contains the
+    # parameters for payload.
+    forms = utils.parse_page(form_html).form_payloads
 
-    return payload
+    return dict(forms[form_key])
 
 
 def get_method_for_selection(selected_method):
@@ -39,49 +31,54 @@ def get_method_for_selection(selected_method):
     return method
 
 
-def get_alternate_method(session, method, select_challenge_url):
+def prepare_challenge_request(form_html, method, available_methods=None, forms=None):
     '''
-    Function to get the url for alternatively selected method from the form in try another
-    method page.
+    Prepares the POST request for alternatively selected method from the try another method page.
+    Returns the url and payload for the request, or the response to send back and an error code.
+    `available_methods`, `forms`: the methods and the payloads of their forms if they were already
+    collected from the page (see `login_utils.select_alternate_method`), then `form_html` is not
+    needed.
     '''
 
-    error = None
-
     # url to form next challenge GET request url according to user choice
-    url_to_challenge_signin = "https://accounts.google.com/signin/challenge/"
+    url_to_challenge_signin = upstream.get_accounts_url() + "/signin/challenge/"
 
     # all two factor methods with protocols they use
     methods = utils.get_method_names()
 
-    # make a GET call to collect payload
-    try:
-        form_html = session.get(select_challenge_url)
+    if available_methods is None:
+        # parse the page once, it gives both the methods and the payload.
+        form_page = utils.parse_page(form_html)
 
-    except(requests.exceptions.ConnectionError):
-        error = 504
-        return None, error, session
+        # available methods on a user's account
+        response, error = utils.get_available_methods(form_page)
 
-    # available methods on a user's account
-    response, error = utils.get_available_methods(form_html.text)
+        if error:
+            return None, None, form_html, error
 
-    if not error:
-        try:
-            available_methods = response['available_methods']
-            # map protocol and selection according to selected method using the methods dictionary
-            selection = available_methods.index(method)
-            protocol = [methods[item][1] for item in methods if methods[item][0] in method][0]
-        except:
-            error = 400
-            return form_html, error, session
+        available_methods = response['available_methods']
+        page_text = form_page.text
 
     else:
-        return form_html, error, session
+        form_page = None
+        page_text = json.dumps(forms)
+
+    try:
+        # map protocol and selection according to selected method using the methods dictionary
+        selection = available_methods.index(method)
+        protocol = [methods[item][1] for item in methods if methods[item][0] in method][0]
+    except:
+        error = 400
+        return None, None, form_html, error
 
     # prepare payload from get_payload_for_select_page
     # the methods is seperated because method selection page contains multiple forms
     # one form for each method, and each form has some different payload params
     # depending upon the method, so a different logic required
-    payload = get_payload_for_select_page(form_html.text, selection)
+    if form_page is not None:
+        payload = get_payload_for_select_page(form_page, selection)
+    else:
+        payload = dict(forms[selection])
 
     # if the page was not what was expected (i.e. a page with a form having hidden input containing
     # challengeId to send to POST request) then need to return error and log the page for debugging
@@ -89,14 +86,46 @@ def get_alternate_method(session, method, select_challenge_url):
         challengeId = payload['challengeId']
 
     except:
-        file_name, hostname = utils.log_error("select alternate", form_html.text)
+        file_name, hostname = utils.log_error("select alternate", page_text)
         error = 500
         response = {'file_name': file_name, 'hostname': hostname}
-        return response, error, session
+        return None, None, response, error
 
     # join the base url, protocol and challengeId to form the POST url
     next_challenge_post_url = url_to_challenge_signin + protocol + "/" + challengeId
 
+    return next_challenge_post_url, payload, None, None
+
+
+def get_alternate_method(session, method, select_challenge_url, available_methods=None,
+                         forms=None):
+    '''
+    Function to get the url for alternatively selected method from the form in try another
+    method page.
+    `available_methods`, `forms`: methods and their forms collected earlier from the page, if
+    given the page is not fetched again.
+    '''
+
+    error = None
+    form_html = None
+
+    # make a GET call to collect payload
+    if available_methods is None or forms is None:
+        try:
+            form_html = session.get(select_challenge_url)
+
+        except(requests.exceptions.ConnectionError):
+            error = 504
+            return None, error, session
+
+        available_methods = forms = None
+
+    next_challenge_post_url, payload, response, error = prepare_challenge_request(
+        form_html, method, available_methods, forms)
+
+    if error:
+        return response, error, session
+
     try:
         # make a POST call that will send otp (for Authenticator and text msg), or prompt for
         # Google prompt and return appropriate form.
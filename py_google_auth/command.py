@@ -4,45 +4,58 @@ This will be used to run the API server.
 
 
 
-  py_google_auth [<address>]
+  py_google_auth [options] [<address>]
+  py_google_auth bench [options] [<url>]
   py_google_auth --version
   py_google_auth -h | --help
 
 Where:
   <address> is what to listen on, of the form <host> <port>, or just <port>
+
+`bench` drives a running instance with complete logins and reports latency percentiles, see
+`py_google_auth bench --help`.
+
+Logins spend most of their time waiting on Google, so with `--worker-class gevent` each worker
+handles up to `--worker-connections` requests at once instead of one.
+
+The server is gunicorn, run in this process; other gunicorn settings can be given in a python file
+with `--config`.
 '''
 
 import logging
 import optparse
-import subprocess
+import os
 import sys
 
 from .version import __version__
 
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = '8001'
+
 usage = '\n\n\n'.join(__doc__.split('\n\n\n')[1:])
 version = 'py-google-auth ' + __version__
 
 
 def get_address(arguments):
     '''
-    Function to resolve listen address for server.
+    Function to resolve listen address for server; None for both if it was not given.
     '''
     if not arguments:
-        host = 'localhost'
-        port = '8001'
+        host = None
+        port = None
 
     elif len(arguments) == 1:
-        host = 'localhost'
+        host = DEFAULT_HOST
         try:
-            port = str(int(sys.argv[1]))
+            port = str(int(arguments[0]))
         except ValueError:
             logging.error("\n\nInvalid Port.\n")
             sys.exit(1)
 
     elif len(arguments) == 2:
-        host = sys.argv[1]
+        host = arguments[0]
         try:
-            port = str(int(sys.argv[2]))
+            port = str(int(arguments[1]))
         except ValueError:
             logging.error("\n\nInvalid Port.\n")
             sys.exit(1)
@@ -50,14 +63,58 @@ def get_address(arguments):
     return host, port
 
 
-def serve(host, port):
+def get_workers(worker_class, workers=None):
+    '''
+    Function to resolve number of worker processes, sized from the cores if not given.
+    Sync workers block on every request to Google, so gunicorn's usual `2 * cores + 1` is used;
+    a gevent worker is never blocked, so one per core is enough.
+    '''
+    if workers:
+        return workers
+
+    cores = os.cpu_count() or 1
+
+    if worker_class == 'gevent':
+        return cores
+
+    return 2 * cores + 1
+
+
+def serve(host=None, port=None, worker_class=None, settings=None, config_file=None):
     '''
-    Function to run the server.
+    Function to run the server, in this process as a gunicorn master (see `server`).
+    `host`, `port`, `worker_class`: as given on the command line, None if not given; then they
+    are taken from the config file, else the defaults.
+    `settings`: gunicorn settings given on the command line, None for those not given.
+    `config_file`: python file of gunicorn settings, overridden by `settings`.
     '''
+    from . import server
+
+    settings = dict(settings or {})
+    config = server.read_config_file(config_file) if config_file else {}
 
-    command_to_run_server = "gunicorn -b {host}:{port} py_google_auth.app:app".format(
-        host=host, port=port)
-    subprocess.call(command_to_run_server, shell=True)
+    if host is not None:
+        settings['bind'] = ['{host}:{port}'.format(host=host, port=port)]
+
+    if worker_class is not None:
+        settings['worker_class'] = worker_class
+
+    worker_class = settings.get('worker_class') or config.get('worker_class') or 'sync'
+
+    # gevent workers load an entry point that patches the standard library before anything from
+    # the app (and with it requests) is imported.
+    if server.is_gevent(worker_class):
+        wsgi_app = 'py_google_auth.gevent_app:app'
+        worker_class = 'gevent'
+    else:
+        wsgi_app = 'py_google_auth.app:app'
+
+    # the number of workers depends on the worker class, unless the config file sets it.
+    defaults = {'bind': ['{host}:{port}'.format(host=DEFAULT_HOST, port=DEFAULT_PORT)],
+                'workers': get_workers(worker_class)}
+
+    server.run(wsgi_app, settings, config, defaults)
+    return 0
 
 
 def main(argv=None):
@@ -65,6 +122,14 @@ def main(argv=None):
     Function to handle command line interface.
     '''
 
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # the load generator is a subcommand of its own, imported only when it is used.
+    if argv and argv[0] == 'bench':
+        from . import loadgen
+        return loadgen.main(argv[1:])
+
     parser = optparse.OptionParser(description='API for login into Google account',
                                    prog='py_google_auth',
                                    version=version,
@@ -75,14 +140,93 @@ def main(argv=None):
                       help='prints verbosely',
                       default=False)
 
-    options, arguments = parser.parse_args()
+    parser.add_option('--worker-class', '-k',
+                      choices=['sync', 'gevent'],
+                      help='type of workers, sync or gevent (default: sync)',
+                      default=None)
+
+    parser.add_option('--workers', '-w',
+                      type='int',
+                      help='number of worker processes (default: 2 * cores + 1 for sync, '
+                           'cores for gevent)',
+                      default=None)
+
+    parser.add_option('--worker-connections',
+                      type='int',
+                      help='maximum number of simultaneous requests per gevent worker '
+                           '(default: 1000)',
+                      default=None)
+
+    parser.add_option('--threads',
+                      type='int',
+                      help='threads per sync worker, each serving a request (default: 1)',
+                      default=None)
+
+    parser.add_option('--timeout', '-t',
+                      type='int',
+                      help='seconds a worker can be silent before it is restarted; Google prompt '
+                           'waits take up to a minute (default: 120)',
+                      default=None)
+
+    parser.add_option('--graceful-timeout',
+                      type='int',
+                      help='seconds workers are given to finish their requests on restart '
+                           '(default: 30)',
+                      default=None)
+
+    parser.add_option('--keep-alive',
+                      type='int',
+                      help='seconds to keep an idle client connection open (default: 5)',
+                      default=None)
+
+    parser.add_option('--backlog',
+                      type='int',
+                      help='connections waiting to be accepted (default: 2048)',
+                      default=None)
+
+    parser.add_option('--max-requests',
+                      type='int',
+                      help='requests a worker serves before it is restarted, 0 for no limit '
+                           '(default: 0)',
+                      default=None)
+
+    parser.add_option('--max-requests-jitter',
+                      type='int',
+                      help='random number of requests up to this added to --max-requests, so '
+                           'workers do not restart together (default: 0)',
+                      default=None)
+
+    parser.add_option('--preload',
+                      action='store_true',
+                      help='load the app before forking workers, which start faster and share '
+                           'its memory',
+                      default=None)
+
+    parser.add_option('--config', '-c',
+                      help='python file of gunicorn settings, overridden by the options given '
+                           'here',
+                      default=None)
+
+    options, arguments = parser.parse_args(argv)
 
     host, port = get_address(arguments)
-    logging.log(1, "Listening on %s:%s" % (host, port))
+
+    if host is not None:
+        logging.log(1, "Listening on %s:%s" % (host, port))
 
     try:
-        serve(host, port)
-        return 0
+        settings = {'workers': options.workers,
+                    'worker_connections': options.worker_connections,
+                    'threads': options.threads,
+                    'timeout': options.timeout,
+                    'graceful_timeout': options.graceful_timeout,
+                    'keepalive': options.keep_alive,
+                    'backlog': options.backlog,
+                    'max_requests': options.max_requests,
+                    'max_requests_jitter': options.max_requests_jitter,
+                    'preload_app': options.preload}
+
+        return serve(host, port, options.worker_class, settings, options.config)
 
     except Exception as e:
         logging.error(e)
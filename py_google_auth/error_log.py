@@ -0,0 +1,206 @@
+'''
+Capture of the pages the API could not handle, in `PY_GOOGLE_AUTH_LOG_PATH`.
+
+When google changes a page, every login fails on it and used to write the whole page to disk on
+the request path. Pages are now handed to a background writer through a bounded queue, so a
+request never waits for the disk; if the queue is full the page is dropped (and counted in
+metrics). Pages are named after a hash of their content, so identical pages are stored once,
+gzipped, as `<step>-<hash>.html.gz`, with `<step>-<hash>.json` next to it counting how many times
+it was seen and when.
+
+Old pages are removed by age (`PY_GOOGLE_AUTH_LOG_MAX_AGE` seconds since last seen, default a
+week) and, oldest first, when all the pages take more than `PY_GOOGLE_AUTH_LOG_MAX_BYTES` (default
+100 MB). `PY_GOOGLE_AUTH_LOG_QUEUE` is the size of the queue (default 100).
+'''
+
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from . import metrics
+
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# rotation runs after this many pages were written, or this many seconds.
+ROTATE_EVERY = 50
+ROTATE_INTERVAL = 300
+
+_queue = None
+_queue_pid = None
+_lock = threading.Lock()
+
+
+def get_name(step, content):
+    digest = hashlib.sha1(content.encode('utf-8', 'replace')).hexdigest()[:16]
+    return '%s-%s' % (step.replace(' ', '_'), digest)
+
+
+def get_queue():
+    '''
+    Returns the queue of the writer of current process, starting the writer if needed.
+    '''
+    global _queue, _queue_pid
+
+    if _queue is None or _queue_pid != os.getpid():
+        with _lock:
+            if _queue is None or _queue_pid != os.getpid():
+                size = int(os.environ.get('PY_GOOGLE_AUTH_LOG_QUEUE', DEFAULT_QUEUE_SIZE))
+                _queue = queue.Queue(maxsize=size)
+                _queue_pid = os.getpid()
+
+                thread = threading.Thread(target=write_pages, args=(_queue,),
+                                          name='py_google_auth-error-log')
+                thread.daemon = True
+                thread.start()
+
+    return _queue
+
+
+def capture(directory, step, content):
+    '''
+    Queues a page to be written and returns the name of its file; never blocks.
+    '''
+    if not isinstance(content, str):
+        content = str(content)
+
+    name = get_name(step, content)
+    pages = get_queue()
+
+    # the content is always sent along: the writer skips pages which are on disk already, and
+    # writes again those which are not (dropped while the queue was full, or rotated away).
+    try:
+        pages.put_nowait((directory, step, name, content, time.time()))
+    except queue.Full:
+        metrics.increment(metrics.ERROR_PAGES_DROPPED)
+    else:
+        metrics.increment(metrics.ERROR_PAGES, step=step)
+
+    return name + '.html.gz'
+
+
+def write_page(directory, step, name, content, seen_at):
+    '''
+    Writes a page unless it exists, and counts it in its index file.
+    '''
+    path = os.path.join(directory, name + '.html.gz')
+
+    if not os.path.exists(path):
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            f.write(content)
+
+        os.replace(temp_path, path)
+
+    # the index is shared with other workers writing the same page, so it is locked.
+    with open(os.path.join(directory, name + '.json'), 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+
+        try:
+            index = json.loads(f.read())
+        except ValueError:
+            index = {'step': step, 'first_seen': seen_at, 'hits': 0}
+
+        index['hits'] += 1
+        index['last_seen'] = seen_at
+
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps(index))
+
+
+def rotate(directory):
+    '''
+    Removes pages not seen for longer than the max age, then the oldest ones while all of them
+    take more than the max size.
+    '''
+    max_age = int(os.environ.get('PY_GOOGLE_AUTH_LOG_MAX_AGE', DEFAULT_MAX_AGE))
+    max_bytes = int(os.environ.get('PY_GOOGLE_AUTH_LOG_MAX_BYTES', DEFAULT_MAX_BYTES))
+    now = time.time()
+    pages = []
+
+    for file_name in os.listdir(directory):
+        if not file_name.endswith('.html.gz'):
+            continue
+
+        name = file_name[:-len('.html.gz')]
+
+        try:
+            # the index is updated every time the page is seen.
+            last_seen = os.path.getmtime(os.path.join(directory, name + '.json'))
+        except OSError:
+            last_seen = 0
+
+        try:
+            size = os.path.getsize(os.path.join(directory, file_name))
+        except OSError:
+            continue
+
+        pages.append((last_seen, size, name))
+
+    pages.sort()
+    total = sum(size for last_seen, size, name in pages)
+
+    for last_seen, size, name in pages:
+        if now - last_seen <= max_age and total <= max_bytes:
+            break
+
+        for suffix in ('.html.gz', '.json'):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except OSError:
+                pass
+
+        total -= size
+
+
+def write_pages(pages):
+    '''
+    The writer: writes queued pages, rotating the directories it wrote to now and then.
+    '''
+    written = 0
+    rotated = time.monotonic()
+    directories = set()
+
+    while True:
+        directory, step, name, content, seen_at = pages.get()
+
+        try:
+            write_page(directory, step, name, content, seen_at)
+            directories.add(directory)
+            written += 1
+
+            if written >= ROTATE_EVERY or time.monotonic() - rotated > ROTATE_INTERVAL:
+                for directory in directories:
+                    rotate(directory)
+
+                written = 0
+                rotated = time.monotonic()
+
+        # the writer must outlive any problem with the disk.
+        except (OSError, ValueError):
+            pass
+
+        finally:
+            pages.task_done()
+
+
+def flush(timeout=5):
+    '''
+    Waits until the queued pages are written, e.g. before exiting; returns whether they were.
+    '''
+    pages = get_queue()
+    end = time.monotonic() + timeout
+
+    while pages.unfinished_tasks and time.monotonic() < end:
+        time.sleep(0.01)
+
+    return not pages.unfinished_tasks
@@ -0,0 +1,207 @@
+'''
+Extraction of form payloads from google's login pages.
+
+All the login flow needs from most pages is the `name: value` pairs of the inputs in one form.
+Building a complete tree with BeautifulSoup for that is wasteful, so the pages are streamed
+through a parser which only tracks forms and inputs, and stops as soon as the required form ends.
+
+Two streaming backends are available:
+    * `html.parser`: python's builtin parser, always available.
+    * `lxml`: lxml's parser driven through its target interface (no tree is built); faster, but
+      needs lxml installed.
+
+The backend is chosen with the `backend` argument of the functions here or the
+`PY_GOOGLE_AUTH_HTML_PARSER` environment variable; by default lxml is used when it is installed.
+If a streaming backend fails on some odd page, the functions fall back to BeautifulSoup.
+'''
+
+import os
+
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+BACKENDS = ('lxml', 'html.parser')
+
+
+class StopParsing(Exception):
+    '''
+    Raised from the collector to abort parsing once the required form has been read.
+    '''
+
+
+class FormCollector(object):
+    '''
+    Collects inputs of the forms in a page from parser events.
+    `form_index`: index of the form to collect, all the forms are collected if it is None.
+    '''
+
+    def __init__(self, form_index=None):
+        self.form_index = form_index
+        self.forms = []
+        self.in_form = False
+
+    def start(self, tag, attrs):
+        if tag == 'form':
+            self.in_form = True
+            self.forms.append({})
+
+        elif tag == 'input' and self.in_form:
+            name = attrs.get('name')
+            value = attrs.get('value')
+
+            if name is not None and value is not None:
+                self.forms[-1][name] = value
+
+    def end(self, tag):
+        if tag == 'form' and self.in_form:
+            self.in_form = False
+
+            if self.form_index is not None and len(self.forms) > self.form_index:
+                raise StopParsing()
+
+    def close(self):
+        return self.forms
+
+
+class StdlibFormParser(HTMLParser):
+    '''
+    Feeds events from python's `html.parser` to a `FormCollector`.
+    '''
+
+    def __init__(self, collector):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'form' or tag == 'input':
+            self.collector.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self.collector.end(tag)
+
+
+def scan_with_html_parser(page, collector):
+    parser = StdlibFormParser(collector)
+
+    try:
+        parser.feed(page)
+        parser.close()
+    except StopParsing:
+        pass
+
+
+def scan_with_lxml(page, collector):
+    parser = etree.HTMLParser(target=collector)
+
+    try:
+        parser.feed(page)
+        parser.close()
+    except StopParsing:
+        pass
+
+
+def get_backend(backend=None):
+    '''
+    Resolves the streaming backend to use.
+    '''
+
+    if backend is None:
+        backend = os.environ.get('PY_GOOGLE_AUTH_HTML_PARSER')
+
+    if backend is None:
+        backend = 'lxml' if etree is not None else 'html.parser'
+
+    if backend not in BACKENDS:
+        raise ValueError("Unknown html parser backend %r, use one of %s" % (backend, BACKENDS))
+
+    if backend == 'lxml' and etree is None:
+        raise ValueError("lxml backend requested but lxml is not installed")
+
+    return backend
+
+
+def get_soup_features(backend=None):
+    '''
+    Name of the BeautifulSoup tree builder that corresponds to the backend.
+    '''
+    return 'lxml' if get_backend(backend) == 'lxml' else 'html.parser'
+
+
+def scan_forms(page, form_index=None, backend=None):
+    '''
+    Streams the page through the selected backend and returns the list of forms (as payload
+    dictionaries) read, which ends at `form_index` if it is given.
+    '''
+    collector = FormCollector(form_index)
+
+    if get_backend(backend) == 'lxml':
+        scan_with_lxml(page, collector)
+    else:
+        scan_with_html_parser(page, collector)
+
+    return collector.forms
+
+
+def soup_forms(page, backend=None):
+    '''
+    BeautifulSoup based extraction, used as fallback when streaming fails on a page.
+    '''
+    from bs4 import BeautifulSoup
+
+    forms = []
+    soup = BeautifulSoup(page, get_soup_features(backend))
+
+    for form in soup.find_all('form'):
+        payload = {}
+
+        for item in form.find_all('input'):
+            if item.has_attr('value') and item.has_attr('name'):
+                payload[item['name']] = item['value']
+
+        forms.append(payload)
+
+    return forms
+
+
+def get_form_inputs(page, form_index=0, backend=None):
+    '''
+    Returns `name: value` pairs of the inputs of the form at `form_index` in the page, an empty
+    dictionary if the page has no such form.
+    '''
+
+    try:
+        forms = scan_forms(page, form_index, backend)
+    except Exception:
+        forms = []
+
+    # a form that was not found by the streaming parser could be a malformed page, try with a
+    # more lenient tree builder before giving up.
+    if len(forms) <= form_index:
+        forms = soup_forms(page, backend)
+
+    if len(forms) <= form_index:
+        return {}
+
+    return forms[form_index]
+
+
+def get_all_form_inputs(page, backend=None):
+    '''
+    Returns a list with `name: value` pairs of the inputs of every form in the page.
+    '''
+
+    try:
+        forms = scan_forms(page, None, backend)
+    except Exception:
+        forms = []
+
+    if not forms:
+        forms = soup_forms(page, backend)
+
+    return forms
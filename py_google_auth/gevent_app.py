@@ -0,0 +1,20 @@
+'''
+Entry point of the API for gevent workers.
+
+The standard library has to be patched by gevent before requests (and the ssl and socket modules
+it uses) are imported, else requests to Google block the whole worker. Gunicorn's gevent worker
+patches when it starts, but the app can also be loaded in other ways (e.g. by another gevent
+server), so it is done here as well before the app is imported; patching twice is harmless.
+
+Importing this module patches the process importing it, so it must only be imported by workers:
+the server refuses `--preload` with gevent workers, which would import it in gunicorn's master.
+'''
+
+from gevent import monkey
+
+monkey.patch_all()
+
+from .app import app  # noqa: E402
+
+
+__all__ = ['app']
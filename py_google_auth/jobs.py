@@ -0,0 +1,135 @@
+'''
+Background work of the API.
+
+Work which should not hold up a response (like collecting alternate two factor methods while the
+default method is already sent to the user) is run on a thread pool of the worker process. Each
+piece of work gets an id, with which its result can be collected by a later request served by the
+same worker. Results are kept for `PY_GOOGLE_AUTH_JOB_TTL` seconds (default 600); the size of the
+thread pool is set with `PY_GOOGLE_AUTH_BACKGROUND_THREADS` (default 32).
+
+Work that is mostly waiting (like waiting for user to respond on Google prompt) can be run as a
+coroutine instead, on an event loop in a single background thread, so that any number of them
+share one thread.
+'''
+
+import asyncio
+import concurrent.futures
+import os
+import secrets
+import threading
+import time
+
+DEFAULT_THREADS = 32
+DEFAULT_TTL = 600
+
+_executor = None
+_executor_pid = None
+_loop = None
+_loop_pid = None
+_jobs = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    '''
+    Returns the thread pool of current process; threads don't survive a fork, so a forked worker
+    gets its own.
+    '''
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        with _lock:
+            if _executor is None or _executor_pid != os.getpid():
+                threads = int(os.environ.get('PY_GOOGLE_AUTH_BACKGROUND_THREADS', DEFAULT_THREADS))
+                _executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+                _executor_pid = os.getpid()
+                _jobs.clear()
+
+    return _executor
+
+
+def get_loop():
+    '''
+    Returns the event loop running in background thread of current process.
+    '''
+    global _loop, _loop_pid
+
+    if _loop is None or _loop_pid != os.getpid():
+        with _lock:
+            if _loop is None or _loop_pid != os.getpid():
+                _loop = asyncio.new_event_loop()
+                _loop_pid = os.getpid()
+
+                thread = threading.Thread(target=_loop.run_forever, name='py_google_auth-loop')
+                thread.daemon = True
+                thread.start()
+
+    return _loop
+
+
+def expire_jobs():
+    '''
+    Forgets the jobs that were submitted more than ttl seconds ago.
+    '''
+    ttl = int(os.environ.get('PY_GOOGLE_AUTH_JOB_TTL', DEFAULT_TTL))
+    now = time.time()
+
+    with _lock:
+        for job_id, (future, submitted) in list(_jobs.items()):
+            if now - submitted > ttl:
+                del _jobs[job_id]
+
+
+def submit(func, *args, **kwargs):
+    '''
+    Runs the function in background and returns an id for the job.
+    '''
+    return register(get_executor().submit(func, *args, **kwargs))
+
+
+def submit_coroutine(coroutine):
+    '''
+    Runs the coroutine on the background event loop and returns an id for the job.
+    '''
+    return register(asyncio.run_coroutine_threadsafe(coroutine, get_loop()))
+
+
+def register(future):
+    '''
+    Keeps a `concurrent.futures.Future` as a job and returns its id.
+    '''
+    job_id = secrets.token_urlsafe(12)
+
+    expire_jobs()
+
+    with _lock:
+        _jobs[job_id] = (future, time.time())
+
+    return job_id
+
+
+def get(job_id):
+    '''
+    Returns the future of a job, None if it is not known to this process (it expired, or was
+    submitted in another worker).
+    '''
+    with _lock:
+        job = _jobs.get(job_id)
+
+    if job is None:
+        return None
+
+    return job[0]
+
+
+def pop(job_id):
+    '''
+    Like `get`, but forgets the job; used when its result is collected only once.
+    '''
+    with _lock:
+        job = _jobs.pop(job_id, None)
+
+    if job is None:
+        return None
+
+    return job[0]
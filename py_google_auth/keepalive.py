@@ -0,0 +1,384 @@
+'''
+Keeping the sessions of complete logins signed in, so that users don't have to go through two
+factor auth again when a session would have expired from disuse.
+
+When enabled, the session of every successful login is registered: the response has a
+`keepalive` id along with the session, and the session is refreshed with a cheap signed in
+request (see `login_utils.check_session`) every `PY_GOOGLE_AUTH_KEEPALIVE_INTERVAL` seconds
+(default 1800, with 20% jitter so sessions registered together are not refreshed together). The
+session with its latest cookies is fetched with `GET /keepalive/<id>`, and unregistered with
+`DELETE /keepalive/<id>`; sessions are kept for `PY_GOOGLE_AUTH_KEEPALIVE_DURATION` seconds (default
+a week) at most.
+
+At most `PY_GOOGLE_AUTH_KEEPALIVE_CONCURRENCY` (default 8) sessions are refreshed at once and at
+most `PY_GOOGLE_AUTH_KEEPALIVE_SIZE` (default 10000) are refreshed per worker; above that the
+oldest ones are stopped.
+
+It is configured with `PY_GOOGLE_AUTH_KEEPALIVE`, where sessions are kept, like the session store
+(see `session_store`): `memory` (single worker only), `sqlite[:/path/to/file.db]` or `shm[:/path]`,
+so that any worker can answer for them. Along with a session the backend has its state, when it is
+due next and which worker refreshes it; a live session which was not refreshed `TAKEOVER_DELAY`
+seconds after it was due (e.g. the worker was restarted) is taken over by the next worker which
+looks for them, every worker does every `SWEEP_INTERVAL` seconds. States are:
+    * `live`: refreshed and still signed in.
+    * `signed_out`: google signed the session out, user needs to login again.
+    * `stopped`: not refreshed anymore (it could not be, or its worker had too many sessions), the
+      latest session is still there.
+'''
+
+import collections
+import concurrent.futures
+import heapq
+import json
+import os
+import random
+import secrets
+import threading
+import time
+
+from . import login_utils
+from . import metrics
+from . import session_store
+from . import transport
+from . import utils
+
+DEFAULT_INTERVAL = 1800
+DEFAULT_DURATION = 7 * 24 * 3600
+DEFAULT_CONCURRENCY = 8
+DEFAULT_SIZE = 10000
+
+# fraction of the interval refreshes are moved by at random.
+JITTER = 0.2
+
+# sessions which could not be refreshed as google was not reached are tried again sooner.
+RETRY_FRACTION = 0.1
+
+# seconds after which a session not refreshed when it was due is taken over, and how often every
+# worker looks for such sessions.
+TAKEOVER_DELAY = 60
+SWEEP_INTERVAL = 60
+
+_scheduler = None
+_scheduler_pid = None
+_lock = threading.Lock()
+
+
+def encode(session):
+    '''
+    Encodes a session as it is sent to the client on a successful login.
+    '''
+    import jsonpickle
+
+    # the copy gets its own adapters, the refreshed session keeps using the shared ones.
+    return jsonpickle.encode(transport.detach(utils.copy_session(session)))
+
+
+class Scheduler(object):
+    '''
+    Refreshes the sessions current process is responsible for when they are due, on a thread pool.
+    '''
+
+    def __init__(self, backend, interval, duration, concurrency, size):
+        self.backend = backend
+        self.interval = interval
+        self.duration = duration
+        self.size = size
+
+        # names the scheduler as the one refreshing a session in the backend; pids are reused.
+        self.owner = '%d:%s' % (os.getpid(), secrets.token_hex(4))
+
+        # (due time, id) of every session of this scheduler; ids dropped meanwhile are skipped.
+        self.due = []
+        self.sessions = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.swept = time.time()
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+        self.slots = threading.Semaphore(concurrency)
+
+        thread = threading.Thread(target=self.run, name='py_google_auth-keepalive')
+        thread.daemon = True
+        thread.start()
+
+    def get_delay(self, fraction=1):
+        return self.interval * fraction * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def read(self, session_id):
+        value = self.backend.get(session_id)
+        return json.loads(value) if value is not None else None
+
+    def write(self, session_id, entry):
+        self.backend.set(session_id, json.dumps(entry))
+
+    def add(self, session_id, session, until, due):
+        '''
+        Schedules a session to be refreshed by this scheduler.
+        '''
+        stopped = []
+
+        with self.condition:
+            self.sessions[session_id] = (session, until)
+
+            while len(self.sessions) > self.size:
+                stopped.append(self.sessions.popitem(last=False)[0])
+
+            heapq.heappush(self.due, (due, session_id))
+            self.condition.notify()
+
+        for stopped_id in stopped:
+            self.stop(stopped_id)
+
+    def register(self, session, encoded):
+        '''
+        Starts keeping a session signed in; returns its id.
+        '''
+        session_id = secrets.token_urlsafe(18)
+        now = time.time()
+        due = now + self.get_delay()
+        until = now + self.duration
+
+        self.write(session_id, {'state': 'live', 'session': encoded, 'refreshed': now,
+                                'due': due, 'until': until, 'owner': self.owner})
+        self.add(session_id, session, until, due)
+
+        return session_id
+
+    def drop(self, session_id):
+        with self.condition:
+            self.sessions.pop(session_id, None)
+
+    def stop(self, session_id):
+        '''
+        Stops refreshing a session, and marks it so in the backend.
+        '''
+        self.drop(session_id)
+        entry = self.read(session_id)
+
+        if entry is not None and entry['state'] == 'live':
+            entry['state'] = 'stopped'
+            self.write(session_id, entry)
+
+        metrics.increment(metrics.KEEPALIVE_REFRESHES, result='stopped')
+
+    def reschedule(self, session_id, due):
+        with self.condition:
+            if session_id in self.sessions:
+                heapq.heappush(self.due, (due, session_id))
+                self.condition.notify()
+
+    def next_task(self):
+        '''
+        Waits until a session is due or it is time to sweep; returns the id of the session, None
+        for a sweep.
+        '''
+        with self.condition:
+            while True:
+                now = time.time()
+
+                if now >= self.swept + SWEEP_INTERVAL:
+                    self.swept = now
+                    return None
+
+                if self.due and self.due[0][0] <= now:
+                    due, session_id = heapq.heappop(self.due)
+
+                    if session_id in self.sessions:
+                        return session_id
+
+                    continue
+
+                wake = self.swept + SWEEP_INTERVAL
+
+                if self.due:
+                    wake = min(wake, self.due[0][0])
+
+                self.condition.wait(wake - now)
+
+    def run(self):
+        while True:
+            session_id = self.next_task()
+
+            if session_id is None:
+                try:
+                    self.sweep()
+
+                # the scheduler must outlive any problem with the backend.
+                except Exception:
+                    pass
+
+                continue
+
+            # waits while as many sessions as allowed are being refreshed.
+            self.slots.acquire()
+            self.executor.submit(self.refresh, session_id)
+
+    def refresh(self, session_id):
+        try:
+            with self.condition:
+                session, until = self.sessions.get(session_id, (None, 0))
+
+            # dropped meanwhile.
+            if session is None:
+                return
+
+            entry = self.read(session_id)
+            now = time.time()
+
+            # expired, or unregistered (possibly by another worker).
+            if entry is None or now > until:
+                self.drop(session_id)
+                self.backend.delete(session_id)
+                metrics.increment(metrics.KEEPALIVE_REFRESHES, result='expired')
+                return
+
+            # taken over by another worker, which thought this one was gone.
+            if entry['owner'] != self.owner:
+                self.drop(session_id)
+                return
+
+            valid = login_utils.check_session(session)
+            now = time.time()
+
+            if valid is None:
+                entry['due'] = now + self.get_delay(RETRY_FRACTION)
+                self.write(session_id, entry)
+                metrics.increment(metrics.KEEPALIVE_REFRESHES, result='unreachable')
+                self.reschedule(session_id, entry['due'])
+
+            elif valid:
+                entry.update(session=encode(session), refreshed=now, due=now + self.get_delay())
+                self.write(session_id, entry)
+                metrics.increment(metrics.KEEPALIVE_REFRESHES, result='refreshed')
+                self.reschedule(session_id, entry['due'])
+
+            else:
+                entry.update(state='signed_out', session=None, refreshed=now)
+                self.write(session_id, entry)
+                self.drop(session_id)
+                metrics.increment(metrics.KEEPALIVE_REFRESHES, result='signed_out')
+
+        # the scheduler must outlive any problem with a session.
+        except Exception:
+            try:
+                self.stop(session_id)
+            except Exception:
+                self.drop(session_id)
+
+        finally:
+            self.slots.release()
+
+    def sweep(self):
+        '''
+        Takes over the live sessions which were not refreshed in time, and removes the expired
+        ones from the backend.
+        '''
+        for session_id in self.backend.keys():
+            with self.condition:
+                if session_id in self.sessions:
+                    continue
+
+            entry = self.read(session_id)
+            now = time.time()
+
+            if entry is None:
+                continue
+
+            if now > entry['until']:
+                self.backend.delete(session_id)
+                continue
+
+            if entry['state'] != 'live' or now < entry['due'] + TAKEOVER_DELAY:
+                continue
+
+            entry['owner'] = self.owner
+            self.write(session_id, entry)
+
+            # another worker may be taking it over at the same time, the last one to write it
+            # refreshes it.
+            entry = self.read(session_id)
+
+            if entry is None or entry['owner'] != self.owner:
+                continue
+
+            try:
+                session = utils.decode_session(entry['session'])
+            except ValueError:
+                self.stop(session_id)
+                continue
+
+            metrics.increment(metrics.KEEPALIVE_REFRESHES, result='taken_over')
+            self.add(session_id, session, entry['until'], now)
+
+
+def get_backend():
+    '''
+    Returns the backend refreshed sessions are kept in, None if keep alive is not enabled.
+    '''
+    spec = os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE')
+
+    if not spec:
+        return None
+
+    return get_scheduler(spec).backend
+
+
+def get_scheduler(spec):
+    '''
+    Returns the scheduler of current process; threads don't survive a fork, so a forked worker
+    gets its own.
+    '''
+    global _scheduler, _scheduler_pid
+
+    if _scheduler is None or _scheduler_pid != os.getpid():
+        with _lock:
+            if _scheduler is None or _scheduler_pid != os.getpid():
+                interval = int(os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE_INTERVAL',
+                                              DEFAULT_INTERVAL))
+                duration = int(os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE_DURATION',
+                                              DEFAULT_DURATION))
+                concurrency = int(os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE_CONCURRENCY',
+                                                 DEFAULT_CONCURRENCY))
+                size = int(os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE_SIZE', DEFAULT_SIZE))
+
+                backend = session_store.create_backend(spec, duration, size, 'keepalive')
+                _scheduler = Scheduler(backend, interval, duration, concurrency, size)
+                _scheduler_pid = os.getpid()
+
+    return _scheduler
+
+
+def register(encoded):
+    '''
+    Registers the session of a successful login (encoded as in the response); returns its id, or
+    None if keep alive is not enabled.
+    '''
+    spec = os.environ.get('PY_GOOGLE_AUTH_KEEPALIVE')
+
+    if not spec:
+        return None
+
+    return get_scheduler(spec).register(utils.decode_session(encoded), encoded)
+
+
+def fetch(session_id):
+    '''
+    Returns the state of a registered session: `state` (see above), the latest `session` and when
+    it was `refreshed`; None if the id is not known.
+    '''
+    backend = get_backend()
+
+    if backend is None or not session_store.HANDLE_KEY_PATTERN.match(session_id):
+        return None
+
+    value = backend.get(session_id)
+    return json.loads(value) if value is not None else None
+
+
+def unregister(session_id):
+    '''
+    Stops keeping a session signed in; the worker refreshing it drops it when it is due next.
+    '''
+    backend = get_backend()
+
+    if backend is not None and session_store.HANDLE_KEY_PATTERN.match(session_id):
+        backend.delete(session_id)
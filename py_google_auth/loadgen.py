@@ -0,0 +1,242 @@
+'''
+Load generator for a running instance of the API, used by `py_google_auth bench`.
+
+Every simulated user goes through a complete login like a client of the API does: `/login` with
+an account whose default method is Google Authenticator, `/change_method` to text message and
+`/step_two_login` with the code. The instance should use the local stand-in for google (see
+`stub`), which can be run by the load generator itself with `--stub-port`; start the instance with
+`PY_GOOGLE_AUTH_ACCOUNTS_URL` and `PY_GOOGLE_AUTH_CONTENT_URL` pointing at it.
+
+Reports throughput, latency percentiles of every endpoint and the status codes they responded
+with.
+'''
+
+import collections
+import json
+import math
+import optparse
+import os
+import threading
+import time
+
+import requests
+
+ENDPOINTS = ('/login', '/change_method', '/step_two_login')
+
+
+class Recorder(object):
+    '''
+    Collects latency and status of every request, from all the simulated users.
+    '''
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.flows = collections.Counter()
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def finish_flow(self, result):
+        with self.lock:
+            self.flows[result] += 1
+
+
+class Schedule(object):
+    '''
+    Hands out the start times of flows, `rate` per second (as fast as possible if 0), until
+    `flows` were started or `duration` seconds passed.
+    '''
+
+    def __init__(self, rate, flows, duration):
+        self.rate = rate
+        self.flows = flows
+        self.duration = duration
+        self.started = 0
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def next(self):
+        '''
+        Waits until the next flow should start; returns False when no more flows are to start.
+        '''
+        with self.lock:
+            if self.flows and self.started >= self.flows:
+                return False
+
+            index = self.started
+            self.started += 1
+
+        at = self.start + index / self.rate if self.rate else time.monotonic()
+
+        if self.duration and at - self.start >= self.duration:
+            return False
+
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        return True
+
+
+def percentile(values, fraction):
+    '''
+    Nearest rank percentile of sorted values.
+    '''
+    if not values:
+        return 0
+
+    rank = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def run_flow(http, url, token, email, recorder):
+    '''
+    One complete login; returns the endpoint it stopped at, or 'complete'.
+    '''
+
+    def post(endpoint, data):
+        data['token'] = token
+        start = time.perf_counter()
+
+        try:
+            response = http.post(url + endpoint, data=json.dumps(data), timeout=120)
+        except requests.exceptions.RequestException:
+            recorder.record(endpoint, time.perf_counter() - start, 'error')
+            return None, None
+
+        recorder.record(endpoint, time.perf_counter() - start, response.status_code)
+
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    status, data = post('/login', {'email': email, 'password': 'secret'})
+
+    if status != 303 or not data or 'methods' not in data:
+        return '/login'
+
+    methods = [method for method in data['methods'] if 'text message' in method]
+
+    if not methods:
+        return '/login'
+
+    status, data = post('/change_method', {'session': data['session'], 'method': methods[0]})
+
+    if status != 200 or not data:
+        return '/change_method'
+
+    status, data = post('/step_two_login', {'session': data['session'], 'method': data['method'],
+                                            'otp': '123456'})
+
+    if status != 200:
+        return '/step_two_login'
+
+    return 'complete'
+
+
+def run(url, token, concurrency, rate=0, flows=0, duration=0, email='bench+totp@example.com'):
+    '''
+    Runs the simulated users and returns the recorder and the seconds it took.
+    '''
+    recorder = Recorder()
+    schedule = Schedule(rate, flows, duration)
+
+    def user():
+        # each user keeps its connection to the instance alive, as a client would.
+        http = requests.session()
+
+        while schedule.next():
+            recorder.finish_flow(run_flow(http, url, token, email, recorder))
+
+    threads = [threading.Thread(target=user) for _ in range(concurrency)]
+    start = time.monotonic()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return recorder, time.monotonic() - start
+
+
+def report(recorder, elapsed):
+    requests_made = sum(len(values) for values in recorder.latencies.values())
+    completed = recorder.flows['complete']
+
+    print("%d logins in %.1fs: %d complete (%.1f/s), %d requests (%.1f/s)"
+          % (sum(recorder.flows.values()), elapsed, completed, completed / elapsed,
+             requests_made, requests_made / elapsed))
+
+    failed = {stage: count for stage, count in recorder.flows.items() if stage != 'complete'}
+    if failed:
+        print("stopped at: " + ", ".join("%s %d" % item for item in sorted(failed.items())))
+
+    print("")
+    print("%-16s %8s %9s %9s %9s %9s  %s" % ('endpoint', 'requests', 'mean ms', 'p50 ms', 'p95 ms',
+                                              'p99 ms', 'status codes'))
+
+    for endpoint in ENDPOINTS:
+        values = sorted(recorder.latencies.get(endpoint, []))
+
+        if not values:
+            continue
+
+        statuses = sorted(recorder.statuses[endpoint].items(), key=lambda item: str(item[0]))
+        codes = ", ".join("%s: %d" % (code, count) for code, count in statuses)
+
+        print("%-16s %8d %9.1f %9.1f %9.1f %9.1f  %s"
+              % (endpoint, len(values), sum(values) / len(values) * 1000,
+                 percentile(values, 0.50) * 1000, percentile(values, 0.95) * 1000,
+                 percentile(values, 0.99) * 1000, codes))
+
+
+def main(argv=None):
+    '''
+    Command line interface of `py_google_auth bench`.
+    '''
+    parser = optparse.OptionParser(prog='py_google_auth bench',
+                                   usage='%prog [options] [<url>]\n\n'
+                                         '<url> of the running instance '
+                                         '(default: http://localhost:8001)')
+
+    parser.add_option('--concurrency', '-c', type='int', default=10,
+                      help='simulated users logging in at once (default: 10)')
+    parser.add_option('--rate', '-r', type='float', default=0,
+                      help='logins started per second, 0 for as fast as possible (default: 0)')
+    parser.add_option('--logins', '-n', type='int', default=0,
+                      help='number of logins to make (default: 100 unless --duration is given)')
+    parser.add_option('--duration', '-d', type='float', default=0,
+                      help='seconds to start logins for')
+    parser.add_option('--token', '-t', default=os.environ.get('PY_GOOGLE_AUTH_TOKEN'),
+                      help='access token of the instance (default: $PY_GOOGLE_AUTH_TOKEN)')
+    parser.add_option('--email', default='bench+totp@example.com',
+                      help='account to log into, its default method should be Google '
+                           'Authenticator')
+    parser.add_option('--stub-port', type='int', default=0,
+                      help='also run the stand-in for google on this port')
+    parser.add_option('--stub-latency', type='float', default=0,
+                      help='seconds the stand-in delays every request by')
+
+    options, arguments = parser.parse_args(argv)
+
+    url = (arguments[0] if arguments else 'http://localhost:8001').rstrip('/')
+    logins = options.logins or (0 if options.duration else 100)
+
+    if options.stub_port:
+        from . import stub
+
+        server, stub_url = stub.start('127.0.0.1', options.stub_port,
+                                      stub.Options(latency=options.stub_latency))
+        print("Stand-in for google on %s" % stub_url)
+
+    recorder, elapsed = run(url, options.token, options.concurrency, options.rate, logins,
+                            options.duration, options.email)
+    report(recorder, elapsed)
+
+    return 0
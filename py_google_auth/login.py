@@ -1,9 +1,17 @@
+import contextvars
 import falcon
 import json
-import jsonpickle
 import os
 
+from . import jobs
+from . import keepalive
+from . import outcomes
+from . import prompt_wait
 from . import utils
+from . import session_cache
+from . import session_store
+from . import tfa_profile
+from . import transport
 from . import login_utils
 from . import step_two_utils
 from . import change_method_utils
@@ -27,8 +35,13 @@ def verify_credentials(req, resp, resource, params):
     Decorator method to verify whether email and password are present in data and also the email
     is valid or not.
     '''
+    check_credentials(req.stream)
 
-    data = req.stream
+
+def check_credentials(data):
+    '''
+    Verifies credentials in the request data, see `verify_credentials`.
+    '''
 
     # extract required parameters from the data.
     try:
@@ -50,6 +63,19 @@ def validate_request(req, resp, resource, params):
     # read request body and parse it into a json object.
     data = req.stream
 
+    check_token(data)
+
+    # since stream is a file, it has been read once so won't be able to read it again in the end
+    # point functions that are called afterwards, so setting it to the data that was already parsed
+    # so that it is available in the functions that follows.
+    req.stream = data
+
+
+def check_token(data):
+    '''
+    Validates the token in request data, see `validate_request`.
+    '''
+
     # token to grant access to API
     # this is set in the environment of the system where API is deployed.
     valid_token = os.environ.get('PY_GOOGLE_AUTH_TOKEN')
@@ -65,135 +91,437 @@ def validate_request(req, resp, resource, params):
             msg = 'Please supply a valid token.'
             raise falcon.HTTPBadRequest('Invalid Token', msg)
 
-    # since stream is a file, it has been read once so won't be able to read it again in the end
-    # point functions that are called afterwards, so setting it to the data that was already parsed
-    # so that it is available in the functions that follows.
-    req.stream = data
 
+def validate_query_token(req, resp, resource, params):
+    '''
+    Decorator method to validate token sent as a query parameter, for requests without a body.
+    '''
+    token = req.get_param('token')
+    check_token({} if token is None else {'token': token})
 
-@falcon.before(verify_data_exist)
-@falcon.before(validate_request)
-@falcon.before(verify_credentials)
-class NormalLogin(object):
+
+def load_session(session):
     '''
-    Handles initial login request.
+    Deserializes the session sent with a request; if it was a handle to a session which is not
+    stored anymore, the request can't be processed and user needs to login again.
     '''
-    def on_post(self, req, resp):
 
-        # set in the decorator method for request validation.
-        data = req.stream
+    try:
+        return utils.deserialize_session(session)
+    except session_store.SessionExpired:
+        msg = 'The session has expired, please login again.'
+        raise falcon.HTTPBadRequest('Session expired', msg)
 
-        email = data['email']
-        password = data['password']
 
-        # call the function to make initial login attempt.
-        response, error, session = login_utils.login(email, password)
+def prepare_two_factor_response(response, session, response_default, error_default,
+                                 response_alternate, error_alternate):
+    '''
+    Prepares status and data of the response to a login where two factor auth was detected, from
+    the results of finding the default method and collecting alternate methods.
+    '''
 
-        # if two factor auth detected
-        if error and error == 303:
+    response_data = {}
 
-            # find the default tfa method
-            response_default, error_default = login_utils.get_default_method(response.text)
+    # if both default_method and available methods not fetched, that is some exception
+    # occured in making requests or format of the response page has changed then respond
+    # with a 500 to indicate that the request can't be fulfilled. Requires updates in API
+    # implementation.
+    if error_default and error_alternate:
+        return falcon.HTTP_500, response_default
 
-            # collect all enabled methods on a user's google account.
-            response_alternate, error_alternate, session = login_utils.select_alternate_method(
-                session, response.url)
+    # if available methods not fetched; return default_method only
+    elif error_alternate:
+        # from get_default_method response, we extract default method
+        default_method = response_default['method']
 
-            response_data = {}
+        # set variables in session and prepare response using a utility method
+        response_data, session = utils.handle_default_method(default_method,
+                                                             response, session)
 
-            # if both default_method and available methods not fetched, that is some exception
-            # occured in making requests or format of the response page has changed then respond
-            # with a 500 to indicate that the request can't be fulfilled. Requires updates in API
-            # implementation.
-            if error_default and error_alternate:
-                resp.status = falcon.HTTP_500
-                resp.body = json.dumps(response_default)
+        # encode session as json; details in the function itself.
+        session = utils.serialize_session(session)
+        response_data['session'] = session
 
-            # if available methods not fetched; return default_method only
-            elif error_alternate:
-                # from get_default_method response, we extract default method
-                default_method = response_default['method']
+        return falcon.HTTP_502, response_data
 
-                # set variables in session and prepare response using a utility method
-                response_data, session = utils.handle_default_method(default_method,
-                                                                     response, session)
+    # if default method not available; return all enabled methods
+    elif error_default:
+        select_method_url = response_alternate['select_method_url']
+        methods = response_alternate['methods']
 
-                # encode session as json; details in the function itself.
-                session = utils.serialize_session(session)
-                response_data['session'] = session
+        # save url to select methods, this is used to again get the form of method
+        # selection which will in turn give appropriate payload for selected method
+        session.select_method_url = select_method_url
+        session.methods = methods
 
-                resp.status = falcon.HTTP_502
-                resp.body = json.dumps(response_data)
+        # encode session as json; details in the function itself.
+        session = utils.serialize_session(session)
+
+        response_data['methods'] = methods
+        response_data['session'] = session
 
-            # if default method not available; return all enabled methods
-            elif error_default:
-                select_method_url = response_alternate['select_method_url']
-                methods = response_alternate['methods']
+        return falcon.HTTP_503, response_data
 
-                # save url to select methods, this is used to again get the form of method
-                # selection which will in turn give appropriate payload for selected method
-                session.select_method_url = select_method_url
+    # if both default method and available methods fetched (or available methods are being
+    # collected in background, in which case `response_alternate` is None)
 
-                # encode session as json; details in the function itself.
-                session = utils.serialize_session(session)
+    # from get_default_method response, we extract default method
+    default_method = response_default['method']
 
-                response_data['methods'] = methods
-                response_data['session'] = session
+    response_data, session = utils.handle_default_method(default_method,
+                                                         response, session)
 
-                resp.status = falcon.HTTP_503
-                resp.body = json.dumps(response_data)
+    if response_alternate is not None:
+        # save url to select methods, this is used to again get the form of method
+        # selection which will in turn give appropriate payload for selected method
+        session.select_method_url = response_alternate['select_method_url']
+        session.methods = response_alternate['methods']
+        response_data['methods'] = response_alternate['methods']
 
-            else:
-                # if both default method and available methods fetched
+    # encode session as json; details in the function itself.
+    session = utils.serialize_session(session)
 
-                # from get_default_method response, we extract default method
-                default_method = response_default['method']
+    response_data['session'] = session
 
-                select_method_url = response_alternate['select_method_url']
-                methods = response_alternate['methods']
+    return falcon.HTTP_303, response_data
 
-                response_data, session = utils.handle_default_method(default_method,
-                                                                     response, session)
 
-                # save url to select methods, this is used to again get the form of method
-                # selection which will in turn give appropriate payload for selected method
-                session.select_method_url = select_method_url
+def prepare_profile_response(response, session, profile, mode):
+    '''
+    Prepares status and data of the response to a login where two factor auth was detected, from
+    the cached profile of the account (see `tfa_profile`) instead of finding its methods again.
+    '''
 
-                # encode session as json; details in the function itself.
-                session = utils.serialize_session(session)
+    response_data, session = utils.handle_default_method(profile['default_method'], response,
+                                                         session, profile['number'])
 
-                response_data['methods'] = methods
-                response_data['session'] = session
+    # methods are collected again only when user wants to change the method, as in lazy
+    # discovery; or in background right away in deferred discovery.
+    if mode == 'deferred':
+        session.methods_job = login_utils.start_method_discovery(session, response.url)
+
+    if profile['methods'] is not None:
+        session.methods = profile['methods']
+        response_data['methods'] = profile['methods']
+
+    # encode session as json; details in the function itself.
+    response_data['session'] = utils.serialize_session(session)
+
+    return falcon.HTTP_303, response_data
 
-                resp.status = falcon.HTTP_303
-                resp.body = json.dumps(response_data)
 
-        elif error and error == 504:
-            resp.status = falcon.HTTP_504
+def prepare_login_response(response, error, session, cache_key=None, keep_alive=True):
+    '''
+    Prepares status and data (None if there is nothing to send) of the response to a login which
+    did not need two factor auth or failed.
+    `cache_key`: key the session of the login is cached with, see `session_cache`.
+    `keep_alive`: whether the session may be kept signed in, see `keepalive`.
+    '''
+
+    if error and error == 504:
+        return falcon.HTTP_504, None
+
+    elif error and error == 401:
+        return falcon.HTTP_401, None
+
+    # Too many login attempts can throw captcha, in this case we need to rout the request to
+    # another server (if deployed in big scale where multiple servers are available to handle
+    # this part else just try after some time).
+    elif error and error == 429:
+        return falcon.HTTP_429, None
+
+    # Any other error indicates that API needs update in its implementation.
+    elif error:
+        return falcon.HTTP_500, response
+
+    import jsonpickle
+
+    # encode session as json; this is different from the encoding process used when two factor
+    # auth was detected, here no extra variables are stuffed so it is directly encoded into json
+    # and sent back.
+    session = jsonpickle.encode(transport.detach(session))
+    session_cache.store(cache_key, session)
+
+    response_data = {'session': session}
+
+    # the session is kept signed in, if enabled; see `keepalive`.
+    keepalive_id = keepalive.register(session) if keep_alive else None
+    if keepalive_id is not None:
+        response_data['keepalive'] = keepalive_id
+
+    # if no two factor auth detected
+    return falcon.HTTP_200, response_data
+
+
+def prepare_step_two_response(response, error, session, keep_alive=True):
+    '''
+    Prepares status and data of the response to second step of login.
+    `keep_alive`: whether the session may be kept signed in, see `keepalive`.
+    '''
+
+    # since no further requests will be made in sequence after this request so no extra
+    # variables are stuffed hence normal json encoding works here for the session object.
+
+    response_data = {}
+    cache_key = None
+
+    if error:
+        if error == 504:
+            status = falcon.HTTP_504
+
+        elif error == 400:
+            msg = "Send a valid method code"
+            raise falcon.HTTPBadRequest('Invalid Method', msg)
+
+        elif error == 406:
+            status = falcon.HTTP_406
 
-        elif error and error == 401:
-            resp.status = falcon.HTTP_401
+        elif error == 412:
+            status = falcon.HTTP_412
 
-        # Too many login attempts can throw captcha, in this case we need to rout the request to
-        # another server (if deployed in big scale where multiple servers are available to handle
-        # this part else just try after some time).
-        elif error and error == 429:
-            resp.status = falcon.HTTP_429
+        elif error == 408:
+            status = falcon.HTTP_408
 
-        # Any other error indicates that API needs update in its implementation.
-        elif error:
-            resp.status = falcon.HTTP_500
-            resp.body = json.dumps(response)
+        elif error == 503:
+            url = response['url']
+            methods = response['methods']
+
+            # save the url from where list of methods was obtained, this will be used to
+            # collect payload in next request when a method will be selected
+            session.select_method_url = url
+            session.methods = methods
+            session = utils.serialize_session(session)
+
+            response_data['methods'] = methods
+            status = falcon.HTTP_503
+
+        elif error == 502:
+            methods = utils.get_method_names()
+            default_method = [m for m in methods if methods[m][1] in response.url][0]
+
+            # set variables in session and prepare response using a utility method
+            response_data, session = utils.handle_default_method(default_method,
+                                                                 response, session)
+            session = utils.serialize_session(session)
+            response_data['default_method'] = default_method
+            status = falcon.HTTP_502
+
+        elif error == 506:
+            # using this way because no falcon status codes suits the purpose.
+            status = "506"
+            session = utils.serialize_session(session)
 
         else:
-            # encode session as json; this is different from the encoding process used above when
-            # two factor auth was detected, here no extra variables are stuffed so it is directly
-            # encoded into json and sent back.
-            session = jsonpickle.encode(session)
+            status = falcon.HTTP_500
+            response_data = response
 
-            # if no two factor auth detected
-            resp.status = falcon.HTTP_200
-            resp.body = json.dumps({'session': session})
+    else:
+        status = falcon.HTTP_200
+
+        # the keys of the login were kept on server while it was in progress, see
+        # `attempt_login`.
+        cache_key = session_cache.release(session.__dict__.pop('cache_handle', None))
+        tfa_profile.release(session.__dict__.pop('profile_handle', None))
+
+    # 502 and 503 shows that too many attempts with wrong otp were made, so in this case we
+    # either fall back to default method or provide a list of methods to select from (when
+    # default is blocked)
+    if error != 503 and error != 502:
+        import jsonpickle
+
+        session = jsonpickle.encode(transport.detach(session))
+        session_cache.store(cache_key, session)
+
+        # a complete login is kept signed in, if enabled; see `keepalive`.
+        if status == falcon.HTTP_200 and keep_alive:
+            keepalive_id = keepalive.register(session)
+            if keepalive_id is not None:
+                response_data['keepalive'] = keepalive_id
+
+    response_data['session'] = session
+
+    return status, response_data
+
+
+def prepare_change_method_response(response, error, session, method):
+    '''
+    Prepares status and data of the response to changing the two factor method.
+    '''
+
+    # data to send back
+    response_data = {}
+
+    if error:
+        if error == 504:
+            status = falcon.HTTP_504
+
+        elif error == 400:
+            msg = "Send a valid method"
+            raise falcon.HTTPBadRequest("Invalid Method", msg)
+
+        else:
+            status = falcon.HTTP_500
+            response_data = response
+
+    else:
+        # if method is text message, extract the phone number from it.
+        if "text message" in method:
+            phone_num = change_method_utils.extract_phone_num(method)
+            response_data['number'] = phone_num
+
+        # get the method code, this is done so that the api user can get the method code to
+        # send back in the next call to step two end point.
+        method = change_method_utils.get_method_for_selection(method)
+
+        # payload for next request
+        payload = utils.make_payload(response)
+
+        # stuffing data for next request from the user; explained in detail in class `Login`.
+        session.next_url = response.url
+        session.prev_payload = payload
+
+        response_data['method'] = method
+
+        status = falcon.HTTP_200
+
+    # encode session as json; need to call the serialize function because again extra variables
+    # are being stuffed in the session.
+    session = utils.serialize_session(session)
+    response_data['session'] = session
+
+    return status, response_data
+
+
+def check_cached_session(session):
+    '''
+    Whether a cached session (encoded as in responses) is still signed in, see `session_cache`.
+    '''
+    try:
+        session = utils.decode_session(session)
+    except ValueError:
+        return False
+
+    return login_utils.check_session(session)
+
+
+def attempt_login(email, password):
+    '''
+    Makes the initial login attempt for an account and prepares status and data (None if there is
+    nothing to send) of the response.
+    '''
+
+    # the session of an earlier login of the account is given back if it is still signed in.
+    cache_key = session_cache.get_key(email, password)
+    cached_session = session_cache.lookup(cache_key, check_cached_session)
+
+    if cached_session is not None:
+        return falcon.HTTP_200, {'session': cached_session}
+
+    # call the function to make initial login attempt.
+    response, error, session = login_utils.login(email, password)
+
+    # if two factor auth detected
+    if error and error == 303:
+
+        # the page parsed here is kept on the response and reused while preparing the
+        # response below.
+        page = utils.parse_page(response)
+        mode = login_utils.get_discovery_mode()
+
+        # what is known of two factor auth of the account from its earlier logins.
+        profile_key = tfa_profile.get_key(email)
+        profile = tfa_profile.lookup(profile_key, response.url)
+
+        # the keys are needed again once user went on with two factor auth, they are kept on
+        # server and only handles to them go in the session sent to the client.
+        cache_handle = session_cache.hold(cache_key)
+        if cache_handle is not None:
+            session.cache_handle = cache_handle
+
+        profile_handle = tfa_profile.hold(profile_key)
+        if profile_handle is not None:
+            session.profile_handle = profile_handle
+
+        # google can't use the default method right now, user has to pick another one of the
+        # methods, which are found as usual.
+        if profile is not None and page.classify(outcomes.UNAVAILABLE) != 'unavailable':
+            return prepare_profile_response(response, session, profile, mode)
+
+        if mode == 'sequential':
+            # find the default tfa method
+            response_default, error_default = login_utils.get_default_method(page)
+
+            # collect all enabled methods on a user's google account.
+            response_alternate, error_alternate, session = \
+                login_utils.select_alternate_method(session, response.url)
+
+        elif mode == 'concurrent':
+            # collecting methods takes three requests to google, make them while the page is
+            # parsed for everything needed to respond with default method. They are made in the
+            # context of this request, so that they are in its trace (see `tracing`).
+            future = jobs.get_executor().submit(contextvars.copy_context().run,
+                                                login_utils.select_alternate_method, session,
+                                                response.url)
+
+            response_default, error_default = login_utils.get_default_method(page)
+            page.preload('payload', 'query_params', 'phone_number')
+
+            response_alternate, error_alternate, session = future.result()
+
+        else:
+            response_default, error_default = login_utils.get_default_method(page)
+
+            # without a default method, user can only proceed with one of the other methods,
+            # so they have to be collected now.
+            if error_default:
+                response_alternate, error_alternate, session = \
+                    login_utils.select_alternate_method(session, response.url)
+
+            # else respond with default method right away; in deferred mode the methods are
+            # collected in background and the job is saved in session to be used when user
+            # wants another method, in lazy mode only when user asks for them.
+            else:
+                if mode == 'deferred':
+                    session.methods_job = login_utils.start_method_discovery(session,
+                                                                             response.url)
+                response_alternate, error_alternate = None, None
+
+        status, response_data = prepare_two_factor_response(
+            response, session, response_default, error_default, response_alternate,
+            error_alternate)
+
+        # kept for the next logins of the account.
+        if status == falcon.HTTP_303:
+            tfa_profile.save(profile_key, response_data['default_method'],
+                             response_data.get('methods'), response_data.get('number'))
+
+    else:
+        status, response_data = prepare_login_response(response, error, session, cache_key)
+
+    return status, response_data
+
+
+@falcon.before(verify_data_exist)
+@falcon.before(validate_request)
+@falcon.before(verify_credentials)
+class NormalLogin(object):
+    '''
+    Handles initial login request.
+    '''
+    def on_post(self, req, resp):
+
+        # set in the decorator method for request validation.
+        data = req.stream
+
+        email = data['email']
+        password = data['password']
+
+        status, response_data = attempt_login(email, password)
+
+        resp.status = status
+
+        if response_data is not None:
+            resp.body = json.dumps(response_data)
 
 
 @falcon.before(verify_data_exist)
@@ -212,7 +540,7 @@ class StepTwoLogin(object):
         session = data['session']
 
         # deserialize session into an object from the string.
-        session = utils.deserialize_session(session)
+        session = load_session(session)
 
         # if method is google prompt then no otp is avaiable in the request.
         if method != 1:
@@ -233,75 +561,90 @@ class StepTwoLogin(object):
         # object.
         session = utils.clean_session(session)
 
+        # waiting for user to respond on Google prompt may take long, it can be left to a job
+        # whose result is fetched from `/jobs/<id>`.
+        if method == 1 and prompt_wait.is_enabled():
+            job_id = prompt_wait.start(session, tfa_url, payload, query_params,
+                                       prepare_step_two_response)
+
+            resp.status = falcon.HTTP_202
+            resp.body = json.dumps({'job': job_id})
+            return
+
         # make the login attempt for second step of authentication
         response, error, session = step_two_utils.second_step_login(session, method, tfa_url,
                                                                     payload, query_params, otp)
 
-        # since no further requests will be made in sequence after this request so no extra
-        # variables are stuffed hence normal json encoding works here for the session object.
+        resp.status, response_data = prepare_step_two_response(response, error, session)
+        resp.body = json.dumps(response_data)
 
-        response_data = {}
 
-        if error:
-            if error == 504:
-                resp.status = falcon.HTTP_504
+@falcon.before(validate_query_token)
+class Job(object):
+    '''
+    Gives the result of a job waiting for Google prompt; 202 while user has not responded.
+    '''
+    def on_get(self, req, resp, job_id):
 
-            elif error == 400:
-                msg = "Send a valid method code"
-                raise falcon.HTTPBadRequest('Invalid Method', msg)
+        state = prompt_wait.get_state(job_id)
 
-            elif error == 406:
-                resp.status = falcon.HTTP_406
+        if state is None:
+            raise falcon.HTTPNotFound(title='Unknown job',
+                                      description='The job does not exist or has expired.')
 
-            elif error == 412:
-                resp.status = falcon.HTTP_412
+        if state['state'] == 'pending':
+            resp.status = falcon.HTTP_202
+            resp.body = json.dumps({'status': 'pending'})
+            return
 
-            elif error == 408:
-                resp.status = falcon.HTTP_408
+        resp.status = getattr(falcon, 'HTTP_%d' % state['status'])
+        resp.body = json.dumps(state['body'])
 
-            elif error == 503:
-                url = response['url']
-                methods = response['methods']
 
-                # save the url from where list of methods was obtained, this will be used to
-                # collect payload in next request when a method will be selected
-                session.select_method_url = url
-                session = utils.serialize_session(session)
+@falcon.before(validate_query_token)
+class JobEvents(object):
+    '''
+    Streams the result of a job waiting for Google prompt as server sent events.
+    '''
+    def on_get(self, req, resp, job_id):
 
-                response_data['methods'] = methods
-                resp.status = falcon.HTTP_503
+        if prompt_wait.get_state(job_id) is None:
+            raise falcon.HTTPNotFound(title='Unknown job',
+                                      description='The job does not exist or has expired.')
 
-            elif error == 502:
-                methods = utils.get_method_names()
-                default_method = [m for m in methods if methods[m][1] in response.url][0]
+        resp.content_type = 'text/event-stream'
+        resp.set_header('Cache-Control', 'no-cache')
+        resp.stream = prompt_wait.stream_events(job_id)
 
-                # set variables in session and prepare response using a utility method
-                response_data, session = utils.handle_default_method(default_method,
-                                                                     response, session)
-                session = utils.serialize_session(session)
-                response_data['default_method'] = default_method
-                resp.status = falcon.HTTP_502
 
-            elif error == 506:
-                # using this way because no falcon status codes suits the purpose.
-                resp.status = "506"
-                session = utils.serialize_session(session)
+@falcon.before(validate_query_token)
+class KeepAlive(object):
+    '''
+    Gives the latest session of a login kept signed in (see `keepalive`), or stops keeping it.
+    '''
+    def on_get(self, req, resp, session_id):
 
-            else:
-                resp.status = falcon.HTTP_500
-                response_data = response
+        state = keepalive.fetch(session_id)
 
-        else:
-            resp.status = falcon.HTTP_200
+        if state is None:
+            raise falcon.HTTPNotFound(title='Unknown session',
+                                      description='The session is not kept signed in.')
 
-        # 502 and 503 shows that too many attempts with wrong otp were made, so in this case we
-        # either fall back to default method or provide a list of methods to select from (when
-        # default is blocked)
-        if error != 503 and error != 502:
-            session = jsonpickle.encode(session)
+        # google signed the session out, user needs to login again.
+        if state['state'] == 'signed_out':
+            resp.status = falcon.HTTP_410
+            resp.body = json.dumps({'refreshed': state['refreshed']})
+            return
 
-        response_data['session'] = session
-        resp.body = json.dumps(response_data)
+        # a `stopped` session is not refreshed anymore, it is the latest one there was.
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({'state': state['state'], 'session': state['session'],
+                                'refreshed': state['refreshed']})
+
+    def on_delete(self, req, resp, session_id):
+
+        keepalive.unregister(session_id)
+        resp.status = falcon.HTTP_204
 
 
 @falcon.before(verify_data_exist)
@@ -320,59 +663,111 @@ class ChangeMethod(object):
         session = data['session']
 
         # deserialize session into an object from the string.
-        session = utils.deserialize_session(session)
+        session = load_session(session)
 
         # extract other variables that were stuffed in previous call to the API.
-        select_method_url = session.select_method_url
+        select_method_url = getattr(session, 'select_method_url', None)
+        methods_job = getattr(session, 'methods_job', None)
+        next_url = getattr(session, 'next_url', None)
+
+        # methods and their forms, if they were collected by `/methods`.
+        available_methods = getattr(session, 'methods', None)
+        method_forms = getattr(session, 'method_forms', None)
+
+        # key of the cached profile of the account, see `tfa_profile`.
+        profile_key = tfa_profile.resolve(getattr(session, 'profile_handle', None))
 
         # remove the variables from the session object so as to make it a normal requests.Session
         # object.
         session = utils.clean_session(session)
 
+        # methods were not collected on login (see `login_utils.get_discovery_mode`), get them now.
+        if select_method_url is None:
+            response, error, session = login_utils.finish_method_discovery(session, methods_job,
+                                                                           next_url)
+            if error:
+                resp.status, response_data = prepare_change_method_response(response, error,
+                                                                            session, method)
+                resp.body = json.dumps(response_data)
+                return
+
+            select_method_url = response['select_method_url']
+            available_methods = response['methods']
+            method_forms = response['forms']
+
+            tfa_profile.save_methods(profile_key, available_methods)
+
         # get response for url and payload for next request for the selected method; in this
         # function, a POST request is made to a url ( which is prepared according to the selected
         # method) and which in turn sends otp or prompt to user.
-        response, error, session = change_method_utils.get_alternate_method(session, method,
-                                                                            select_method_url)
-        # data to send back
-        response_data = {}
+        response, error, session = change_method_utils.get_alternate_method(
+            session, method, select_method_url, available_methods, method_forms)
 
-        if error:
-            if error == 504:
-                resp.status = falcon.HTTP_504
+        # the method may have been listed from a profile which is not right anymore.
+        if error == 400:
+            tfa_profile.invalidate(profile_key)
 
-            elif error == 400:
-                msg = "Send a valid method"
-                raise falcon.HTTPBadRequest("Invalid Method", msg)
+        resp.status, response_data = prepare_change_method_response(response, error, session,
+                                                                    method)
+        resp.body = json.dumps(response_data)
 
-            else:
-                resp.status = falcon.HTTP_500
-                response_data = response
 
-        else:
-            # if method is text message, extract the phone number from it.
-            if "text message" in method:
-                phone_num = change_method_utils.extract_phone_num(method)
-                response_data['number'] = phone_num
+@falcon.before(verify_data_exist)
+@falcon.before(validate_request)
+class Methods(object):
+    '''
+    Lists the two factor methods enabled on the account, for logins where they were not collected
+    on `/login` (see `login_utils.get_discovery_mode`).
+    '''
+    def on_post(self, req, resp):
+
+        # set in the decorator method for request validation.
+        data = req.stream
+
+        # deserialize session into an object from the string.
+        session = load_session(data['session'])
+
+        # methods are saved in session once collected, so that neither this nor `/change_method`
+        # needs to collect them again.
+        if getattr(session, 'methods', None) is None:
+            select_method_url = getattr(session, 'select_method_url', None)
+            next_url = getattr(session, 'next_url', None)
+
+            # the page listing the methods is known (e.g. the default method was unavailable or
+            # got blocked), read them from it.
+            if select_method_url is not None:
+                response, error, session = login_utils.get_listed_methods(session,
+                                                                          select_method_url)
+
+            # the variables for next step are kept, user can still go on with default method.
+            elif next_url is not None:
+                methods_job = getattr(session, 'methods_job', None)
+                response, error, session = login_utils.finish_method_discovery(
+                    session, methods_job, next_url)
 
-            # get the method code, this is done so that the api user can get the method code to
-            # send back in the next call to step two end point.
-            method = change_method_utils.get_method_for_selection(method)
+            else:
+                msg = 'Send the session of a login waiting for two factor auth.'
+                raise falcon.HTTPBadRequest('Invalid Session', msg)
 
-            # payload for next request
-            payload = utils.make_payload(response.text)
+            if error == 504:
+                resp.status = falcon.HTTP_504
+                return
 
-            # stuffing data for next request from the user; explained in detail in class `Login`.
-            session.next_url = response.url
-            session.prev_payload = payload
+            elif error:
+                resp.status = falcon.HTTP_500
+                resp.body = json.dumps(response)
+                return
 
-            response_data['method'] = method
+            session.methods = response['methods']
+            session.method_forms = response['forms']
+            session.select_method_url = response['select_method_url']
+            session.__dict__.pop('methods_job', None)
 
-            resp.status = falcon.HTTP_200
+            profile_key = tfa_profile.resolve(getattr(session, 'profile_handle', None))
+            tfa_profile.save_methods(profile_key, session.methods)
 
-        # encode session as json; need to call the serialize function because again extra variables
-        # are being stuffed in the session.
-        session = utils.serialize_session(session)
-        response_data['session'] = session
+        response_data = {'methods': session.methods,
+                         'session': utils.serialize_session(session)}
 
+        resp.status = falcon.HTTP_200
         resp.body = json.dumps(response_data)
@@ -1,10 +1,19 @@
+import os
 import re
 import requests
 
-from bs4 import BeautifulSoup
+from urllib.parse import urlencode
 
+from . import jobs
+from . import outcomes
+from . import transport
+from . import upstream
 from . import utils
 
+# TODO: Don;t hard code, see https://github.com/HashGrowth/py-google-auth/issues/2 for details.
+# url to finally redirect to.
+CONTINUE_URL = "https://play.google.com/apps/publish"
+
 
 def is_valid_email(email):
     '''
@@ -25,10 +34,7 @@ def check_response(page):
     '''
     Checks whether the response is correct to proceed or not.
     '''
-    soup = BeautifulSoup(page)
-    challenge_picker = soup.find('ol', id='challengePickerList')
-
-    if challenge_picker:
+    if utils.parse_page(page).has_challenge_picker:
         return None
     else:
         error = 500
@@ -46,7 +52,7 @@ def select_alternate_method(session, current_form_page_url):
     error = None
 
     # url to make a POST request to get the available methods page
-    skip_url = "https://accounts.google.com/signin/challenge/skip"
+    skip_url = upstream.get_accounts_url() + "/signin/challenge/skip"
 
     try:
         # current form will give necessary data to send as payload to skip_url
@@ -56,7 +62,7 @@ def select_alternate_method(session, current_form_page_url):
         error = 504
         return None, error, session
 
-    payload = utils.make_payload(form_html.text)
+    payload = utils.make_payload(form_html)
 
     # if the page did not have the form it won't have payload, that shows the response page has
     # changed or the request was not appropriate.
@@ -74,16 +80,27 @@ def select_alternate_method(session, current_form_page_url):
         error = 504
         return None, error, session
 
+    return get_listed_methods(session, select_method_page.url)
+
+
+def get_listed_methods(session, select_method_url):
+    '''
+    Collects the methods listed on the method selection page, with the payloads of their forms.
+    '''
+
     try:
         # get the page where all enabled method are listed for selection
-        login_html = session.get(select_method_page.url)
+        login_html = session.get(select_method_url)
 
     except(requests.exceptions.ConnectionError):
         error = 504
         return None, error, session
 
+    # parse the page once, it is used for both the check and collecting methods.
+    login_page = utils.parse_page(login_html)
+
     # check whether page contains list of methods
-    error = check_response(login_html.text)
+    error = check_response(login_page)
 
     if error:
         file_name, hostname = utils.log_error("select alternate", login_html.text)
@@ -91,10 +108,57 @@ def select_alternate_method(session, current_form_page_url):
         return response, error, session
 
     # find all the available methods from the response page.
-    response, error = utils.get_available_methods(login_html.text)
+    response, error = utils.get_available_methods(login_page)
     available_methods = response['available_methods']
 
-    response = {'methods': available_methods, 'select_method_url': select_method_page.url}
+    # payloads of the forms of all methods are returned as well, with them a method can be
+    # selected later without fetching the page again.
+    response = {'methods': available_methods, 'select_method_url': select_method_url,
+                'forms': login_page.form_payloads}
+
+    return response, error, session
+
+
+def get_discovery_mode():
+    '''
+    How alternate methods are collected when two factor auth is detected on login, set with
+    `PY_GOOGLE_AUTH_METHOD_DISCOVERY`:
+        * `sequential` (default): after finding the default method.
+        * `concurrent`: in background while the default method response is prepared.
+        * `deferred`: in background after the response with default method is sent; the methods
+          are collected when user wants to change the method.
+        * `lazy`: only when user asks for them (on `/methods` or `/change_method`).
+    '''
+    mode = os.environ.get('PY_GOOGLE_AUTH_METHOD_DISCOVERY', 'sequential')
+
+    if mode not in ('sequential', 'concurrent', 'deferred', 'lazy'):
+        raise ValueError("Unknown method discovery mode %r" % mode)
+
+    return mode
+
+
+def start_method_discovery(session, current_form_page_url):
+    '''
+    Starts `select_alternate_method` in background and returns the id of the job. It works on a
+    copy of the session so that the session itself can be sent to user meanwhile.
+    '''
+    return jobs.submit(select_alternate_method, utils.copy_session(session),
+                       current_form_page_url)
+
+
+def finish_method_discovery(session, job_id, current_form_page_url):
+    '''
+    Collects the result of a job started by `start_method_discovery`, waiting for it if needed,
+    and merges the cookies set meanwhile into the session. If the job is not available (it
+    expired or was started by another worker) the methods are collected now.
+    '''
+    future = jobs.pop(job_id) if job_id else None
+
+    if future is None:
+        return select_alternate_method(session, current_form_page_url)
+
+    response, error, job_session = future.result()
+    session.cookies.update(job_session.cookies)
 
     return response, error, session
 
@@ -102,40 +166,29 @@ def select_alternate_method(session, current_form_page_url):
 def get_default_method(resp_page):
     '''
     Find the default method for two factor authentication from response text.
-    `resp_page`: the page from which default method is extracted.
+    `resp_page`: the page from which default method is extracted; the text or a `page.Page`.
     '''
 
     error = None
-
-    # get all the two factor method names.
-    methods = utils.get_method_names()
+    page = utils.parse_page(resp_page)
 
     # if there was some problem with the default method, we need to ask user to use alternate
-    if "Please try again later" in resp_page or "Something went wrong" in resp_page:
+    if page.classify(outcomes.UNAVAILABLE) == 'unavailable':
         # this is code is although used when an unexpected response occur, but in this case we need
         # this for step_two_login when this method is called from there we don't want response 503
         # hence using this (since now only codes are used for errors).
         error = 500
 
-    # select method based on the text from response page.
-
-    if "prompt to sign in" in resp_page:
-        method = 1
-        response = {'method': method}
+    # select method based on the text from response page, for example if 'text message' is found
+    # in the response text then default method is 'text message otp' so its code is returned.
+    method = page.classify(outcomes.DEFAULT_METHOD)
 
+    if method is None:
+        file_name, hostname = utils.log_error("second step login", page.text)
+        error = 500
+        response = {'file_name': file_name, 'hostname': hostname}
     else:
-        try:
-            # elect method index according to its found text in the response page, for example if
-            # 'text message' is found in the response text then default method is 'text message
-            # otp' so its code will be returned.
-            method = [m for m in methods if methods[m][0] in resp_page][0]
-
-        except:
-            file_name, hostname = utils.log_error("second step login", resp_page)
-            error = 500
-            response = {'file_name': file_name, 'hostname': hostname}
-        else:
-            response = {'method': method}
+        response = {'method': method}
 
     return response, error
 
@@ -148,11 +201,11 @@ def normal_login(session, username, password, continue_url):
 
     # TODO: remove hard coded service name
     # url to the login form page.
-    base_url_login = "https://accounts.google.com/ServiceLogin?"
+    base_url_login = upstream.get_accounts_url() + "/ServiceLogin?"
     url_login = base_url_login + "service=androiddeveloper"
 
     # url to post login credentials and other data.
-    url_auth = "https://accounts.google.com/ServiceLoginAuth?service=androiddeveloper"
+    url_auth = upstream.get_accounts_url() + "/ServiceLoginAuth?service=androiddeveloper"
 
     error = None
 
@@ -165,7 +218,7 @@ def normal_login(session, username, password, continue_url):
 
     # payload to send with POST request, i.e. cookies, tokens etc. more details in
     # `utils.make_payload` function.
-    payload = utils.make_payload(form_html.text)
+    payload = utils.make_payload(form_html)
 
     # if the page did not have the form it won't have payload, that shows the response page has
     # changed or the request was not appropriate.
@@ -184,49 +237,76 @@ def normal_login(session, username, password, continue_url):
         response = session.post(url_auth, data=payload)
 
     except(requests.exceptions.ConnectionError):
-        response = None
         error = 504
+        return None, error, session
+
+    response, error = check_login_response(response, session.cookies)
+
+    return response, error, session
+
+
+def check_login_response(response, cookies):
+    '''
+    Finds the result of posting credentials from the response page and the cookies that are set.
+    Returns the response (or details of the logged page) and an error code, which is None if the
+    login was complete.
+    '''
 
-    set_cookies = session.cookies
+    error = None
 
-    if len(set_cookies) < 7:
+    if len(cookies) < 7:
+        outcome = utils.parse_page(response).classify(outcomes.LOGIN)
 
-        if ("Google doesn't recognize that email" in response.text or
-           "Wrong password" in response.text):
+        if outcome == 'wrong_credentials':
             error = 401
-            return response, error, session
+            return response, error
 
-        # TODO: use some more specific text to identify captcha.
         # if captcha occured
-        if "captcha" in response.text:
+        if outcome == 'captcha':
             error = 429
-            return response, error, session
+            return response, error
 
         # if TFA was enabled
         if "signin/challenge" in response.url:
             error = 303
-            return response, error, session
+            return response, error
 
         else:
             file_name, hostname = utils.log_error("normal login", response.text)
             error = 500
             response = {'file_name': file_name, 'hostname': hostname}
 
-    return response, error, session
+    return response, error
 
 
 def login(username, password):
     '''
     Function to log into user's google account.
     '''
-    # prepare requests session object. It will be used in all the consequent requests.
-    session = requests.session()
-
-    # TODO: Don;t hard code, see https://github.com/HashGrowth/py-google-auth/issues/2 for details.
-    # url to finally redirect to.
-    play_console_base_url = "https://play.google.com/apps/publish"
+    # prepare requests session object. It will be used in all the consequent requests; its
+    # connections to google are shared with other logins.
+    session = transport.new_session()
 
     # login normally
-    response, error, session = normal_login(session, username, password, play_console_base_url)
+    response, error, session = normal_login(session, username, password, CONTINUE_URL)
 
     return response, error, session
+
+
+def check_session(session, timeout=10):
+    '''
+    Checks whether a session is still signed in, with a single HEAD request: google sends a
+    signed in session from the login form straight on to the continue url, and shows the form to
+    any other.
+    Returns True or False, or None if google could not be reached.
+    '''
+    url = upstream.get_accounts_url() + "/ServiceLogin?" + urlencode(
+        {'service': 'androiddeveloper', 'continue': CONTINUE_URL})
+
+    try:
+        response = session.head(url, allow_redirects=False, timeout=timeout)
+
+    except(requests.exceptions.RequestException):
+        return None
+
+    return response.is_redirect and 'ServiceLogin' not in response.headers.get('Location', '')
@@ -0,0 +1,392 @@
+'''
+Metrics of the API in the Prometheus text format, served on `/metrics`.
+
+    * `py_google_auth_responses_total{resource, status}`: responses by endpoint and status code.
+    * `py_google_auth_upstream_seconds{step}`: requests to google by step of the login, e.g.
+      `service_login`, `service_login_auth`, `challenge_skip`, `awaittx`, `challenge_post`.
+    * `py_google_auth_parse_seconds{part}`: parsing pages, by what was read from them.
+    * `py_google_auth_session_seconds{operation}`: serializing and deserializing sessions.
+    * `py_google_auth_error_pages_total{step}`: unexpected pages captured, see `error_log`;
+      `py_google_auth_error_pages_dropped_total` those dropped as the writer was behind.
+    * `py_google_auth_session_cache_total{result}`: lookups in the cache of sessions (see
+      `session_cache`), `hit`, `miss`, `signed_out` or `unchecked` (google not reached).
+    * `py_google_auth_tfa_profiles_total{result}`: lookups of two factor auth profiles (see
+      `tfa_profile`), `hit`, `miss` or `stale`, and `invalidated` ones.
+    * `py_google_auth_keepalive_refreshes_total{result}`: refreshes of sessions kept signed in
+      (see `keepalive`), `refreshed`, `signed_out`, `unreachable`, `expired`, `stopped` or
+      `taken_over` from another worker.
+
+Every worker keeps its metrics in memory and dumps them (at most every second) to a file of its
+own in `PY_GOOGLE_AUTH_METRICS_DIR`; `/metrics` adds up the files of all workers, so whichever
+worker serves it reports the whole server. By default the directory is one per parent process in
+the temporary directory, which is shared by the workers of a gunicorn master.
+
+Only the workers running now are reported: the directory is cleared when the server starts (see
+`server`), the file of a worker is removed when it exits, and files of processes which are gone
+are skipped. Counters of an exited worker go away with it, which Prometheus sees as a reset.
+'''
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from . import tracing
+
+RESPONSES = 'py_google_auth_responses_total'
+UPSTREAM_SECONDS = 'py_google_auth_upstream_seconds'
+PARSE_SECONDS = 'py_google_auth_parse_seconds'
+SESSION_SECONDS = 'py_google_auth_session_seconds'
+ERROR_PAGES = 'py_google_auth_error_pages_total'
+ERROR_PAGES_DROPPED = 'py_google_auth_error_pages_dropped_total'
+SESSION_CACHE = 'py_google_auth_session_cache_total'
+TFA_PROFILES = 'py_google_auth_tfa_profiles_total'
+KEEPALIVE_REFRESHES = 'py_google_auth_keepalive_refreshes_total'
+
+# names of the spans a traced request records for histograms, see `tracing`.
+SPAN_NAMES = {UPSTREAM_SECONDS: 'upstream', PARSE_SECONDS: 'parse', SESSION_SECONDS: 'session'}
+
+HELP = {RESPONSES: 'Responses by endpoint and status code.',
+        UPSTREAM_SECONDS: 'Requests to google by step of the login.',
+        PARSE_SECONDS: 'Parsing of google pages.',
+        SESSION_SECONDS: 'Serialization of sessions.',
+        ERROR_PAGES: 'Unexpected google pages captured, by step of the login.',
+        ERROR_PAGES_DROPPED: 'Unexpected google pages not captured as the writer was behind.',
+        SESSION_CACHE: 'Lookups of cached sessions of complete logins, by result.',
+        TFA_PROFILES: 'Lookups and invalidations of cached two factor auth profiles.',
+        KEEPALIVE_REFRESHES: 'Refreshes of sessions kept signed in, by result.'}
+
+# upper bounds of histogram buckets, in seconds; waiting for Google prompt can take a minute.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+FLUSH_INTERVAL = 1
+
+_counters = {}
+_histograms = {}
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+def get_directory(parent=None):
+    '''
+    Directory the workers of a server dump their metrics to.
+    `parent`: pid of the process the workers are forked from, parent of current process by default.
+    '''
+    directory = os.environ.get('PY_GOOGLE_AUTH_METRICS_DIR')
+
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(),
+                                 'py_google_auth-metrics-%d' % (parent or os.getppid()))
+
+    return directory
+
+
+def get_pid(name):
+    '''
+    Pid of the worker which dumped a file, None if the name is not one of a dump.
+    '''
+    pid, _, extension = name.partition('.')
+
+    if not pid.isdigit() or extension not in ('json', 'json.tmp'):
+        return None
+
+    return int(pid)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def reset(parent=None):
+    '''
+    Removes the files of all workers, when a server starts; for `parent` see `get_directory`.
+    '''
+    directory = get_directory(parent)
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+
+    for name in names:
+        pid = get_pid(name)
+
+        if pid is not None:
+            remove(pid, parent)
+
+
+def remove(pid, parent=None):
+    '''
+    Removes the file of a worker which exited; for `parent` see `get_directory`.
+    '''
+    path = os.path.join(get_directory(parent), '%d.json' % pid)
+
+    for path in (path, path + '.tmp'):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def increment(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+    start_flusher()
+
+
+def observe(name, seconds, **labels):
+    key = (name, tuple(sorted(labels.items())))
+
+    with _lock:
+        histogram = _histograms.get(key)
+
+        if histogram is None:
+            # a count per bucket, then sum and count of all the observations.
+            histogram = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[index] += 1
+                break
+
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    if name in SPAN_NAMES:
+        tracing.add_span('.'.join([SPAN_NAMES[name]] + [str(value) for label, value in key[1]]),
+                         seconds)
+
+    start_flusher()
+
+
+class timed(object):
+    '''
+    Observes the time taken by a block (`with timed(...)`) or by every call of a function (as a
+    decorator) in a histogram.
+    '''
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+    def __call__(self, func):
+        name, labels = self.name, self.labels
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start, **labels)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+
+
+def get_upstream_step(method, url):
+    '''
+    Step of the login a request to google was made for, from its method and url.
+    '''
+    path = urlsplit(url).path
+
+    if path.endswith('/ServiceLogin'):
+        return 'service_login'
+
+    if path.endswith('/ServiceLoginAuth'):
+        return 'service_login_auth'
+
+    if path.endswith('/signin/challenge/skip'):
+        return 'challenge_skip'
+
+    if path.endswith('/awaittx'):
+        return 'awaittx'
+
+    if '/signin/challenge/' in path:
+        return 'challenge_post' if method == 'POST' else 'challenge_get'
+
+    if '/signin/selectchallenge' in path:
+        return 'select_challenge'
+
+    return 'other'
+
+
+def observe_upstream(method, url, seconds):
+    observe(UPSTREAM_SECONDS, seconds, step=get_upstream_step(method, url))
+
+
+def snapshot():
+    with _lock:
+        return {'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+                'histograms': [[name, labels, list(values)]
+                               for (name, labels), values in _histograms.items()]}
+
+
+def flush():
+    '''
+    Dumps the metrics of this worker to its file.
+    '''
+    directory = get_directory()
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, '%d.json' % os.getpid())
+        temp_path = path + '.tmp'
+
+        with open(temp_path, 'w') as f:
+            json.dump(snapshot(), f)
+
+        os.replace(temp_path, path)
+
+    # metrics must never fail a worker.
+    except OSError:
+        pass
+
+
+def start_flusher():
+    '''
+    Starts the thread dumping metrics of this process every `FLUSH_INTERVAL` seconds, once per
+    process.
+    '''
+    global _flusher_pid
+
+    if _flusher_pid == os.getpid():
+        return
+
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+
+        # a forked worker starts with the metrics of its parent, they are reported by the parent.
+        if _flusher_pid is not None:
+            _counters.clear()
+            _histograms.clear()
+
+        _flusher_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            flush()
+
+    thread = threading.Thread(target=run, name='py_google_auth-metrics')
+    thread.daemon = True
+    thread.start()
+
+
+def collect():
+    '''
+    Adds up the metrics dumped by all the workers.
+    '''
+    flush()
+
+    counters = {}
+    histograms = {}
+    directory = get_directory()
+
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+
+    for name in names:
+        pid = get_pid(name)
+
+        # a worker killed before it could be removed, or one of a server run earlier.
+        if pid is None or not name.endswith('.json') or not (pid == os.getpid() or is_alive(pid)):
+            continue
+
+        try:
+            with open(os.path.join(directory, name)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+
+        for metric, labels, value in data['counters']:
+            key = (metric, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+
+        for metric, labels, values in data['histograms']:
+            key = (metric, tuple(tuple(label) for label in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                                               .replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def render():
+    '''
+    All the metrics in the Prometheus text format.
+    '''
+    counters, histograms = collect()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append('# HELP %s %s' % (name, HELP.get(name, name)))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, 'counter')
+        lines.append('%s%s %s' % (name, format_labels(labels), value))
+
+    for (name, labels), values in sorted(histograms.items()):
+        describe(name, 'histogram')
+
+        cumulative = 0
+        for bound, count in zip(BUCKETS, values):
+            cumulative += count
+            lines.append('%s_bucket%s %d' % (name, format_labels(labels, le=repr(float(bound))),
+                                             cumulative))
+
+        lines.append('%s_bucket%s %d' % (name, format_labels(labels, le='+Inf'), values[-1]))
+        lines.append('%s_sum%s %r' % (name, format_labels(labels), values[-2]))
+        lines.append('%s_count%s %d' % (name, format_labels(labels), values[-1]))
+
+    return '\n'.join(lines) + '\n'
+
+
+class ResponseCounter(object):
+    '''
+    Falcon middleware counting responses by resource and status code.
+    '''
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        name = type(resource).__name__ if resource is not None else 'none'
+        increment(RESPONSES, resource=name, status=resp.status.split(' ')[0])
@@ -0,0 +1,66 @@
+'''
+Outcomes of google's pages, told apart by the phrases they contain.
+
+Every kind of page the login flow checks has a table of rules here, `(outcome, phrases)` in order
+of priority: a page has the outcome of the first rule with one of its phrases in the text, None
+if no rule matches. These tables are the one place to update when google changes its wording.
+
+Pages are classified through `page.Page.classify`, which keeps the outcome, so checking a page
+again (e.g. `step_two_utils.otp_error_needs_methods` and then `handle_otp_error`) doesn't search
+it again.
+
+The phrases are looked for with python's substring search, one after the other, stopping at the
+first one found. Searching a page once for all the phrases of a table, with a regex alternation
+or an Aho-Corasick automaton, was measured to be slower for this few phrases: python's substring
+search skips through a page several times faster than either steps through it (see
+`benchmarks/bench_outcomes.py`).
+'''
+
+from . import utils
+
+
+class Classifier(object):
+    '''
+    Classifies pages with a table of rules, see above.
+    `name`: identifies the classifier among those a page was classified with.
+    '''
+
+    def __init__(self, name, rules):
+        self.name = name
+        self.rules = tuple((outcome, tuple(phrases)) for outcome, phrases in rules)
+
+    def classify(self, text):
+        for outcome, phrases in self.rules:
+            for phrase in phrases:
+                if phrase in text:
+                    return outcome
+
+        return None
+
+
+# page after posting the credentials, when the login did not complete.
+LOGIN = Classifier('login', [
+    ('wrong_credentials', ["Google doesn't recognize that email", "Wrong password"]),
+    ('captcha', ["captcha"]),
+])
+
+# challenge page of the default method, when google could not use the method.
+UNAVAILABLE = Classifier('unavailable', [
+    ('unavailable', ["Please try again later", "Something went wrong"]),
+])
+
+# challenge page of the default method; outcome is the code of the method (see
+# `utils.get_method_names`), by the name of the method on the page.
+DEFAULT_METHOD = Classifier('default_method', [(1, ["prompt to sign in"])] + [
+    (method, [names[0]]) for method, names in sorted(utils.get_method_names().items())])
+
+# page after submitting an otp, when it was not accepted.
+OTP = Classifier('otp', [
+    ('blocked', ["Unavailable because of too many failed attempts"]),
+    ('resend', ["Resend code"]),
+])
+
+# page after user responded to Google prompt, when the login did not complete.
+PROMPT = Classifier('prompt', [
+    ('canceled', ["Sign-in canceled"]),
+])
@@ -0,0 +1,130 @@
+import functools
+import time
+
+from . import forms
+from . import metrics
+
+
+def memoized(func):
+    '''
+    Turns a method of `Page` into a read only attribute which is computed on first access and
+    then reused for every later access.
+    '''
+    name = func.__name__
+
+    @functools.wraps(func)
+    def getter(self):
+        if name not in self._memo:
+            start = time.perf_counter()
+            self._memo[name] = func(self)
+            metrics.observe(metrics.PARSE_SECONDS, time.perf_counter() - start, part=name)
+        return self._memo[name]
+
+    return property(getter)
+
+
+class Page(object):
+    '''
+    A response page from google, parsed at most once.
+    Every piece of information the login flow extracts from a page is computed lazily on first
+    access and memoized, so a page that is inspected by several functions (e.g. to find the
+    default method, the payload and the query params) is parsed into a tree only once.
+    Form payloads are read with the streaming extractor in `forms` and don't need the tree at all.
+    '''
+
+    def __init__(self, text, url=None):
+        self.text = text
+        self.url = url
+        self._memo = {}
+
+    def preload(self, *names):
+        '''
+        Computes the given attributes in advance, e.g. while waiting on some request.
+        '''
+        for name in names:
+            getattr(self, name)
+
+    def classify(self, classifier):
+        '''
+        Outcome of the page by a classifier of `outcomes`, found once per classifier.
+        '''
+        key = 'outcome:' + classifier.name
+
+        if key not in self._memo:
+            start = time.perf_counter()
+            self._memo[key] = classifier.classify(self.text)
+            metrics.observe(metrics.PARSE_SECONDS, time.perf_counter() - start, part='outcome')
+
+        return self._memo[key]
+
+    @memoized
+    def soup(self):
+        from bs4 import BeautifulSoup
+
+        return BeautifulSoup(self.text, forms.get_soup_features())
+
+    @memoized
+    def payload(self):
+        '''
+        Input values of the first form on the page; more details in `utils.make_payload`.
+        '''
+        return forms.get_form_inputs(self.text, 0)
+
+    @memoized
+    def form_payloads(self):
+        '''
+        Input values of every form on the page, in the order they appear. Method selection page
+        has one form per method.
+        '''
+        return forms.get_all_form_inputs(self.text)
+
+    @memoized
+    def error(self):
+        '''
+        Text of the error message span, None if the page does not show an error.
+        '''
+        error_span = self.soup.find('span', id='errorMsg')
+
+        if error_span:
+            return error_span.text
+
+        return None
+
+    @memoized
+    def methods(self):
+        '''
+        Names of the two factor methods listed on the method selection page.
+        '''
+        return [item.text for item in self.soup.find_all('span', class_="mSMaIe")]
+
+    @memoized
+    def has_challenge_picker(self):
+        '''
+        Whether the page contains the list of methods to select from.
+        '''
+        return self.soup.find('ol', id='challengePickerList') is not None
+
+    @memoized
+    def query_params(self):
+        '''
+        The key and txId needed for Google prompt, None if the page does not have them.
+        '''
+        div_with_key_id = self.soup.find('div', class_='LJtPoc')
+
+        if div_with_key_id is None:
+            return None
+
+        return {'key': div_with_key_id.get('data-api-key'),
+                'txId': div_with_key_id.get('data-tx-id')}
+
+    @memoized
+    def phone_number(self):
+        '''
+        The phone number to which otp was sent, None if the page does not show it.
+        '''
+        number_container = self.soup.find(class_="DZNRQe")
+
+        if number_container is None:
+            return None
+
+        return number_container.text
@@ -0,0 +1,234 @@
+'''
+Profiling a live worker, served on `/debug/profile`.
+
+Sampling (`/debug/profile?seconds=N`): for N seconds the stacks of all the threads of the worker
+are sampled every `interval` milliseconds, and returned as collapsed stacks, one line per stack
+with the number of times it was seen:
+
+    py_google_auth/app.py:__call__;py_google_auth/login.py:on_post;... 42
+
+which is the input of flamegraph.pl or speedscope. The sampler runs on a real thread even under
+gevent, where it sees the greenlet running at the moment. A sync worker serves one request at a
+time, so there it would only see background work: sampling is refused on those, use cProfile mode.
+The request waits for the samples, so N is kept `TIMEOUT_MARGIN` seconds below the timeout of the
+worker, past which gunicorn would kill it.
+
+The kind of worker and its timeout are set by the server (see `server.post_worker_init`); when the
+app is served otherwise, a worker is taken as sync unless gevent patched it, with gunicorn's default
+timeout.
+
+cProfile mode (`/debug/profile?mode=cprofile&resource=NormalLogin&requests=N`): the next N
+requests served by the resource in this worker are profiled with cProfile (one at a time);
+`/debug/profile?mode=cprofile` then returns their statistics, or 202 while they are still awaited.
+'''
+
+import _thread
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+MAX_SECONDS = 300
+TIMEOUT_MARGIN = 10
+
+# gunicorn's default.
+DEFAULT_TIMEOUT = 30
+
+_worker = {'sync': None, 'timeout': DEFAULT_TIMEOUT}
+_profile = None
+_profile_lock = threading.Lock()
+
+
+def get_thread_functions():
+    '''
+    Functions to start a real thread and to sleep in it; gevent replaces the usual ones with
+    greenlets, which would not run while the worker is busy.
+    '''
+    monkey = sys.modules.get('gevent.monkey')
+
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return (monkey.get_original('_thread', 'start_new_thread'),
+                monkey.get_original('time', 'sleep'))
+
+    return _thread.start_new_thread, time.sleep
+
+
+def set_worker(sync, timeout):
+    '''
+    Sets whether current worker serves one request at a time, and its timeout in seconds (0 for
+    none).
+    '''
+    _worker.update(sync=sync, timeout=timeout)
+
+
+def can_sample():
+    '''
+    Whether sampling can see the requests served by current worker.
+    '''
+    if _worker['sync'] is not None:
+        return not _worker['sync']
+
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def get_max_seconds():
+    '''
+    Longest sampling current worker can wait for without being killed.
+    '''
+    timeout = _worker['timeout']
+
+    if not timeout:
+        return MAX_SECONDS
+
+    return max(1, min(MAX_SECONDS, int(timeout) - TIMEOUT_MARGIN))
+
+
+def collapse(frame):
+    '''
+    Stack of a frame as a line of collapsed stack, outermost call first.
+    '''
+    names = []
+
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s:%s' % (shorten(code.co_filename), code.co_name))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+def shorten(filename):
+    '''
+    Path of a file relative to the directory it was imported from, e.g. `requests/sessions.py`.
+    '''
+    for path in sorted(sys.path, key=len, reverse=True):
+        if path and filename.startswith(path + os.sep):
+            return filename[len(path) + 1:]
+
+    return filename
+
+
+def sample(seconds, interval=0.005):
+    '''
+    Samples stacks of all threads for the given seconds and returns a `Counter` of collapsed
+    stacks. Blocks the caller (cooperatively under gevent) meanwhile.
+    '''
+    start_thread, real_sleep = get_thread_functions()
+    counts = collections.Counter()
+    state = {'done': False}
+    own_file = __file__.rstrip('c')
+
+    def run():
+        sampler = _thread.get_ident()
+        end = time.monotonic() + seconds
+
+        try:
+            while time.monotonic() < end:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == sampler:
+                        continue
+
+                    # the request waiting for the samples is not part of the profile.
+                    if frame.f_code.co_filename.rstrip('c') == own_file:
+                        continue
+
+                    counts[collapse(frame)] += 1
+
+                real_sleep(interval)
+        finally:
+            state['done'] = True
+
+    start_thread(run, ())
+
+    # the waiting uses the (possibly patched) `time.sleep`, so a gevent worker keeps serving.
+    while not state['done']:
+        time.sleep(0.05)
+
+    return counts
+
+
+def format_collapsed(counts):
+    return ''.join('%s %d\n' % (stack, count) for stack, count in counts.most_common())
+
+
+class ProfileRun(object):
+    '''
+    cProfile of the next requests served by a resource.
+    '''
+
+    def __init__(self, resource, requests):
+        self.resource = resource
+        self.remaining = requests
+        self.requests = requests
+        self.profile = cProfile.Profile()
+        self.active = False
+        self.lock = threading.Lock()
+
+    def begin(self):
+        '''
+        Starts profiling a request if more are wanted and none is being profiled.
+        '''
+        with self.lock:
+            if self.active or self.remaining <= 0:
+                return False
+
+            self.active = True
+            self.remaining -= 1
+
+        self.profile.enable()
+        return True
+
+    def end(self):
+        self.profile.disable()
+
+        with self.lock:
+            self.active = False
+
+    @property
+    def done(self):
+        return self.remaining <= 0 and not self.active
+
+    def format(self, sort='cumulative', limit=50):
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+def start_profile(resource, requests):
+    global _profile
+
+    with _profile_lock:
+        _profile = ProfileRun(resource, requests)
+
+    return _profile
+
+
+def get_profile():
+    return _profile
+
+
+class ProfileMiddleware(object):
+    '''
+    Falcon middleware profiling the requests wanted by a cProfile run of this worker.
+    '''
+
+    def process_resource(self, req, resp, resource, params=None):
+        run = _profile
+
+        if run is None or resource is None or type(resource).__name__ != run.resource:
+            return
+
+        if run.begin():
+            req.context['profile'] = run
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        run = req.context.get('profile')
+
+        if run is not None:
+            run.end()
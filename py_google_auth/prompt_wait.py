@@ -0,0 +1,186 @@
+'''
+Waiting for user's response on Google prompt in background.
+
+Second step of login with Google prompt waits until user responds on their phone or google times
+out, which can take tens of seconds. When `PY_GOOGLE_AUTH_PROMPT_WAIT` is `background`,
+`/step_two_login` with Google prompt responds right away with the id of a job, which does the
+waiting; its result is fetched from `/jobs/<id>` or streamed from `/jobs/<id>/events`.
+
+The waits are run as coroutines on one event loop (see `jobs.submit_coroutine`) when aiohttp is
+installed, so any number of them share a single thread; else, or under gevent, on the thread pool
+of `jobs`. `PY_GOOGLE_AUTH_PROMPT_ENGINE` (`asyncio` or `threads`) overrides the choice.
+
+Jobs live in the worker that started them. If a session store is configured (see `session_store`)
+their state is saved there too, so that any worker sharing the store can answer for them.
+'''
+
+import concurrent.futures
+import importlib.util
+import json
+import os
+import sys
+import time
+
+from . import jobs
+from . import session_store
+from . import step_two_utils
+
+
+def is_enabled():
+    return os.environ.get('PY_GOOGLE_AUTH_PROMPT_WAIT', 'blocking') == 'background'
+
+
+def use_event_loop():
+    '''
+    Whether waits are run on the event loop rather than threads.
+    '''
+    engine = os.environ.get('PY_GOOGLE_AUTH_PROMPT_ENGINE')
+
+    if engine is not None:
+        return engine == 'asyncio'
+
+    # gevent already runs every thread as a greenlet; a real thread with its own event loop would
+    # not cooperate with it.
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('socket'):
+        return False
+
+    # only looked up, aiohttp is imported when a wait first runs on the event loop.
+    return importlib.util.find_spec('aiohttp') is not None
+
+
+def to_result(status, data):
+    '''
+    Result of a job from status (a falcon status string) and data of the response.
+    '''
+    return {'state': 'done', 'status': int(status.split(' ')[0]), 'body': data}
+
+
+def wait(session, tfa_url, payload, query_params, prepare):
+    '''
+    Runs second step of login with Google prompt; `prepare` makes status and data of the response
+    from its result (see `login.prepare_step_two_response`).
+    '''
+    response, error, session = step_two_utils.second_step_login(session, 1, tfa_url, payload,
+                                                                query_params, None)
+    return to_result(*prepare(response, error, session))
+
+
+async def wait_async(session, tfa_url, payload, query_params, prepare):
+    '''
+    Coroutine doing what `wait` does, with the asyncio engine.
+    '''
+    from . import async_utils
+
+    async_session = async_utils.AsyncSession.from_requests_session(session)
+
+    try:
+        response, error, async_session = await async_utils.second_step_login(
+            async_session, 1, tfa_url, payload, query_params, None)
+
+        # preparing the response encodes the session and writes to the stores, off the event loop.
+        return to_result(*await async_utils.run_blocking(
+            prepare, response, error, async_session.to_requests_session()))
+
+    finally:
+        await async_session.close()
+
+
+def save_state(job_id, state):
+    store = session_store.get_store()
+
+    if store is not None:
+        store.backend.set('job-' + job_id, json.dumps(state))
+
+
+def save_final_state(job_id, loop=None):
+    '''
+    Saves the state of a job once it is done. A coroutine is done on the event loop (`loop`),
+    which the store must not block, so there it is saved on the default executor of the loop.
+    '''
+    state = get_state(job_id)
+
+    if loop is None:
+        save_state(job_id, state)
+    else:
+        loop.call_soon_threadsafe(loop.run_in_executor, None, save_state, job_id, state)
+
+
+def start(session, tfa_url, payload, query_params, prepare):
+    '''
+    Starts waiting for Google prompt in background and returns the id of the job.
+    '''
+    loop = None
+
+    if use_event_loop():
+        loop = jobs.get_loop()
+        job_id = jobs.submit_coroutine(wait_async(session, tfa_url, payload, query_params,
+                                                  prepare))
+    else:
+        job_id = jobs.submit(wait, session, tfa_url, payload, query_params, prepare)
+
+    save_state(job_id, {'state': 'pending'})
+
+    future = jobs.get(job_id)
+    future.add_done_callback(lambda future: save_final_state(job_id, loop))
+
+    return job_id
+
+
+def get_state(job_id):
+    '''
+    Returns state of a job: `{'state': 'pending'}` while waiting, or `{'state': 'done', 'status':
+    <http status>, 'body': <response data>}`; None if the job is not known.
+    '''
+    future = jobs.get(job_id)
+
+    if future is None:
+        store = session_store.get_store()
+
+        if store is None or not session_store.HANDLE_KEY_PATTERN.match(job_id):
+            return None
+
+        state = store.backend.get('job-' + job_id)
+        return None if state is None else json.loads(state)
+
+    if not future.done():
+        return {'state': 'pending'}
+
+    try:
+        return future.result()
+    except Exception:
+        return {'state': 'done', 'status': 500,
+                'body': {'title': 'Internal error', 'description': 'Waiting for prompt failed.'}}
+
+
+def wait_for_change(job_id, timeout):
+    '''
+    Blocks until the job is done or for `timeout` seconds, whichever is earlier.
+    '''
+    future = jobs.get(job_id)
+
+    if future is None:
+        time.sleep(timeout)
+    else:
+        concurrent.futures.wait([future], timeout)
+
+
+def stream_events(job_id, interval=5):
+    '''
+    Generates server sent events for a job: a comment every `interval` seconds while it is pending
+    (which also keeps the connection alive) and a `result` event with its result at the end.
+    '''
+
+    while True:
+        state = get_state(job_id)
+
+        if state is None:
+            yield b'event: error\ndata: {"description": "Unknown job"}\n\n'
+            return
+
+        if state['state'] == 'done':
+            yield ('event: result\ndata: %s\n\n' % json.dumps(state)).encode('utf-8')
+            return
+
+        yield b': pending\n\n'
+        wait_for_change(job_id, interval)
@@ -0,0 +1,121 @@
+'''
+Gunicorn embedded in the command, so that `py_google_auth` is the gunicorn master itself rather
+than a shell running one.
+
+Settings come from gunicorn's defaults, then `DEFAULTS` below and those of the command (e.g. the
+address and the number of workers), then the config file given with `--config` (a python file
+setting gunicorn settings as variables, like gunicorn's own `gunicorn.conf.py`, see
+`read_config_file`), then the options given on the command line.
+
+Hooks set in the config file are kept, the command's own (see `HOOKS`) run before them.
+'''
+
+import os
+import runpy
+
+from gunicorn.app.base import BaseApplication
+from gunicorn.util import import_app
+from gunicorn.workers.sync import SyncWorker
+
+from . import metrics
+from . import profiler
+
+# Waiting for a Google prompt takes up to a minute, which gunicorn's default 30 s timeout would
+# cut short by killing the worker.
+DEFAULTS = {'timeout': 120,
+            'graceful_timeout': 30,
+            'keepalive': 5}
+
+
+def on_starting(server):
+    # metrics of the workers of an earlier server with the same directory are not reported.
+    metrics.reset(os.getpid())
+
+
+def child_exit(server, worker):
+    metrics.remove(worker.pid, os.getpid())
+
+
+def post_worker_init(worker):
+    # the arbiter gives workers half the timeout, to notify it in time; requests get the whole.
+    profiler.set_worker(isinstance(worker, SyncWorker), worker.cfg.timeout)
+
+
+def chain_1(hook, configured):
+    def run(server):
+        hook(server)
+        return configured(server)
+    return run
+
+
+def chain_2(hook, configured):
+    def run(server, worker):
+        hook(server, worker)
+        return configured(server, worker)
+    return run
+
+
+# gunicorn hooks of the command, with how to chain them before a configured hook of their arity;
+# older gunicorn versions don't have all of them.
+HOOKS = {'on_starting': (on_starting, chain_1),
+         'post_worker_init': (post_worker_init, chain_1),
+         'child_exit': (child_exit, chain_2)}
+
+
+def read_config_file(path):
+    '''
+    Returns the gunicorn settings set in a python config file.
+    '''
+    variables = runpy.run_path(path)
+    return {name: value for name, value in variables.items() if not name.startswith('__')}
+
+
+def is_gevent(worker_class):
+    '''
+    Whether a gunicorn worker class setting names gevent workers.
+    '''
+    return worker_class.rpartition('#')[2] == 'gevent' or 'ggevent' in worker_class
+
+
+class Server(BaseApplication):
+    '''
+    Gunicorn application serving the app at `app_uri` (e.g. `py_google_auth.app:app`) with the
+    given settings (None for those not given) over those of the config file (`config`) and the
+    defaults.
+    '''
+
+    def __init__(self, app_uri, settings, config=None, defaults=None):
+        self.app_uri = app_uri
+        self.settings = settings
+        self.config = config or {}
+        self.defaults = defaults or {}
+        super(Server, self).__init__()
+
+    def load_config(self):
+        settings = dict(DEFAULTS)
+        settings.update(self.defaults)
+        settings.update(self.config)
+        settings.update((name, value) for name, value in self.settings.items()
+                        if value is not None)
+
+        # the gevent entry point patches the standard library when it is imported, which would
+        # patch the master itself.
+        if is_gevent(settings.get('worker_class', '')) and settings.get('preload_app'):
+            raise ValueError("gevent workers can't be used with --preload (preload_app)")
+
+        for name, value in settings.items():
+            if name in self.cfg.settings:
+                self.cfg.set(name, value)
+
+        for name, (hook, chain) in HOOKS.items():
+            if name in self.cfg.settings:
+                self.cfg.set(name, chain(hook, self.cfg.settings[name].get()))
+
+    def load(self):
+        # imported in the worker (or in the master with `preload_app`), after gevent workers have
+        # patched the standard library.
+        return import_app(self.app_uri)
+
+
+def run(app_uri, settings, config=None, defaults=None):
+    Server(app_uri, settings, config, defaults).run()
@@ -0,0 +1,213 @@
+'''
+Cache of the sessions of complete logins, so that logging into an account again while its last
+session is still signed in takes a single check of that session instead of the whole login.
+
+The session of every login which succeeded (on `/login`, or on `/step_two_login` for accounts
+with two factor auth) is kept, and a later `/login` with the same email and password gets it back
+if google still considers it signed in (see `login_utils.check_session`); else the login is made
+as usual and its session replaces the cached one.
+
+Entries are keyed by an HMAC of the email and password, with a secret only the server knows, so a
+different password never gets the session, and the credentials are not kept. While a login with
+two factor auth is in progress its key stays on server too (see `hold`), the session sent to the
+client only has a handle to it. It is off by default and configured like the session store (see
+`session_store`):
+    * `PY_GOOGLE_AUTH_SESSION_CACHE`: `memory`, `sqlite[:/path/to/file.db]` or `shm[:/path]`.
+    * `PY_GOOGLE_AUTH_SESSION_CACHE_TTL`: seconds a session is kept after it was last used
+      (default 3600).
+    * `PY_GOOGLE_AUTH_SESSION_CACHE_SIZE`: sessions kept at most (default 10000), the least
+      recently used ones are evicted first.
+    * `PY_GOOGLE_AUTH_SESSION_CACHE_KEY`: secret the keys are made with, required. Sessions are
+      encrypted with it too (with Fernet, `pip install py-google-auth[cache]`); without
+      cryptography installed they can only be kept in the clear in the `memory` backend.
+'''
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+from . import metrics
+from . import session_store
+
+DEFAULT_TTL = 3600
+DEFAULT_SIZE = 10000
+
+
+def create_cipher(secret, spec):
+    '''
+    Fernet cipher with a key derived from the secret; None if cryptography is not installed and
+    sessions are only kept in memory.
+    '''
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        if spec.partition(':')[0] == 'memory':
+            return None
+
+        raise ValueError("PY_GOOGLE_AUTH_SESSION_CACHE needs cryptography installed to encrypt "
+                         "the sessions it keeps")
+
+    key = hashlib.sha256(b'cipher:' + secret.encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+class SessionCache(object):
+    '''
+    Maps accounts to the encoded session of their last login, kept in a `session_store` backend.
+    '''
+
+    def __init__(self, backend, secret, cipher=None):
+        self.backend = backend
+        self.secret = hashlib.sha256(b'key:' + secret.encode('utf-8')).digest()
+        self.cipher = cipher
+
+    def get_key(self, email, password):
+        account = email.strip().lower() + '\0' + password
+        return hmac.new(self.secret, account.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the encoded session cached for the key, None if there is none.
+        '''
+        value = self.backend.get(key)
+
+        if value is None or self.cipher is None:
+            return value
+
+        from cryptography.fernet import InvalidToken
+
+        try:
+            return self.cipher.decrypt(value.encode('ascii')).decode('utf-8')
+
+        # encrypted with another secret.
+        except InvalidToken:
+            self.backend.delete(key)
+            return None
+
+    def put(self, key, session):
+        if self.cipher is not None:
+            session = self.cipher.encrypt(session.encode('utf-8')).decode('ascii')
+
+        self.backend.set(key, session)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    '''
+    Returns the configured cache, None if sessions are not to be cached.
+    '''
+    global _cache
+
+    spec = os.environ.get('PY_GOOGLE_AUTH_SESSION_CACHE')
+
+    if not spec:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = int(os.environ.get('PY_GOOGLE_AUTH_SESSION_CACHE_TTL', DEFAULT_TTL))
+                size = int(os.environ.get('PY_GOOGLE_AUTH_SESSION_CACHE_SIZE', DEFAULT_SIZE))
+                secret = os.environ.get('PY_GOOGLE_AUTH_SESSION_CACHE_KEY')
+
+                # keys made with a secret known to clients (like the access token) would let
+                # them find passwords from keys by trying them.
+                if not secret:
+                    raise ValueError("PY_GOOGLE_AUTH_SESSION_CACHE is set but "
+                                     "PY_GOOGLE_AUTH_SESSION_CACHE_KEY is not")
+
+                backend = session_store.create_backend(spec, ttl, size, 'session_cache')
+                _cache = SessionCache(backend, secret, create_cipher(secret, spec))
+
+    return _cache
+
+
+def get_key(email, password):
+    '''
+    Key of an account in the cache, None if sessions are not cached.
+    '''
+    cache = get_cache()
+    return cache.get_key(email, password) if cache is not None else None
+
+
+def lookup(key, check):
+    '''
+    Returns the encoded session cached for the key if `check` (called with it) finds it still
+    signed in, None otherwise; a session found signed out is removed.
+    '''
+    cache = get_cache()
+
+    if cache is None or key is None:
+        return None
+
+    session = cache.get(key)
+
+    if session is None:
+        metrics.increment(metrics.SESSION_CACHE, result='miss')
+        return None
+
+    valid = check(session)
+
+    # google could not be reached, the session may still be good.
+    if valid is None:
+        metrics.increment(metrics.SESSION_CACHE, result='unchecked')
+        return None
+
+    if not valid:
+        cache.delete(key)
+        metrics.increment(metrics.SESSION_CACHE, result='signed_out')
+        return None
+
+    metrics.increment(metrics.SESSION_CACHE, result='hit')
+    return session
+
+
+def store(key, session):
+    '''
+    Caches the encoded session of a complete login, if the login was keyed.
+    '''
+    cache = get_cache()
+
+    if cache is not None and key is not None:
+        cache.put(key, session)
+
+
+def hold(key):
+    '''
+    Keeps the key of a login in progress on server, where the client can neither read nor change
+    it; returns a handle to it to be kept in the session instead, None if the login is not keyed.
+    '''
+    cache = get_cache()
+
+    if cache is None or key is None:
+        return None
+
+    return session_store.SessionStore(cache.backend).put(key)
+
+
+def release(handle):
+    '''
+    Returns the key held for a handle and forgets it, None if the handle is not known.
+    '''
+    cache = get_cache()
+
+    if cache is None or not session_store.is_handle(handle):
+        return None
+
+    store = session_store.SessionStore(cache.backend)
+
+    try:
+        key = store.get(handle)
+    except session_store.SessionExpired:
+        return None
+
+    store.delete(handle)
+    return key
@@ -0,0 +1,147 @@
+'''
+Wire formats for sessions of logins in progress.
+
+The original format is jsonpickle of the whole `requests.Session.__dict__`, which carries the
+connection adapters and a lot of other state nobody needs back. The compact format only keeps
+what is required to continue a login: the cookie jar, the headers and the variables stuffed in
+the session for the next step. It is a versioned string:
+
+    pga1:j:<json>             plain json
+    pga1:z:<base64 of zlib>   json compressed with zlib and encoded with urlsafe base64
+
+The format used for encoding is selected with `PY_GOOGLE_AUTH_SESSION_FORMAT`, one of `compact`
+(the default, compressed), `json` (compact but not compressed) and `jsonpickle`. Decoding detects
+the format, so sessions encoded in any of them are accepted.
+'''
+
+import base64
+import json
+import os
+import zlib
+
+import requests
+
+from requests.cookies import create_cookie
+
+from . import transport
+
+VERSION_TAG = 'pga1:'
+
+FORMATS = ('compact', 'json', 'jsonpickle')
+
+
+def get_format(format=None):
+    '''
+    Resolves the format to encode sessions in.
+    '''
+
+    if format is None:
+        format = os.environ.get('PY_GOOGLE_AUTH_SESSION_FORMAT', 'compact')
+
+    if format not in FORMATS:
+        raise ValueError("Unknown session format %r, use one of %s" % (format, FORMATS))
+
+    return format
+
+
+def dump_cookie(cookie):
+    return [cookie.name, cookie.value, cookie.domain, cookie.path, cookie.secure, cookie.expires,
+            cookie.discard, cookie._rest]
+
+
+def load_cookie(data):
+    name, value, domain, path, secure, expires, discard, rest = data
+    return create_cookie(name, value, domain=domain, path=path, secure=secure, expires=expires,
+                         discard=discard, rest=rest)
+
+
+def session_to_dict(session):
+    '''
+    Collects the parts of a session that need to be kept between requests.
+    '''
+
+    # everything which is not a regular attribute of a requests session was stuffed in it for the
+    # next step of login, e.g. `next_url` and `prev_payload`.
+    flow = {name: value for name, value in session.__dict__.items()
+            if name not in requests.Session.__attrs__}
+
+    return {'cookies': [dump_cookie(cookie) for cookie in session.cookies],
+            'headers': dict(session.headers),
+            'flow': flow}
+
+
+def dict_to_session(data, session=None):
+    '''
+    Rebuilds a session from what `session_to_dict` collected.
+    '''
+
+    if session is None:
+        session = transport.new_session()
+
+    session.headers.clear()
+    session.headers.update(data['headers'])
+
+    for cookie in data['cookies']:
+        session.cookies.set_cookie(load_cookie(cookie))
+
+    session.__dict__.update(data['flow'])
+
+    return session
+
+
+def encode(session, format=None):
+    '''
+    Encodes a session into a string in the given (or configured) format.
+    '''
+    format = get_format(format)
+
+    if format == 'jsonpickle':
+        import jsonpickle
+
+        # adapters hold the connection pools, they are of no use to anyone decoding the session.
+        state = dict(session.__dict__)
+        state.pop('adapters', None)
+        return jsonpickle.encode(state)
+
+    text = json.dumps(session_to_dict(session), separators=(',', ':'))
+
+    if format == 'json':
+        return VERSION_TAG + 'j:' + text
+
+    compressed = zlib.compress(text.encode('utf-8'), 6)
+    return VERSION_TAG + 'z:' + base64.urlsafe_b64encode(compressed).decode('ascii')
+
+
+def decode(encoded, session=None):
+    '''
+    Decodes a string produced by `encode` into a session object.
+    `session`: a new session to load the decoded state into, one is created if not given.
+    '''
+
+    if not encoded.startswith(VERSION_TAG):
+        import jsonpickle
+
+        decoded = jsonpickle.decode(encoded)
+
+        # sessions of complete logins are sent as the whole session object.
+        if isinstance(decoded, requests.Session):
+            decoded = decoded.__dict__
+
+        if session is None:
+            session = requests.session()
+
+        session.__dict__.update(decoded)
+
+        # sessions encoded by older versions carry their own adapters.
+        return transport.attach(session)
+
+    kind, _, body = encoded[len(VERSION_TAG):].partition(':')
+
+    if kind == 'j':
+        text = body
+    elif kind == 'z':
+        text = zlib.decompress(base64.urlsafe_b64decode(body.encode('ascii'))).decode('utf-8')
+    else:
+        raise ValueError("Unknown session encoding %r" % kind)
+
+    return dict_to_session(json.loads(text), session)
@@ -0,0 +1,355 @@
+'''
+Server side store for the sessions of logins in progress.
+
+By default the whole session of an unfinished login is serialized into the response and the client
+sends it back with the next request. When a store is configured, the session (with the variables
+stuffed in it for the next step, i.e. `next_url`, `prev_payload`, `query_params` and
+`select_method_url`) stays on the server and the client only gets a short opaque handle.
+
+The store is configured with the `PY_GOOGLE_AUTH_SESSION_STORE` environment variable:
+    * `memory`: a dictionary in the server process; only usable with a single worker.
+    * `sqlite:/path/to/file.db`: a SQLite database, shared by all the workers on a machine.
+    * `shm` or `shm:/path/to/dir`: one file per session on a memory backed file system
+      (`/dev/shm` by default), shared by all the workers on a machine.
+
+Sessions expire `PY_GOOGLE_AUTH_SESSION_TTL` seconds (default 600) after they were last used and
+at most `PY_GOOGLE_AUTH_SESSION_STORE_SIZE` (default 10000) sessions are kept, the least recently
+used ones are evicted first.
+'''
+
+import collections
+import os
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+
+# every handle starts with this, which is how they are told apart from serialized sessions.
+HANDLE_PREFIX = 'pga:'
+
+# handles are generated by `secrets.token_urlsafe`, anything else sent by a client is rejected
+# before it reaches a backend (it is used as a file name by some).
+HANDLE_KEY_PATTERN = re.compile('^[A-Za-z0-9_-]+$')
+
+DEFAULT_TTL = 600
+DEFAULT_SIZE = 10000
+
+
+class SessionExpired(KeyError):
+    '''
+    Raised when a handle is unknown to the store, it was evicted or it expired.
+    '''
+
+
+class MemoryBackend(object):
+    '''
+    Keeps the values in an ordered dictionary in the current process.
+    '''
+
+    # values are kept as objects, no need to encode them.
+    keeps_objects = True
+
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time())
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value, accessed = self.entries[key]
+            except KeyError:
+                return None
+
+            now = time.time()
+
+            if now - accessed > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries[key] = (value, now)
+            self.entries.move_to_end(key)
+
+            return value
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+
+class SQLiteBackend(object):
+    '''
+    Keeps the values in a SQLite database file which can be shared between processes.
+    '''
+
+    keeps_objects = False
+
+    def __init__(self, path, ttl, size):
+        self.path = path
+        self.ttl = ttl
+        self.size = size
+        self.local = threading.local()
+
+        connection = self.connect()
+        connection.execute('CREATE TABLE IF NOT EXISTS sessions '
+                           '(handle TEXT PRIMARY KEY, value TEXT, accessed REAL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)')
+        connection.commit()
+
+    def connect(self):
+        '''
+        Returns the connection of current thread, sqlite connections can't be shared by threads.
+        '''
+        connection = getattr(self.local, 'connection', None)
+
+        # a forked worker must not use the connection of its parent.
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+
+        return connection
+
+    def set(self, key, value):
+        connection = self.connect()
+        now = time.time()
+
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)',
+                               (key, value, now))
+            connection.execute('DELETE FROM sessions WHERE accessed < ?', (now - self.ttl,))
+
+            # evict least recently used sessions above the limit.
+            connection.execute('DELETE FROM sessions WHERE handle IN (SELECT handle FROM sessions '
+                               'ORDER BY accessed DESC LIMIT -1 OFFSET ?)', (self.size,))
+
+    def get(self, key):
+        connection = self.connect()
+        now = time.time()
+
+        with connection:
+            row = connection.execute('SELECT value, accessed FROM sessions WHERE handle = ?',
+                                     (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            if now - row[1] > self.ttl:
+                connection.execute('DELETE FROM sessions WHERE handle = ?', (key,))
+                return None
+
+            connection.execute('UPDATE sessions SET accessed = ? WHERE handle = ?', (now, key))
+
+        return row[0]
+
+    def delete(self, key):
+        connection = self.connect()
+
+        with connection:
+            connection.execute('DELETE FROM sessions WHERE handle = ?', (key,))
+
+    def keys(self):
+        rows = self.connect().execute('SELECT handle FROM sessions WHERE accessed >= ?',
+                                      (time.time() - self.ttl,))
+        return [row[0] for row in rows]
+
+
+class SharedMemoryBackend(object):
+    '''
+    Keeps every value in a file on a memory backed file system, so that it can be shared between
+    processes without a database. Modification time of a file is the time it was last used.
+    '''
+
+    keeps_objects = False
+
+    # eviction needs a directory listing, so it is done only on every so many writes.
+    evict_every = 64
+
+    def __init__(self, directory, ttl, size):
+        self.directory = directory
+        self.ttl = ttl
+        self.size = size
+        self.writes = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def set(self, key, value):
+        # write to a temporary file and rename, so that readers never see a partial value.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(value)
+        os.replace(tmp_path, self.path(key))
+
+        self.writes += 1
+        if self.writes % self.evict_every == 0:
+            self.evict()
+
+    def get(self, key):
+        path = self.path(key)
+
+        try:
+            modified = os.stat(path).st_mtime
+            if time.time() - modified > self.ttl:
+                os.remove(path)
+                return None
+
+            with open(path) as f:
+                value = f.read()
+
+            # mark it as used.
+            os.utime(path)
+
+        except (OSError, IOError):
+            return None
+
+        return value
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def keys(self):
+        return [name for name in os.listdir(self.directory) if not name.startswith('.tmp-')]
+
+    def evict(self):
+        '''
+        Removes expired files and the least recently used ones above the limit.
+        '''
+        now = time.time()
+        entries = []
+
+        for entry in os.scandir(self.directory):
+            try:
+                modified = entry.stat().st_mtime
+            except OSError:
+                continue
+
+            if now - modified > self.ttl:
+                self.delete(entry.name)
+            elif not entry.name.startswith('.tmp-'):
+                entries.append((modified, entry.name))
+
+        if len(entries) > self.size:
+            entries.sort()
+            for modified, name in entries[:len(entries) - self.size]:
+                self.delete(name)
+
+
+class SessionStore(object):
+    '''
+    Maps opaque handles to values kept in a backend.
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def keeps_objects(self):
+        return self.backend.keeps_objects
+
+    def put(self, value):
+        '''
+        Stores the value and returns a new handle for it.
+        '''
+        handle = HANDLE_PREFIX + secrets.token_urlsafe(18)
+        self.backend.set(handle[len(HANDLE_PREFIX):], value)
+        return handle
+
+    def get(self, handle):
+        '''
+        Returns the value stored for the handle, raises `SessionExpired` if there is none.
+        '''
+        key = handle[len(HANDLE_PREFIX):]
+
+        if not HANDLE_KEY_PATTERN.match(key):
+            raise SessionExpired(handle)
+
+        value = self.backend.get(key)
+
+        if value is None:
+            raise SessionExpired(handle)
+
+        return value
+
+    def delete(self, handle):
+        key = handle[len(HANDLE_PREFIX):]
+
+        if HANDLE_KEY_PATTERN.match(key):
+            self.backend.delete(key)
+
+
+def create_backend(spec, ttl, size, name='sessions'):
+    '''
+    Creates a backend from its description; see module docstring for the format.
+    `name`: what the values are, it names the default database or directory.
+    '''
+    kind, _, argument = spec.partition(':')
+
+    if kind == 'memory':
+        return MemoryBackend(ttl, size)
+
+    if kind == 'sqlite':
+        path = argument or os.path.join(tempfile.gettempdir(), 'py_google_auth_%s.db' % name)
+        return SQLiteBackend(path, ttl, size)
+
+    if kind == 'shm':
+        if not argument:
+            base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            argument = os.path.join(base, 'py_google_auth_%s' % name)
+        return SharedMemoryBackend(argument, ttl, size)
+
+    raise ValueError("Unknown session store %r" % spec)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    '''
+    Returns the configured store, None if sessions are not to be kept on server.
+    '''
+    global _store
+
+    spec = os.environ.get('PY_GOOGLE_AUTH_SESSION_STORE')
+
+    if not spec:
+        return None
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                ttl = int(os.environ.get('PY_GOOGLE_AUTH_SESSION_TTL', DEFAULT_TTL))
+                size = int(os.environ.get('PY_GOOGLE_AUTH_SESSION_STORE_SIZE', DEFAULT_SIZE))
+                _store = SessionStore(create_backend(spec, ttl, size))
+
+    return _store
+
+
+def is_handle(value):
+    '''
+    Whether the value sent by a client is a handle rather than a serialized session.
+    '''
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
@@ -0,0 +1,97 @@
+import falcon
+import json
+import os
+import pstats
+
+from . import login
+from . import metrics
+from . import profiler
+from . import transport
+
+
+@falcon.before(login.validate_query_token)
+class PoolStats(object):
+    '''
+    Reports use of the connection pools to google in the worker that serves the request.
+    '''
+    def on_get(self, req, resp):
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({'pid': os.getpid(), 'pools': transport.get_stats()})
+
+
+@falcon.before(login.validate_query_token)
+class Metrics(object):
+    '''
+    Reports metrics of all the workers in the Prometheus text format.
+    '''
+    def on_get(self, req, resp):
+
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'text/plain; version=0.0.4'
+        resp.body = metrics.render()
+
+
+@falcon.before(login.validate_query_token)
+class Profile(object):
+    '''
+    Profiles the worker that serves the request; see `profiler` for the modes.
+    '''
+    def on_get(self, req, resp):
+
+        mode = req.get_param('mode') or 'sample'
+        resp.content_type = 'text/plain'
+
+        if mode == 'sample':
+            if not profiler.can_sample():
+                raise falcon.HTTPBadRequest('Invalid mode',
+                                            'Sampling can not see the requests of a sync worker, '
+                                            'use mode cprofile.')
+
+            seconds = req.get_param_as_int('seconds', min=1,
+                                           max=profiler.get_max_seconds()) or 10
+            interval = req.get_param_as_int('interval', min=1, max=1000) or 5
+
+            counts = profiler.sample(seconds, interval / 1000.0)
+
+            resp.status = falcon.HTTP_200
+            resp.body = profiler.format_collapsed(counts)
+
+        elif mode == 'cprofile':
+            resource = req.get_param('resource')
+
+            # start profiling the next requests of a resource.
+            if resource is not None:
+                requests = req.get_param_as_int('requests', min=1) or 1
+                profiler.start_profile(resource, requests)
+
+                resp.status = falcon.HTTP_202
+                resp.body = 'Profiling next %d requests of %s in worker %d.\n' % (
+                    requests, resource, os.getpid())
+                return
+
+            run = profiler.get_profile()
+
+            if run is None:
+                raise falcon.HTTPNotFound(title='No profile',
+                                          description='Start one by sending a resource.')
+
+            if not run.done:
+                resp.status = falcon.HTTP_202
+                resp.body = '%d of %d requests of %s profiled.\n' % (
+                    run.requests - run.remaining, run.requests, run.resource)
+                return
+
+            sort = req.get_param('sort') or 'cumulative'
+
+            if sort not in pstats.Stats.sort_arg_dict_default:
+                raise falcon.HTTPBadRequest('Invalid sort', 'Sort should be one of %s.' % ', '.join(
+                    sorted(pstats.Stats.sort_arg_dict_default)))
+
+            limit = req.get_param_as_int('limit', min=1) or 50
+
+            resp.status = falcon.HTTP_200
+            resp.body = run.format(sort, limit)
+
+        else:
+            raise falcon.HTTPBadRequest('Invalid mode', 'Mode should be sample or cprofile.')
@@ -4,13 +4,15 @@ import requests
 
 from . import utils
 from . import login_utils
+from . import outcomes
+from . import upstream
 
 
 def handle_prompt_error(response):
     '''
     This function checks for errors (if any) while using google prompt method for login.
     '''
-    if "Sign-in canceled" in response.text:
+    if utils.parse_page(response).classify(outcomes.PROMPT) == 'canceled':
         error = 412
 
     else:
@@ -21,21 +23,39 @@ def handle_prompt_error(response):
     return response, error
 
 
+def otp_error_needs_methods(response):
+    '''
+    Whether an otp was rejected because the method got blocked after too many failed attempts, in
+    that case `handle_otp_error` needs to fetch the alternate methods.
+    '''
+    page = utils.parse_page(response)
+    error = utils.scrap_error(page)
+
+    if error and ("Wrong" in error or "Enter a code" in error):
+        return False
+
+    return page.classify(outcomes.OTP) == 'blocked'
+
+
 def handle_otp_error(response, session):
     '''
     This function checks for errors (if any) while using google authenticator method for login.
     '''
 
     # TODO: shift these to config file
-    base_url_login = "https://accounts.google.com/ServiceLogin?"
-    url_auth = "https://accounts.google.com/ServiceLoginAuth?service=androiddeveloper"
+    base_url_login = upstream.get_accounts_url() + "/ServiceLogin?"
+    url_auth = upstream.get_accounts_url() + "/ServiceLoginAuth?service=androiddeveloper"
+
+    # parse the page once for all the checks below.
+    page = utils.parse_page(response)
 
-    error = utils.scrap_error(response.text)
+    error = utils.scrap_error(page)
+    outcome = page.classify(outcomes.OTP)
 
     if error and ("Wrong" in error or "Enter a code" in error):
         error = 406
 
-    elif "Unavailable because of too many failed attempts" in response.text:
+    elif outcome == 'blocked':
         response, error, session = login_utils.select_alternate_method(session,
                                                                            response.url)
 
@@ -45,9 +65,9 @@ def handle_otp_error(response, session):
             response = {'methods': methods, 'url': url}
             error = 503
 
-    elif "Resend code" in response.text:
+    elif outcome == 'resend':
         # sending 3 as the method code for sms otp is 3
-        payload = utils.make_payload(response.text)
+        payload = utils.make_payload(page)
 
         # save payload so as to make request to resend otp if required
         session.resend_payload = payload
@@ -70,6 +90,48 @@ def handle_otp_error(response, session):
     return response, error, session
 
 
+def prepare_prompt_verification(reply, payload):
+    '''
+    Reads the reply from `await_url` (what user responded on Google prompt) and prepares the
+    payload for final call to verify the request.
+    Returns the payload, or the response to send back and an error code.
+    '''
+    error = None
+    response = None
+
+    # convert response to json.
+    reply_json = json.loads(reply)
+
+    # if request payload was not json encoded.
+    if 'error' in reply_json and reply_json['error']['code'] == 400:
+        error = 500
+        file_name, hostname = utils.log_error("second step login", json.dumps(reply_json))
+        response = {'file_name': file_name, 'hostname': hostname}
+
+    # if user does not respond for prompt; time out error
+    if 'error' in reply_json and reply_json['error']['code'] == 500:
+        error = 408
+        return None, reply_json, error
+
+    try:
+        # parse the token from response and add to payload to make final call
+        payload['token'] = reply_json['txToken']
+        payload['action'] = 'VERIFY'
+
+        # subAction is a parameter used in previous POST/GET request so we need to remove
+        # it so that we don't get redirected to previous request.
+        payload.pop('subAction')
+
+    except:
+        # if there is some problem with payload, log the content of response to debug
+        file_name, hostname = utils.log_error("second step login", reply)
+        error = 500
+        response = {'file_name': file_name, 'hostname': hostname}
+        return None, response, error
+
+    return payload, response, error
+
+
 def two_step_login_with_prompt(session, payload, query_params, url_to_challenge_signin):
     '''
     Method for two step authentication with Google prompt.
@@ -89,7 +151,7 @@ def two_step_login_with_prompt(session, payload, query_params, url_to_challenge_
     error = None
 
     # url to make a POST call to check if a user responded on prompt.
-    await_url = "https://content.googleapis.com/cryptauth/v1/authzen/awaittx?alt=json&key=%s"
+    await_url = upstream.get_content_url() + "/cryptauth/v1/authzen/awaittx?alt=json&key=%s"
 
     # headers are necessary to specify the referer and content type else request fails.
     headers = {"Referer": url_to_challenge_signin, "Content-Type": "application/json"}
@@ -110,34 +172,10 @@ def two_step_login_with_prompt(session, payload, query_params, url_to_challenge_
         error = 504
         return None, error, session
 
-    # convert response to json.
-    reply_json = json.loads(reply_from_user.content.decode('utf-8'))
-
-    # if request payload was not json encoded.
-    if 'error' in reply_json and reply_json['error']['code'] == 400:
-        error = 500
-        file_name, hostname = utils.log_error("second step login", json.dumps(reply_json))
-        response = {'file_name': file_name, 'hostname': hostname}
-
-    # if user does not respond for prompt; time out error
-    if 'error' in reply_json and reply_json['error']['code'] == 500:
-        error = 408
-        return reply_json, error, session
-
-    try:
-        # parse the token from response and add to payload to make final call
-        payload['token'] = reply_json['txToken']
-        payload['action'] = 'VERIFY'
+    payload, response, error = prepare_prompt_verification(
+        reply_from_user.content.decode('utf-8'), payload)
 
-        # subAction is a parameter used in previous POST/GET request so we need to remove
-        # it so that we don't get redirected to previous request.
-        payload.pop('subAction')
-
-    except:
-        # if there is some problem with payload, log the content of response to debug
-        file_name, hostname = utils.log_error("second step login", reply_from_user.text)
-        error = 500
-        response = {'file_name': file_name, 'hostname': hostname}
+    if error:
         return response, error, session
 
     try:
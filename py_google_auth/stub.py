@@ -0,0 +1,457 @@
+'''
+A local stand-in for google accounts, to run the API end to end without google.
+
+It serves the pages the login flow goes through (ServiceLogin, ServiceLoginAuth, the challenge
+pages of Google prompt, Google Authenticator, text message and backup code, the page to try
+another way to sign in) and the `awaittx` api of Google prompt, with the elements the API looks
+for. Point the API at it with:
+
+    export PY_GOOGLE_AUTH_ACCOUNTS_URL=http://127.0.0.1:8002
+    export PY_GOOGLE_AUTH_CONTENT_URL=http://127.0.0.1:8002
+
+Accounts are made up from the email:
+    * `user@example.com`: no two factor auth.
+    * `user+<method>@example.com`, method one of `az` (Google prompt), `totp`, `ipp` (text
+      message) or `bc`: two factor auth with it as the default method; all the methods are
+      enabled.
+    * any email containing `captcha`: always gets a captcha.
+    * any email containing `unavailable`: with two factor auth, google can't use the default method
+      right now.
+
+Password `wrong` is rejected, any other is accepted. Codes `123456` (and backup code `12345678`)
+are accepted, `000000` blocks the method as after too many failed attempts, and any other code is
+wrong. The login form sends a signed in session on to its continue url, which is how sessions are
+checked (see `login_utils.check_session`). Google prompt is approved, denied or times out after
+`prompt_delay` seconds depending on the `prompt` option.
+
+Every request can be delayed by `latency` seconds, answered with an error page with probability
+`error_rate`, and a login with a captcha with probability `captcha_rate`; the random choices are
+seeded so runs are repeatable. Run it with:
+
+    python -m py_google_auth.stub --port 8002 --latency 0.05
+'''
+
+import json
+import optparse
+import random
+import socketserver
+import threading
+import time
+
+from urllib.parse import urlencode
+from wsgiref import simple_server
+
+import falcon
+
+METHODS = ('az', 'totp', 'ipp', 'bc')
+
+# challenge id and type of the methods, as on the page to try another way to sign in.
+CHALLENGES = {'az': ('2', '39'), 'totp': ('3', '6'), 'ipp': ('4', '9'), 'bc': ('5', '4')}
+
+# cookies set by google after a complete login; the API counts them to know if login succeeded.
+SIGNED_IN_COOKIES = ('SID', 'HSID', 'SSID', 'APISID', 'SAPISID', 'LSID', 'NID')
+
+VALID_CODES = ('123456', '12345678')
+BLOCKING_CODE = '000000'
+
+
+class Options(object):
+    '''
+    Behaviour of the stand-in, see the module documentation.
+    '''
+
+    def __init__(self, latency=0, prompt_delay=0, prompt='approve', error_rate=0,
+                 captcha_rate=0, padding=60000, seed=0):
+        self.latency = latency
+        self.prompt_delay = prompt_delay
+        self.prompt = prompt
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.padding = padding
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def chance(self, rate):
+        if not rate:
+            return False
+
+        with self.lock:
+            return self.random.random() < rate
+
+
+def hidden(name, value):
+    return '<input type="hidden" name="%s" value="%s">' % (name, value)
+
+
+def render(title, body, options):
+    '''
+    A complete page; real pages are mostly inline scripts and styles, `padding` bytes of them are
+    added so that parsing costs about the same.
+    '''
+    script = ('function f(a){return a&&a.length?a[0]:null};' * (options.padding // 45 + 1))
+    return ('<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>%s</title>'
+            '<script>%s</script></head><body><div class="wrapper">%s</div></body></html>'
+            % (title, script[:options.padding], body))
+
+
+def common_inputs():
+    return (hidden('TL', 'AM3QAYZ' + 'x' * 40) + hidden('gxf', 'AFoagUX' + 'y' * 20) +
+            hidden('continue', 'https://play.google.com/apps/publish') +
+            hidden('service', 'androiddeveloper') + hidden('hl', 'en'))
+
+
+def service_login_page(options):
+    form = ('<form novalidate method="post" action="/ServiceLoginAuth" id="gaia_loginform">' +
+            hidden('Page', 'PasswordSeparationSignIn') + hidden('GALX', 'kd8RY2mGZq4') +
+            common_inputs() + hidden('_utf8', '&#9731;') + hidden('bgresponse', 'js_disabled') +
+            '<input id="Email" name="Email" type="email" value="">'
+            '<input id="Passwd" name="Passwd" type="password">'
+            '<input id="signIn" name="signIn" type="submit" value="Sign in"></form>')
+    return render('Sign in - Google Accounts', form, options)
+
+
+def challenge_page(method, options, error=None, blocked=False, unavailable=False):
+    challenge_id, challenge_type = CHALLENGES[method]
+
+    if method == 'az':
+        body = ('<h2>Check your phone</h2><p>Google sent a notification to your phone. Tap '
+                '<b>Yes</b> on the prompt to sign in.</p><div class="LJtPoc" '
+                'data-api-key="AIzaSyStubKey" data-tx-id="%s"></div>' % random_token())
+        inputs = hidden('subAction', 'waitForTxApproval') + hidden('action', 'CONFIRM')
+
+    elif method == 'totp':
+        body = ('<h2>2-Step Verification</h2><p>Get a verification code from the '
+                '<b>Google Authenticator</b> app</p><input type="tel" name="Pin">')
+        inputs = hidden('TrustDevice', 'on')
+
+    elif method == 'ipp':
+        body = ('<h2>2-Step Verification</h2><p>A text message with a 6-digit verification '
+                'code was just sent to <b class="DZNRQe">(&#8226;&#8226;&#8226;) '
+                '&#8226;&#8226;&#8226;-&#8226;&#8226;42</b></p><input type="tel" name="Pin">'
+                '<a href="#">Resend code</a>')
+        inputs = hidden('SendMethod', 'SMS') + hidden('TrustDevice', 'on')
+
+    else:
+        body = ('<h2>2-Step Verification</h2><p>Enter one of your 8-digit backup code</p>'
+                '<input type="tel" name="Pin">')
+        inputs = ''
+
+    if error:
+        body += '<span id="errorMsg" class="error-msg">%s</span>' % error
+
+    if blocked:
+        body += '<p>Unavailable because of too many failed attempts. Try again in a few hours.</p>'
+
+    if unavailable:
+        body += '<p>Something went wrong. Please try again later.</p>'
+
+    form = ('<form novalidate method="post" action="/signin/challenge/%s/%s" id="challenge">'
+            % (method, challenge_id) + hidden('challengeId', challenge_id) +
+            hidden('challengeType', challenge_type) + common_inputs() + inputs + '</form>')
+
+    return render('2-Step Verification', body + form +
+                  '<a href="/signin/challenge/skip">Try another way to sign in</a>', options)
+
+
+def selection_page(options):
+    texts = {'az': 'Get a Google prompt on your phone',
+             'totp': 'Get a verification code from the Google Authenticator app',
+             'ipp': 'Get a text message with a verification code at (&#8226;&#8226;&#8226;) '
+                    '&#8226;&#8226;&#8226;-&#8226;&#8226;42',
+             'bc': 'Enter one of your 8-digit backup code'}
+    items = []
+
+    for method in METHODS:
+        challenge_id, challenge_type = CHALLENGES[method]
+        items.append('<li><form method="post" action="/signin/challenge/%s/%s">'
+                     % (method, challenge_id) + hidden('challengeId', challenge_id) +
+                     hidden('challengeType', challenge_type) + common_inputs() +
+                     hidden('subAction', 'selectChallenge') +
+                     '<button type="submit"><span class="mSMaIe">%s</span></button></form></li>'
+                     % texts[method])
+
+    body = ('<h2>Try another way to sign in</h2><ol id="challengePickerList">%s</ol>'
+            % ''.join(items))
+    return render('2-Step Verification', body, options)
+
+
+def random_token():
+    return '%032x' % random.getrandbits(128)
+
+
+def default_method(email):
+    local = email.split('@')[0]
+
+    if '+' not in local:
+        return None
+
+    method = local.split('+', 1)[1]
+    return method if method in METHODS else 'az'
+
+
+def set_signed_in(resp):
+    for name in SIGNED_IN_COOKIES:
+        resp.set_cookie(name, random_token(), secure=False, path='/')
+
+
+def send_page(resp, text):
+    resp.content_type = 'text/html; charset=UTF-8'
+    resp.body = text
+
+
+def redirect(resp, location):
+    resp.status = falcon.HTTP_302
+    resp.location = location
+
+
+class Injection(object):
+    '''
+    Middleware delaying requests and answering some of them with an error page.
+    '''
+
+    def __init__(self, options):
+        self.options = options
+
+    def process_request(self, req, resp):
+        if self.options.latency:
+            time.sleep(self.options.latency)
+
+        if self.options.chance(self.options.error_rate):
+            raise falcon.HTTPInternalServerError('Something went wrong',
+                                                 'Something went wrong. Please try again later.')
+
+
+class ServiceLogin(object):
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_get(self, req, resp):
+        # a signed in session is sent on to where it was going.
+        if req.cookies.get('SID'):
+            return redirect(resp, req.get_param('continue') or '/')
+
+        resp.set_cookie('GAPS', random_token(), secure=False, path='/')
+        send_page(resp, service_login_page(self.options))
+
+    on_head = on_get
+
+
+class ServiceLoginAuth(object):
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_post(self, req, resp):
+        form = req.params
+        email = form.get('Email', '')
+
+        if form.get('Passwd') == 'wrong':
+            body = '<span id="errorMsg">Wrong password. Try again.</span>'
+            return send_page(resp, render('Sign in', body, self.options))
+
+        if 'captcha' in email or self.options.chance(self.options.captcha_rate):
+            body = '<p>Type the text you hear or see</p><img id="captchaimg" src="/captcha">'
+            return send_page(resp, render('Sign in', body, self.options))
+
+        method = default_method(email)
+
+        if method is None:
+            set_signed_in(resp)
+            return send_page(resp, render('Google Play Console', '<p>Signed in</p>',
+                                          self.options))
+
+        params = {'service': 'androiddeveloper'}
+
+        if 'unavailable' in email:
+            params['unavailable'] = 1
+
+        redirect(resp, '/signin/challenge/%s/%s?%s' % (method, CHALLENGES[method][0],
+                                                       urlencode(params)))
+
+
+class Challenge(object):
+    '''
+    Challenge page of a method; posting to it selects the method (from the page to try another
+    way) or verifies a code or Google prompt.
+    '''
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_get(self, req, resp, method, challenge_id):
+        if method not in METHODS:
+            raise falcon.HTTPNotFound()
+
+        send_page(resp, challenge_page(method, self.options,
+                                       unavailable=bool(req.get_param('unavailable'))))
+
+    def on_post(self, req, resp, method, challenge_id):
+        if method not in METHODS:
+            raise falcon.HTTPNotFound()
+
+        form = req.params
+
+        if form.get('subAction') == 'selectChallenge':
+            return send_page(resp, challenge_page(method, self.options))
+
+        if method == 'az':
+            if form.get('action') == 'VERIFY' and form.get('token', '').startswith('approved'):
+                set_signed_in(resp)
+                return send_page(resp, render('Google Play Console', '<p>Signed in</p>',
+                                              self.options))
+
+            body = '<h2>Sign-in canceled</h2><p>You denied the sign-in on your phone.</p>'
+            return send_page(resp, render('Sign-in canceled', body, self.options))
+
+        code = form.get('Pin', '')
+
+        if code in VALID_CODES:
+            set_signed_in(resp)
+            return send_page(resp, render('Google Play Console', '<p>Signed in</p>',
+                                          self.options))
+
+        if code == BLOCKING_CODE:
+            return send_page(resp, challenge_page(method, self.options, blocked=True))
+
+        error = 'Wrong code. Try again.' if code else 'Enter a code'
+        send_page(resp, challenge_page(method, self.options, error=error))
+
+
+class Skip(object):
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_post(self, req, resp):
+        redirect(resp, '/signin/selectchallenge?%s' % urlencode({'tx': random_token()}))
+
+
+class SelectChallenge(object):
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_get(self, req, resp):
+        send_page(resp, selection_page(self.options))
+
+
+class AwaitTx(object):
+    '''
+    The api which answers once user responded on Google prompt.
+    '''
+
+    def __init__(self, options):
+        self.options = options
+
+    def on_post(self, req, resp):
+        try:
+            # read up to the length only, the stream is not bounded under every server.
+            json.loads(req.stream.read(req.content_length or 0).decode('utf-8'))['txId']
+        except (ValueError, KeyError, TypeError):
+            resp.status = falcon.HTTP_400
+            resp.body = json.dumps({'error': {'code': 400, 'message': 'Invalid JSON payload'}})
+            return
+
+        if self.options.prompt_delay:
+            time.sleep(self.options.prompt_delay)
+
+        if self.options.prompt == 'timeout':
+            resp.status = falcon.HTTP_500
+            resp.body = json.dumps({'error': {'code': 500, 'message': 'Deadline exceeded'}})
+            return
+
+        state = 'approved' if self.options.prompt == 'approve' else 'denied'
+        resp.body = json.dumps({'txToken': state + random_token()})
+
+
+def create_app(options=None):
+    '''
+    Returns the wsgi application of the stand-in.
+    '''
+
+    if options is None:
+        options = Options()
+
+    app = falcon.API(middleware=[Injection(options)])
+
+    # form data of POST requests is read into `req.params`.
+    app.req_options.auto_parse_form_urlencoded = True
+
+    app.add_route('/ServiceLogin', ServiceLogin(options))
+    app.add_route('/ServiceLoginAuth', ServiceLoginAuth(options))
+    app.add_route('/signin/challenge/skip', Skip(options))
+    app.add_route('/signin/challenge/{method}/{challenge_id}', Challenge(options))
+    app.add_route('/signin/selectchallenge', SelectChallenge(options))
+    app.add_route('/cryptauth/v1/authzen/awaittx', AwaitTx(options))
+
+    return app
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, simple_server.WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(simple_server.WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host='127.0.0.1', port=0, options=None, quiet=True):
+    '''
+    Returns a server of the stand-in, serving each request in a thread; port 0 picks a free port.
+    '''
+    handler = QuietHandler if quiet else simple_server.WSGIRequestHandler
+    return simple_server.make_server(host, port, create_app(options), server_class=ThreadingServer,
+                                     handler_class=handler)
+
+
+def start(host='127.0.0.1', port=0, options=None):
+    '''
+    Starts a server of the stand-in in a background thread and returns the server and its url.
+    '''
+    server = make_server(host, port, options)
+
+    thread = threading.Thread(target=server.serve_forever, name='py_google_auth-stub')
+    thread.daemon = True
+    thread.start()
+
+    return server, 'http://%s:%d' % server.server_address[:2]
+
+
+def main(argv=None):
+    parser = optparse.OptionParser()
+
+    parser.add_option('-a', '--host', dest='host', default='127.0.0.1')
+    parser.add_option('-p', '--port', dest='port', type='int', default=8002)
+    parser.add_option('--latency', dest='latency', type='float', default=0,
+                      help='seconds every request is delayed by')
+    parser.add_option('--prompt-delay', dest='prompt_delay', type='float', default=0,
+                      help='seconds until user responds on Google prompt')
+    parser.add_option('--prompt', dest='prompt', default='approve',
+                      choices=['approve', 'deny', 'timeout'],
+                      help='how user responds on Google prompt')
+    parser.add_option('--error-rate', dest='error_rate', type='float', default=0,
+                      help='fraction of requests answered with an error page')
+    parser.add_option('--captcha-rate', dest='captcha_rate', type='float', default=0,
+                      help='fraction of logins that get a captcha')
+    parser.add_option('--padding', dest='padding', type='int', default=60000,
+                      help='bytes of script added to every page')
+    parser.add_option('--seed', dest='seed', type='int', default=0)
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False)
+
+    (options, arguments) = parser.parse_args(argv)
+
+    stub_options = Options(latency=options.latency, prompt_delay=options.prompt_delay,
+                           prompt=options.prompt, error_rate=options.error_rate,
+                           captcha_rate=options.captcha_rate, padding=options.padding,
+                           seed=options.seed)
+
+    server = make_server(options.host, options.port, stub_options, quiet=not options.verbose)
+    print("Serving stand-in for google on http://%s:%d" % server.server_address[:2])
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
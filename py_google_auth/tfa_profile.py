@@ -0,0 +1,190 @@
+'''
+Cache of what was found out about the two factor auth of every account: its default method, the
+methods it has enabled and the phone number hint of text messages.
+
+These almost never change, yet finding them takes parsing the challenge page and three requests to
+google for the methods (see `login_utils.select_alternate_method`). With a profile cached, `/login`
+answers 303 from it right after the password is accepted; the methods are collected again only if
+user wants to change the method (as in `lazy` discovery, see `login_utils.get_discovery_mode`).
+
+While a login is in progress its key stays on server (see `hold`), the session sent to the client
+only has a handle to it, so that a client can't read or change other accounts' profiles.
+
+A profile is dropped when it turns out to be wrong: when google shows the challenge of another
+method than the cached default, or when a cached method can't be selected on `/change_method`.
+
+It is off by default and configured like the session store (see `session_store`):
+    * `PY_GOOGLE_AUTH_TFA_PROFILES`: `memory`, `sqlite[:/path/to/file.db]` or `shm[:/path]`.
+    * `PY_GOOGLE_AUTH_TFA_PROFILE_TTL`: seconds a profile is kept after it was last used (default
+      a day).
+    * `PY_GOOGLE_AUTH_TFA_PROFILE_SIZE`: profiles kept at most (default 10000).
+    * `PY_GOOGLE_AUTH_TFA_PROFILE_KEY`: secret the keys are made with (default
+      `PY_GOOGLE_AUTH_SESSION_CACHE_KEY`); profiles are not cached without one.
+'''
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+
+from . import metrics
+from . import session_store
+from . import utils
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_SIZE = 10000
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_secret():
+    '''
+    Secret the keys of profiles are made with, None if none is set.
+    '''
+    return (os.environ.get('PY_GOOGLE_AUTH_TFA_PROFILE_KEY') or
+            os.environ.get('PY_GOOGLE_AUTH_SESSION_CACHE_KEY') or None)
+
+
+def get_backend():
+    '''
+    Returns the backend profiles are kept in, None if they are not to be cached.
+    '''
+    global _backend
+
+    spec = os.environ.get('PY_GOOGLE_AUTH_TFA_PROFILES')
+
+    # keys made with a secret known to clients (like the access token) would let them tell
+    # which emails have a profile, and find the default method of an account from its email.
+    if not spec or get_secret() is None:
+        return None
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                ttl = int(os.environ.get('PY_GOOGLE_AUTH_TFA_PROFILE_TTL', DEFAULT_TTL))
+                size = int(os.environ.get('PY_GOOGLE_AUTH_TFA_PROFILE_SIZE', DEFAULT_SIZE))
+                _backend = session_store.create_backend(spec, ttl, size, 'tfa_profiles')
+
+    return _backend
+
+
+def get_key(email):
+    '''
+    Key of an account's profile, None if profiles are not cached. Emails are not kept as they
+    are, keys are an HMAC of them with the secret of the server (see `get_secret`).
+    '''
+    if get_backend() is None:
+        return None
+
+    secret = get_secret().encode('utf-8')
+    return hmac.new(secret, email.strip().lower().encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def lookup(key, challenge_url):
+    '''
+    Returns the profile of an account if it is cached and google is showing the challenge of its
+    default method (at `challenge_url`), else None; a profile with another default is dropped.
+    '''
+    backend = get_backend()
+
+    if backend is None or key is None:
+        return None
+
+    value = backend.get(key)
+
+    if value is None:
+        metrics.increment(metrics.TFA_PROFILES, result='miss')
+        return None
+
+    profile = json.loads(value)
+    protocol = utils.get_method_names()[profile['default_method']][1]
+
+    if '/challenge/%s/' % protocol not in challenge_url:
+        backend.delete(key)
+        metrics.increment(metrics.TFA_PROFILES, result='stale')
+        return None
+
+    metrics.increment(metrics.TFA_PROFILES, result='hit')
+    return profile
+
+
+def save(key, default_method, methods=None, number=None):
+    '''
+    Caches the profile of an account; methods not known are kept from the cached profile.
+    '''
+    backend = get_backend()
+
+    if backend is None or key is None:
+        return
+
+    if methods is None:
+        value = backend.get(key)
+        methods = json.loads(value).get('methods') if value is not None else None
+
+    backend.set(key, json.dumps({'default_method': default_method, 'methods': methods,
+                                 'number': number}))
+
+
+def save_methods(key, methods):
+    '''
+    Adds the methods collected after login to the cached profile of an account.
+    '''
+    backend = get_backend()
+
+    if backend is None or key is None:
+        return
+
+    value = backend.get(key)
+
+    if value is not None:
+        profile = json.loads(value)
+        profile['methods'] = methods
+        backend.set(key, json.dumps(profile))
+
+
+def invalidate(key):
+    backend = get_backend()
+
+    if backend is not None and key is not None:
+        backend.delete(key)
+        metrics.increment(metrics.TFA_PROFILES, result='invalidated')
+
+
+def hold(key):
+    '''
+    Keeps the key of a login in progress on server; returns a handle to it to be kept in the
+    session instead, None if profiles are not cached.
+    '''
+    backend = get_backend()
+
+    if backend is None or key is None:
+        return None
+
+    return session_store.SessionStore(backend).put(key)
+
+
+def resolve(handle):
+    '''
+    Returns the key held for a handle, None if the handle is not known.
+    '''
+    backend = get_backend()
+
+    if backend is None or not session_store.is_handle(handle):
+        return None
+
+    try:
+        return session_store.SessionStore(backend).get(handle)
+    except session_store.SessionExpired:
+        return None
+
+
+def release(handle):
+    '''
+    Forgets the key held for a handle, once the login is complete.
+    '''
+    backend = get_backend()
+
+    if backend is not None and session_store.is_handle(handle):
+        session_store.SessionStore(backend).delete(handle)
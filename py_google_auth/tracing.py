@@ -0,0 +1,158 @@
+'''
+Traces of where the time of a request went, for finding out why a login was slow.
+
+A traced request records a span for every request to google, every part of a page that was
+parsed and every session serialized or deserialized (the points timed in `metrics`). The spans
+are sent back, added up by name, in a `Server-Timing` header:
+
+    Server-Timing: upstream.service_login;dur=212.3, parse.payload;dur=1.9, ..., total;dur=530.2
+
+and written as a json record to the `py_google_auth.trace` logger, which goes to the file in
+`PY_GOOGLE_AUTH_TRACE_FILE` if it is set.
+
+Tracing is off by default; `PY_GOOGLE_AUTH_TRACE_RATE` is the fraction of requests traced, e.g.
+`0.01` for one in a hundred, which is cheap enough to leave on in production.
+'''
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger('py_google_auth.trace')
+
+_current = contextvars.ContextVar('py_google_auth_trace', default=None)
+_handler_lock = threading.Lock()
+_handler_path = None
+
+
+class Trace(object):
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.spans = []
+        self.token = None
+
+
+def get_rate():
+    try:
+        return float(os.environ.get('PY_GOOGLE_AUTH_TRACE_RATE', 0))
+    except ValueError:
+        return 0
+
+
+def setup_logger():
+    '''
+    Writes trace records to `PY_GOOGLE_AUTH_TRACE_FILE`, if set; the handler is added once.
+    '''
+    global _handler_path
+
+    path = os.environ.get('PY_GOOGLE_AUTH_TRACE_FILE')
+
+    if not path or path == _handler_path:
+        return
+
+    with _handler_lock:
+        if path != _handler_path:
+            handler = logging.FileHandler(path)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            _handler_path = path
+
+
+def start():
+    '''
+    Starts tracing the current request if it is sampled; returns the trace or None.
+    '''
+    rate = get_rate()
+
+    if rate <= 0 or random.random() >= rate:
+        return None
+
+    trace = Trace()
+    trace.token = _current.set(trace)
+    return trace
+
+
+def add_span(name, seconds):
+    '''
+    Records a span which just ended in the trace of the current request, if it is traced.
+    '''
+    trace = _current.get()
+
+    if trace is not None:
+        end = time.perf_counter() - trace.start
+        trace.spans.append((name, end - seconds, seconds))
+
+
+def server_timing(trace, total):
+    '''
+    Value of the `Server-Timing` header: spans of the same name added up, then the total.
+    '''
+    durations = {}
+    counts = {}
+
+    for name, start, seconds in trace.spans:
+        durations[name] = durations.get(name, 0) + seconds
+        counts[name] = counts.get(name, 0) + 1
+
+    metrics = []
+
+    for name in sorted(durations, key=lambda name: -durations[name]):
+        metric = '%s;dur=%.1f' % (name, durations[name] * 1000)
+
+        if counts[name] > 1:
+            metric += ';desc="x%d"' % counts[name]
+
+        metrics.append(metric)
+
+    metrics.append('total;dur=%.1f' % (total * 1000))
+    return ', '.join(metrics)
+
+
+def finish(trace, resource, status):
+    '''
+    Ends a trace; writes its record and returns the value of the `Server-Timing` header.
+    '''
+    total = time.perf_counter() - trace.start
+
+    if trace.token is not None:
+        _current.reset(trace.token)
+        trace.token = None
+
+    setup_logger()
+
+    if logger.isEnabledFor(logging.INFO):
+        record = {'time': trace.wall_start,
+                  'pid': os.getpid(),
+                  'resource': resource,
+                  'status': status,
+                  'duration': total,
+                  'spans': [{'name': name, 'start': start, 'duration': seconds}
+                            for name, start, seconds in trace.spans]}
+        logger.info(json.dumps(record))
+
+    return server_timing(trace, total)
+
+
+class TraceMiddleware(object):
+    '''
+    Falcon middleware tracing sampled requests.
+    '''
+
+    def process_request(self, req, resp):
+        req.context['trace'] = start()
+
+    def process_response(self, req, resp, resource, req_succeeded=True):
+        trace = req.context.get('trace')
+
+        if trace is None:
+            return
+
+        name = type(resource).__name__ if resource is not None else 'none'
+        resp.set_header('Server-Timing', finish(trace, name, int(resp.status.split(' ')[0])))
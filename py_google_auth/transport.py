@@ -0,0 +1,137 @@
+'''
+Connections to google shared by all the logins in a process.
+
+Every login used to get a new `requests.Session`, and with it new connection pools, so each
+request to the API paid a new TCP and TLS handshake to accounts.google.com (and one more to
+content.googleapis.com for Google prompt). Sessions created here all use one `HTTPAdapter`, whose
+pools keep connections alive per upstream host. Cookies are kept by the session, not the adapter,
+so every user's cookie jar stays separate.
+
+Pool sizes are configured with environment variables:
+    * `PY_GOOGLE_AUTH_POOL_HOSTS`: number of hosts to keep pools for (default 10).
+    * `PY_GOOGLE_AUTH_POOL_SIZE`: connections kept alive per host (default 50).
+'''
+
+import os
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+
+class SharedAdapter(HTTPAdapter):
+    '''
+    The adapter shared by sessions. It must outlive them, so closing a session does not close it.
+    '''
+
+    def send(self, request, **kwargs):
+        # time every request to google, by step of the login (see `metrics`).
+        start = time.perf_counter()
+
+        try:
+            return HTTPAdapter.send(self, request, **kwargs)
+        finally:
+            metrics.observe_upstream(request.method, request.url, time.perf_counter() - start)
+
+    def close(self):
+        pass
+
+    def close_pools(self):
+        HTTPAdapter.close(self)
+
+
+_adapter = None
+_adapter_pid = None
+_lock = threading.Lock()
+
+
+def get_adapter():
+    '''
+    Returns the adapter of current process; a forked worker does not reuse its parent's sockets.
+    '''
+    global _adapter, _adapter_pid
+
+    if _adapter is None or _adapter_pid != os.getpid():
+        with _lock:
+            if _adapter is None or _adapter_pid != os.getpid():
+                hosts = int(os.environ.get('PY_GOOGLE_AUTH_POOL_HOSTS', 10))
+                size = int(os.environ.get('PY_GOOGLE_AUTH_POOL_SIZE', 50))
+                _adapter = SharedAdapter(pool_connections=hosts, pool_maxsize=size)
+                _adapter_pid = os.getpid()
+
+    return _adapter
+
+
+def attach(session):
+    '''
+    Makes a session use the shared connections.
+    '''
+    adapter = get_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def detach(session):
+    '''
+    Gives a session its own adapters again; needed before a session is encoded with jsonpickle
+    for a client, which must not get (or need) the shared pools.
+    '''
+    session.mount('https://', HTTPAdapter())
+    session.mount('http://', HTTPAdapter())
+    return session
+
+
+def new_session():
+    '''
+    Returns a new session using the shared connections.
+    '''
+    return attach(requests.session())
+
+
+def get_stats():
+    '''
+    Returns statistics of the pool of every upstream host: requests made, connections opened for
+    them (misses) and requests which reused a kept alive connection (hits).
+    '''
+    stats = []
+
+    if _adapter is None or _adapter_pid != os.getpid():
+        return stats
+
+    pools = _adapter.poolmanager.pools
+
+    for key in pools.keys():
+        pool = pools.get(key)
+
+        if pool is None:
+            continue
+
+        requests_made = pool.num_requests
+        connections = pool.num_connections
+
+        stats.append({'scheme': pool.scheme,
+                      'host': pool.host,
+                      'port': pool.port,
+                      'requests': requests_made,
+                      'hits': max(requests_made - connections, 0),
+                      'misses': connections,
+                      'idle': pool.pool.qsize() if pool.pool is not None else 0})
+
+    return stats
+
+
+def close():
+    '''
+    Closes all the shared connections.
+    '''
+    global _adapter
+
+    with _lock:
+        if _adapter is not None:
+            _adapter.close_pools()
+            _adapter = None
@@ -0,0 +1,22 @@
+'''
+Base urls of the google services the API logs in with.
+
+They can be changed with environment variables, so that the API can be run against a local stand-in
+for google (see `stub`):
+    * `PY_GOOGLE_AUTH_ACCOUNTS_URL`: google accounts (default https://accounts.google.com).
+    * `PY_GOOGLE_AUTH_CONTENT_URL`: api waiting for Google prompt (default
+      https://content.googleapis.com).
+'''
+
+import os
+
+ACCOUNTS_URL = 'https://accounts.google.com'
+CONTENT_URL = 'https://content.googleapis.com'
+
+
+def get_accounts_url():
+    return os.environ.get('PY_GOOGLE_AUTH_ACCOUNTS_URL', ACCOUNTS_URL).rstrip('/')
+
+
+def get_content_url():
+    return os.environ.get('PY_GOOGLE_AUTH_CONTENT_URL', CONTENT_URL).rstrip('/')
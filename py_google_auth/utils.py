@@ -1,48 +1,119 @@
-import jsonpickle
+import copy
+import getpass
 import logging
 import os
 import platform
-import requests
-import time
 
-from bs4 import BeautifulSoup
+from . import error_log
+from . import metrics
+from . import session_codec
+from . import session_store
+from .page import Page
 
-# directory path for storing log files in case of unhandled cases.
-try:
-    log_dir = os.environ['PY_GOOGLE_AUTH_LOG_PATH']
-except:
-    system_user = os.environ['USER']
-    dir_ = "/home/" + system_user + "/logs/py_google_auth"
+# directory path for storing log files in case of unhandled cases, see `get_log_dir`.
+_log_dir = None
 
-    if not os.path.isdir(dir_):
-        os.makedirs(dir_)
 
-    log_dir = dir_ + "/"
-    logging.warning("You have not set a path for error logging, using " + dir_)
-else:
-    if not log_dir.endswith("/"):
-        log_dir = log_dir + "/"
+def get_log_dir():
+    '''
+    Returns the directory for storing log files, resolved (and created, if it is the default one)
+    the first time a page is logged rather than when the module is imported.
+    '''
+    global _log_dir
+
+    if _log_dir is not None:
+        return _log_dir
+
+    try:
+        log_dir = os.environ['PY_GOOGLE_AUTH_LOG_PATH']
+    except KeyError:
+        system_user = getpass.getuser()
+        dir_ = "/home/" + system_user + "/logs/py_google_auth"
+
+        if not os.path.isdir(dir_):
+            os.makedirs(dir_, exist_ok=True)
+
+        log_dir = dir_ + "/"
+        logging.warning("You have not set a path for error logging, using " + dir_)
+    else:
+        if not log_dir.endswith("/"):
+            log_dir = log_dir + "/"
+
+    _log_dir = log_dir
+    return _log_dir
 
 
+def encode_session(session):
+    '''
+    Takes a session object and encodes the state needed to continue the login into a string; the
+    format is explained in `session_codec`.
+    '''
+    return session_codec.encode(session)
+
+
+def decode_session(session):
+    '''
+    Takes a string produced by `encode_session` and deserializes it into a session object.
+    '''
+    return session_codec.decode(session)
+
+
+@metrics.timed(metrics.SESSION_SECONDS, operation='serialize')
 def serialize_session(session):
     '''
-    Takes a session object and serializes its attribute dictionary.
+    Prepares a session of a login in progress to be sent to the client.
+    If a session store is configured (see `session_store`), the session is kept on server and a
+    handle to it is returned, else the session itself is encoded.
     '''
 
-    session_dict = session.__dict__
-    encoded = jsonpickle.encode(session_dict)
-    return encoded
+    store = session_store.get_store()
+
+    if store is None:
+        return encode_session(session)
 
+    if store.keeps_objects:
+        return store.put(session)
 
+    return store.put(encode_session(session))
+
+
+@metrics.timed(metrics.SESSION_SECONDS, operation='deserialize')
 def deserialize_session(session):
     '''
-    Takes a dictionary having a session object's atributes and deserializes it into a sessoin
-    object.
+    Returns the session object for what was sent by the client, that is either a handle to a stored
+    session or an encoded session.
+    Raises `session_store.SessionExpired` if the handle is not known (anymore).
     '''
 
-    decoded = jsonpickle.decode(session)
-    new_session = requests.session()
-    new_session.__dict__.update(decoded)
+    if not session_store.is_handle(session):
+        return decode_session(session)
+
+    store = session_store.get_store()
+
+    if store is None:
+        raise session_store.SessionExpired(session)
+
+    stored = store.get(session)
+
+    if not store.keeps_objects:
+        return decode_session(stored)
+
+    # the stored object must stay as it was, since the same handle can be sent again (e.g. to
+    # retry with another otp), so work on a copy of it.
+    return copy_session(stored)
+
+
+def copy_session(session):
+    '''
+    Returns a copy of a session (with the variables stuffed in it) that can be used without
+    affecting the original one; connections are still shared.
+    '''
+
+    new_session = object.__new__(type(session))
+    new_session.__dict__ = {key: copy.copy(value) if isinstance(value, dict) else value
+                            for key, value in session.__dict__.items()}
+    new_session.cookies = session.cookies.copy()
+    new_session.headers = session.headers.copy()
     return new_session
 
 
@@ -53,7 +124,8 @@ def clean_session(session):
     This method removes those extra attributes.
     '''
 
-    attrs = ['next_url', 'q_params', 'select_method_url', 'prev_payload']
+    attrs = ['next_url', 'q_params', 'query_params', 'select_method_url', 'prev_payload',
+             'methods_job', 'methods', 'method_forms']
     for attr in attrs:
         if attr in session.__dict__:
             session.__delattr__(attr)
@@ -61,6 +133,29 @@ def clean_session(session):
     return session
 
 
+def parse_page(page):
+    '''
+    Returns a `page.Page` for the given page so that it is parsed only once however many
+    extractors look at it.
+    `page` can be the text of a page, an already parsed page or a response object; in the last case
+    the parsed page is stored on the response and reused on the next call.
+    '''
+
+    if isinstance(page, Page):
+        return page
+
+    if isinstance(page, str):
+        return Page(page)
+
+    parsed = getattr(page, 'parsed_page', None)
+
+    if parsed is None:
+        parsed = Page(page.text, page.url)
+        page.parsed_page = parsed
+
+    return parsed
+
+
 def make_payload(page):
     '''
     Function to get necesary data i.e. cookies and form hidden fields from a login form page
@@ -75,17 +170,10 @@ def make_payload(page):
     These are common to all requests, others specific to a method are used in the method specific
     functions and are briefed there.
         '''
-    payload = {}
-
-    # collect all inputs from the form, these contains the parameters for payload.
-    input_elements = BeautifulSoup(page).find('form').find_all('input')
 
-    # create a payload dictionary
-    for item in input_elements:
-        if item.has_attr('value') and item.has_attr('name'):
-            payload[item['name']] = item['value']
-
-    return payload
+    # the parsed page keeps the payload for other callers, so hand out a copy which callers are
+    # free to modify.
+    return dict(parse_page(page).payload)
 
 
 def get_method_names():
@@ -107,20 +195,15 @@ def get_available_methods(page):
     It collects all the available mthods for two factor auth from the form for select method.
     '''
 
-    available_methods = []
     error = None
+    page = parse_page(page)
 
     try:
-        soup = BeautifulSoup(page)
-
-        # the html elemnets containing method names
-        method_spans = soup.find_all('span', class_="mSMaIe")
-
-        for item in method_spans:
-            available_methods.append(item.text)
+        # names from the html elemnets containing method names
+        available_methods = list(page.methods)
 
     except:
-        file_name, hostname = log_error("select alternate", page)
+        file_name, hostname = log_error("select alternate", page.text)
         error = 500
         response = {'file_name': file_name, 'hostname': hostname}
 
@@ -136,52 +219,33 @@ def get_query_params(page):
     So prepare them before sending response.
     '''
 
-    # get the key and id to make call to `await_url`
-    soup = BeautifulSoup(page)
-    div_with_key_id = soup.find('div', class_='LJtPoc')
+    page = parse_page(page)
 
-    try:
-        # this is a query parameter sent with `await_url` in `step_two_utils.login_with_prompt`
-        # method.
-        key = div_with_key_id.get('data-api-key')
+    # get the key and id to make call to `await_url`; key is a query parameter sent with
+    # `await_url` in `step_two_utils.login_with_prompt` method and txId is a payload item sent in
+    # POST request to `await_url`.
+    query_params = page.query_params
 
-        # a payload item sent in POST request to `await_url`.
-        txId = div_with_key_id.get('data-tx-id')
-
-        data = {'key': key, 'txId': txId}
-
-    except:
+    if query_params is None:
         # log exception
-        file_name, hostname = log_error("second step login", page)
-        data = {}
+        file_name, hostname = log_error("second step login", page.text)
+        return {}
 
-    return data
+    return dict(query_params)
 
 
 def get_phone_number(page):
     '''
     Function to extract phone number to which otp is sent, from the response page.
     '''
-    soup = BeautifulSoup(page)
-    number_container = soup.find(class_="DZNRQe")
-    number = number_container.text
-
-    return number
+    return parse_page(page).phone_number
 
 
 def scrap_error(page):
     '''
     This function scraps an error message (if exist) from a response page.
     '''
-    soup = BeautifulSoup(page)
-    error_span = soup.find('span', id='errorMsg')
-
-    if error_span:
-        error = error_span.text
-    else:
-        error = None
-
-    return error
+    return parse_page(page).error
 
 
 def log_error(step, content):
@@ -192,11 +256,11 @@ def log_error(step, content):
     select_alternate.
             It makes it easy to identify the file in logs.
     `content`: content to log.
+
+    The page is written in background (see `error_log`), this returns the name its file will
+    have right away.
     '''
-    file_name = step + "- " + time.strftime("%d-%m-%Y %H-%M-%S") + ".html"
-    f = open(log_dir+file_name, 'w')
-    f.write(content)
-    f.close()
+    file_name = error_log.capture(get_log_dir(), step, content)
 
     # hostname of the machine where the py-google-auth is running
     hostname = platform.node()
@@ -204,14 +268,18 @@ def log_error(step, content):
     return file_name, hostname
 
 
-def handle_default_method(default_method, response, session):
+def handle_default_method(default_method, response, session, phone_num=None):
     '''
     This function is used when the default method is not available.
+    `phone_num`: number text messages are sent to, if it is already known.
     '''
     response_data = {}
 
+    # parse the response once for all the extractors below.
+    page = parse_page(response)
+
     # create payload from response text
-    payload = make_payload(response.text)
+    payload = make_payload(page)
 
     # current response url is used to make next POST call for second step of login and
     # payload contains parameters that are to be sent with POST request, since we need
@@ -225,12 +293,13 @@ def handle_default_method(default_method, response, session):
     # POST request to an api where prompt's respose is recorded to know what user has
     # responded for prompt. saving them into query_params.
     if default_method == 1:
-        query_params = get_query_params(response.text)
+        query_params = get_query_params(page)
         session.query_params = query_params
 
     # if default method is text message, get the phone number to which otp was sent.
     if default_method == 3:
-        phone_num = get_phone_number(response.text)
+        if phone_num is None:
+            phone_num = get_phone_number(page)
         response_data['number'] = phone_num
 
     response_data['default_method'] = default_method
@@ -0,0 +1,146 @@
+'''
+Check whether many sessions are still signed in with one request.
+
+`/sessions/validate` takes a list of sessions, as sent by the other endpoints (encoded sessions of
+complete logins, or handles to stored ones, see `session_store`), and checks them concurrently
+with a single request to google each (see `login_utils.check_session`), over the shared
+connections. The response has the result of every session, in the order they were sent:
+
+    {"sessions": [{"index": 0, "status": "live"}, {"index": 1, "status": "expired"}, ...]}
+
+`status` is `live` if the session is signed in, `expired` if it is not (or it was a handle to a
+session which is not stored anymore), `unknown` if google could not be reached and `invalid` if it
+could not be decoded. A session sent more than once is checked once.
+
+Limits are configured with environment variables:
+    * `PY_GOOGLE_AUTH_VALIDATE_CONCURRENCY`: sessions checked at once (default 16); a request can
+      ask for less with `concurrency`. More than the connections kept per host (see `transport`)
+      opens connections which are not kept.
+    * `PY_GOOGLE_AUTH_VALIDATE_SIZE`: sessions accepted in a request (default 1000).
+'''
+
+import concurrent.futures
+import http.cookiejar
+import json
+import os
+
+import falcon
+import requests
+
+from . import login
+from . import login_utils
+from . import session_store
+from . import utils
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_SIZE = 1000
+
+
+def get_concurrency(requested=None):
+    '''
+    Number of sessions to check at once.
+    '''
+    concurrency = int(os.environ.get('PY_GOOGLE_AUTH_VALIDATE_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+    if requested is not None:
+        concurrency = min(concurrency, requested)
+
+    return max(concurrency, 1)
+
+
+def verify_sessions(req, resp, resource, params):
+    '''
+    Decorator method to verify that a valid list of sessions was sent with the request.
+    '''
+    data = req.stream
+
+    sessions = data.get('sessions')
+    size = int(os.environ.get('PY_GOOGLE_AUTH_VALIDATE_SIZE', DEFAULT_SIZE))
+
+    if not isinstance(sessions, list) or not sessions:
+        msg = 'Send a list of sessions.'
+        raise falcon.HTTPBadRequest('No sessions', msg)
+
+    if len(sessions) > size:
+        msg = 'At most %d sessions can be sent at once.' % size
+        raise falcon.HTTPBadRequest('Too many sessions', msg)
+
+    if not all(isinstance(session, str) for session in sessions):
+        msg = 'Each session should be a string, as it was received.'
+        raise falcon.HTTPBadRequest('Invalid sessions', msg)
+
+    concurrency = data.get('concurrency')
+
+    if concurrency is not None and (not isinstance(concurrency, int) or concurrency < 1):
+        msg = 'Concurrency should be a positive number.'
+        raise falcon.HTTPBadRequest('Invalid concurrency', msg)
+
+
+def check_session(session):
+    '''
+    Deserializes a session sent with the request and returns its status.
+    '''
+
+    try:
+        session = utils.deserialize_session(session)
+    except session_store.SessionExpired:
+        return 'expired'
+    # a session that is not one of ours fails in any way, e.g. `'123'` decodes to a number.
+    except Exception:
+        return 'invalid'
+
+    # decoded, but into something which can't be sent to google.
+    if not isinstance(session, requests.Session) or \
+            not isinstance(session.cookies, http.cookiejar.CookieJar):
+        return 'invalid'
+
+    valid = login_utils.check_session(session)
+
+    if valid is None:
+        return 'unknown'
+
+    return 'live' if valid else 'expired'
+
+
+def check_sessions(sessions, concurrency):
+    '''
+    Returns the status of every session, in the order they were sent.
+    '''
+    # the same session is checked once, whichever number of times it was sent.
+    unique = list(dict.fromkeys(sessions))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(concurrency, len(unique)))
+
+    try:
+        futures = {executor.submit(check_session, session): session for session in unique}
+        statuses = {}
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                statuses[futures[future]] = future.result()
+            except Exception:
+                statuses[futures[future]] = 'unknown'
+
+    finally:
+        executor.shutdown(wait=False)
+
+    return [statuses[session] for session in sessions]
+
+
+@falcon.before(login.verify_data_exist)
+@falcon.before(login.validate_request)
+@falcon.before(verify_sessions)
+class ValidateSessions(object):
+    '''
+    Handles checking many sessions at once.
+    '''
+    def on_post(self, req, resp):
+
+        # set in the decorator method for request validation.
+        data = req.stream
+
+        statuses = check_sessions(data['sessions'], get_concurrency(data.get('concurrency')))
+
+        resp.status = falcon.HTTP_200
+        resp.body = json.dumps({'sessions': [{'index': index, 'status': status}
+                                             for index, status in enumerate(statuses)]})
@@ -37,14 +37,18 @@ setup(
     package_data={'': ['LICENSE']},
     package_dir={'py_google_auth': 'py_google_auth'},
     include_package_data=True,
+    python_requires='>=3.7',
     install_requires=requires,
+    extras_require={'lxml': ['lxml'], 'async': ['aiohttp'], 'cache': ['cryptography']},
     license='MIT License',
     zip_safe=False,
     classifiers=(
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Development Status :: 4 - Beta',
         'Natural Language :: English',
         'Environment :: Web Environment',
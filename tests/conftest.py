@@ -0,0 +1,100 @@
+'''
+Fixtures of the tests: the API is run in process, against the stand-in for google (see `stub`).
+'''
+
+import json
+
+import falcon.testing
+import pytest
+
+from py_google_auth import session_cache
+from py_google_auth import session_store
+from py_google_auth import stub
+from py_google_auth import tfa_profile
+from py_google_auth import utils
+
+TOKEN = 'test-token'
+
+
+class Response(object):
+    '''
+    Status and body (parsed as json when asked for) of a request simulated with `Client`.
+    '''
+
+    def __init__(self, status, body):
+        self.status = status
+        self.code = int(status.split(' ')[0])
+        self.text = body
+
+    @property
+    def json(self):
+        return json.loads(self.text) if self.text else None
+
+
+class Client(object):
+    '''
+    Makes requests to the falcon app, with the access token of the tests.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    def post(self, path, **data):
+        data['token'] = TOKEN
+        return self.simulate('POST', path, body=json.dumps(data))
+
+    def get(self, path, query_string=''):
+        return self.simulate('GET', path, query_string='token=%s&%s' % (TOKEN, query_string))
+
+    def delete(self, path):
+        return self.simulate('DELETE', path, query_string='token=%s' % TOKEN)
+
+    def simulate(self, method, path, **kwargs):
+        environ = falcon.testing.create_environ(path, method=method, **kwargs)
+        start_response = falcon.testing.StartResponseMock()
+        body = b''.join(self.app(environ, start_response))
+        return Response(start_response.status, body.decode('utf-8'))
+
+
+@pytest.fixture(scope='session')
+def google():
+    '''
+    Url of the stand-in for google, run for the whole session.
+    '''
+    server, url = stub.start(options=stub.Options(padding=1000))
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def environment(google, monkeypatch, tmpdir):
+    '''
+    Points the API at the stand-in with the default configuration, logging pages to a temporary
+    directory.
+    '''
+    monkeypatch.setenv('PY_GOOGLE_AUTH_ACCOUNTS_URL', google)
+    monkeypatch.setenv('PY_GOOGLE_AUTH_CONTENT_URL', google)
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TOKEN', TOKEN)
+    monkeypatch.setenv('PY_GOOGLE_AUTH_LOG_PATH', str(tmpdir))
+
+    for name in ('PY_GOOGLE_AUTH_SESSION_STORE', 'PY_GOOGLE_AUTH_SESSION_CACHE',
+                 'PY_GOOGLE_AUTH_SESSION_CACHE_KEY', 'PY_GOOGLE_AUTH_TFA_PROFILES',
+                 'PY_GOOGLE_AUTH_TFA_PROFILE_KEY', 'PY_GOOGLE_AUTH_KEEPALIVE',
+                 'PY_GOOGLE_AUTH_PROMPT_WAIT'):
+        monkeypatch.delenv(name, raising=False)
+
+    # configured once per process otherwise.
+    monkeypatch.setattr(utils, '_log_dir', None)
+    monkeypatch.setattr(session_store, '_store', None)
+    monkeypatch.setattr(session_cache, '_cache', None)
+    monkeypatch.setattr(tfa_profile, '_backend', None)
+
+    return google
+
+
+@pytest.fixture
+def client(environment):
+    from py_google_auth import app
+
+    return Client(app.app)
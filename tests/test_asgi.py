@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from py_google_auth import asgi  # noqa: E402
+from py_google_auth import keepalive  # noqa: E402
+
+
+@pytest.fixture
+def kept_alive(environment, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_KEEPALIVE', 'memory')
+    monkeypatch.setattr(keepalive, '_scheduler', None)
+    monkeypatch.setattr(keepalive, 'register',
+                        lambda encoded: pytest.fail('session registered for keep alive'))
+
+
+def test_login_not_kept_alive(kept_alive):
+    status, data = asyncio.run(asgi.normal_login({'email': 'user@example.com',
+                                                  'password': 'secret'}))
+
+    assert status.startswith('200')
+    assert 'keepalive' not in data
+
+
+def test_step_two_login_not_kept_alive(kept_alive):
+    status, data = asyncio.run(asgi.normal_login({'email': 'user+totp@example.com',
+                                                  'password': 'secret'}))
+
+    assert status.startswith('303')
+
+    status, data = asyncio.run(asgi.step_two_login({'session': data['session'], 'method': 2,
+                                                    'otp': '123456'}))
+
+    assert status.startswith('200')
+    assert 'keepalive' not in data
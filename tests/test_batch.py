@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from py_google_auth import batch
+
+from .test_login import is_signed_in
+
+
+def results(response):
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return {result['index']: result for result in lines}
+
+
+def test_batch(client):
+    accounts = [{'email': 'user@example.com', 'password': 'secret'},
+                {'email': 'user+totp@example.com', 'password': 'secret'},
+                {'email': 'user@example.com', 'password': 'wrong'},
+                {'email': 'captcha@example.com', 'password': 'secret'},
+                {'email': 'user@example.com'},
+                'user@example.com']
+
+    response = client.post('/login/batch', accounts=accounts, concurrency=2)
+
+    assert response.code == 200
+
+    by_index = results(response)
+
+    assert sorted(by_index) == list(range(len(accounts)))
+    assert [by_index[index]['status'] for index in range(len(accounts))] == \
+        [200, 303, 401, 429, 400, 400]
+    assert by_index[0]['email'] == 'user@example.com'
+    assert by_index[5]['email'] is None
+    assert is_signed_in(by_index[0]['body']['session'])
+    assert by_index[1]['body']['default_method'] == 2
+
+
+def test_failed_login(client, monkeypatch):
+    def fail(email, password):
+        raise ValueError('failed')
+
+    monkeypatch.setattr(batch.login, 'attempt_login', fail)
+
+    response = client.post('/login/batch',
+                           accounts=[{'email': 'user@example.com', 'password': 'secret'}])
+
+    assert results(response)[0]['status'] == 500
+
+
+@pytest.mark.parametrize('data', [{}, {'accounts': []}, {'accounts': 'user@example.com'},
+                                  {'accounts': [{}] * 3, 'concurrency': 0},
+                                  {'accounts': [{}] * 3, 'concurrency': '2'}])
+def test_invalid_request(client, data):
+    assert client.post('/login/batch', **data).code == 400
+
+
+def test_too_many_accounts(client, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_BATCH_SIZE', '2')
+
+    assert client.post('/login/batch', accounts=[{}] * 3).code == 400
+
+
+def test_concurrency(monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_BATCH_CONCURRENCY', '4')
+
+    assert batch.get_concurrency() == 4
+    assert batch.get_concurrency(2) == 2
+    assert batch.get_concurrency(10) == 4
@@ -0,0 +1,66 @@
+import pytest
+
+from py_google_auth import command
+
+server = pytest.importorskip('py_google_auth.server')
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(server, 'run', lambda *args: calls.append(args))
+
+    return calls
+
+
+def resolved(app_uri, settings, config, defaults):
+    resolved = dict(defaults)
+    resolved.update(config)
+    resolved.update((name, value) for name, value in settings.items() if value is not None)
+
+    return app_uri, resolved
+
+
+def test_defaults(runs):
+    command.serve()
+    app_uri, settings = resolved(*runs[0])
+
+    assert app_uri == 'py_google_auth.app:app'
+    assert settings['bind'] == ['localhost:8001']
+    assert settings['workers'] == command.get_workers('sync')
+
+
+def test_config_file(runs, tmpdir):
+    config = tmpdir.join('gunicorn.conf.py')
+    config.write("bind = ['0.0.0.0:9000']\nworker_class = 'gevent'\n")
+
+    command.serve(config_file=str(config))
+    app_uri, settings = resolved(*runs[0])
+
+    assert app_uri == 'py_google_auth.gevent_app:app'
+    assert settings['bind'] == ['0.0.0.0:9000']
+    assert settings['worker_class'] == 'gevent'
+    assert settings['workers'] == command.get_workers('gevent')
+
+
+def test_options_override_config_file(runs, tmpdir):
+    config = tmpdir.join('gunicorn.conf.py')
+    config.write("bind = ['0.0.0.0:9000']\nworker_class = 'gevent'\n")
+
+    command.serve('127.0.0.1', '8080', 'sync', config_file=str(config))
+    app_uri, settings = resolved(*runs[0])
+
+    assert app_uri == 'py_google_auth.app:app'
+    assert settings['bind'] == ['127.0.0.1:8080']
+    assert settings['worker_class'] == 'sync'
+
+
+@pytest.mark.parametrize('worker_class', ['gevent', 'egg:gunicorn#gevent',
+                                          'gunicorn.workers.ggevent.GeventWorker'])
+def test_gevent_worker_class(worker_class):
+    assert server.is_gevent(worker_class)
+
+
+def test_address():
+    assert command.get_address([]) == (None, None)
+    assert command.get_address(['8080']) == ('localhost', '8080')
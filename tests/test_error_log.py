@@ -0,0 +1,93 @@
+import gzip
+import json
+import os
+import queue
+import time
+
+import pytest
+
+from py_google_auth import error_log
+from py_google_auth import metrics
+
+
+@pytest.fixture
+def directory(tmpdir):
+    return str(tmpdir)
+
+
+def pages(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.html.gz'))
+
+
+def read_index(directory, name):
+    with open(os.path.join(directory, name + '.json')) as f:
+        return json.load(f)
+
+
+def set_last_seen(directory, name, seen):
+    os.utime(os.path.join(directory, name + '.json'), (seen, seen))
+
+
+def test_same_page_stored_once(directory):
+    first = error_log.capture(directory, 'login', '<p>odd page</p>')
+    error_log.capture(directory, 'login', '<p>odd page</p>')
+    other = error_log.capture(directory, 'login', '<p>other page</p>')
+
+    assert error_log.flush()
+    assert first != other
+    assert pages(directory) == sorted([first, other])
+
+    with gzip.open(os.path.join(directory, first), 'rt', encoding='utf-8') as f:
+        assert f.read() == '<p>odd page</p>'
+
+    index = read_index(directory, first[:-len('.html.gz')])
+
+    assert index['step'] == 'login'
+    assert index['hits'] == 2
+    assert index['last_seen'] >= index['first_seen']
+
+
+def test_dropped_when_queue_full(directory, monkeypatch):
+    counters = {}
+    full = queue.Queue(maxsize=1)
+    full.put_nowait(None)
+
+    monkeypatch.setattr(metrics, '_counters', counters)
+    monkeypatch.setattr(error_log, '_queue', full)
+    monkeypatch.setattr(error_log, '_queue_pid', os.getpid())
+
+    name = error_log.capture(directory, 'login', '<p>odd page</p>')
+
+    assert name.endswith('.html.gz')
+    assert counters[(metrics.ERROR_PAGES_DROPPED, ())] == 1
+
+
+def test_rotate_by_age(directory, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_LOG_MAX_AGE', '60')
+    now = time.time()
+
+    for name, seen in [('login-old', now - 61), ('login-new', now - 59)]:
+        error_log.write_page(directory, 'login', name, name, now)
+        set_last_seen(directory, name, seen)
+
+    error_log.rotate(directory)
+
+    assert pages(directory) == ['login-new.html.gz']
+    assert not os.path.exists(os.path.join(directory, 'login-old.json'))
+
+
+def test_rotate_by_size(directory, monkeypatch):
+    now = time.time()
+    names = ['login-%d' % index for index in range(4)]
+
+    for index, name in enumerate(names):
+        error_log.write_page(directory, 'login', name, os.urandom(500).hex(), now)
+        set_last_seen(directory, name, now - 10 + index)
+
+    size = sum(os.path.getsize(os.path.join(directory, name + '.html.gz')) for name in names[2:])
+    monkeypatch.setenv('PY_GOOGLE_AUTH_LOG_MAX_BYTES', str(size))
+
+    error_log.rotate(directory)
+
+    # the pages seen last are kept.
+    assert pages(directory) == [name + '.html.gz' for name in names[2:]]
@@ -0,0 +1,71 @@
+import pytest
+
+from py_google_auth import forms
+
+PAGE = '''
+<html><body>
+<form id="first" action="/one">
+  <input type="hidden" name="gxf" value="gxf-value">
+  <input type="hidden" name="TL" value="tl &amp; more">
+  <input type="submit" value="no name">
+  <input type="text" name="no-value">
+</form>
+<div><form action="/two">
+  <input name="challengeId" value="2">
+</form></div>
+</body></html>
+'''
+
+FORMS = [{'gxf': 'gxf-value', 'TL': 'tl & more'}, {'challengeId': '2'}]
+
+
+@pytest.fixture(params=forms.BACKENDS)
+def backend(request):
+    if request.param == 'lxml' and forms.etree is None:
+        pytest.skip('lxml is not installed')
+
+    return request.param
+
+
+def test_scan(backend):
+    assert forms.scan_forms(PAGE, backend=backend) == FORMS
+    assert forms.get_all_form_inputs(PAGE, backend) == FORMS
+
+
+@pytest.mark.parametrize('form_index', [0, 1])
+def test_form_at_index(backend, form_index):
+    assert forms.get_form_inputs(PAGE, form_index, backend) == FORMS[form_index]
+
+
+def test_stops_after_form(backend):
+    assert forms.scan_forms(PAGE, 0, backend) == FORMS[:1]
+
+
+def test_same_as_soup(backend):
+    assert forms.scan_forms(PAGE, backend=backend) == forms.soup_forms(PAGE, backend)
+
+
+def test_no_form(backend):
+    assert forms.get_form_inputs('<p>nothing here</p>', 0, backend) == {}
+    assert forms.get_all_form_inputs('<p>nothing here</p>', backend) == []
+
+
+def test_falls_back_to_soup(backend, monkeypatch):
+    def fail(page, form_index=None, backend=None):
+        raise ValueError('odd page')
+
+    monkeypatch.setattr(forms, 'scan_forms', fail)
+
+    assert forms.get_form_inputs(PAGE, 1, backend) == FORMS[1]
+    assert forms.get_all_form_inputs(PAGE, backend) == FORMS
+
+
+def test_configured_backend(monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_HTML_PARSER', 'html.parser')
+
+    assert forms.get_backend() == 'html.parser'
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        forms.get_backend('html5lib')
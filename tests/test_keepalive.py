@@ -0,0 +1,169 @@
+'''
+Keeping sessions signed in: `/keepalive/<id>` and the scheduler refreshing the sessions.
+'''
+
+import time
+
+import pytest
+
+from py_google_auth import keepalive
+from py_google_auth import session_store
+from py_google_auth import transport
+from py_google_auth import utils
+
+
+@pytest.fixture
+def kept_alive(client, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_KEEPALIVE', 'memory')
+    monkeypatch.setattr(keepalive, '_scheduler', None)
+
+    return client
+
+
+@pytest.fixture
+def scheduler(environment):
+    return make_scheduler()
+
+
+def make_scheduler(interval=1000, size=10):
+    return keepalive.Scheduler(session_store.MemoryBackend(3600, 100), interval, 3600, 2, size)
+
+
+def register(scheduler, encoded):
+    return scheduler.register(utils.decode_session(encoded), encoded)
+
+
+def refresh(scheduler, session_id):
+    # as the scheduler does, see `Scheduler.run`.
+    scheduler.slots.acquire()
+    scheduler.refresh(session_id)
+
+    return scheduler.read(session_id)
+
+
+def signed_in_session(client):
+    return client.post('/login', email='user@example.com', password='secret').json['session']
+
+
+def signed_out_session():
+    return utils.encode_session(transport.new_session())
+
+
+def test_keepalive(kept_alive):
+    login = kept_alive.post('/login', email='user@example.com', password='secret')
+    session_id = login.json['keepalive']
+
+    response = kept_alive.get('/keepalive/' + session_id)
+
+    assert response.code == 200
+    assert response.json['state'] == 'live'
+    assert response.json['session'] == login.json['session']
+
+    assert kept_alive.delete('/keepalive/' + session_id).code == 204
+    assert kept_alive.get('/keepalive/' + session_id).code == 404
+
+
+def test_keepalive_disabled(client):
+    login = client.post('/login', email='user@example.com', password='secret')
+
+    assert 'keepalive' not in login.json
+    assert client.get('/keepalive/unknown').code == 404
+
+
+def test_refresh(client, scheduler):
+    session_id = register(scheduler, signed_in_session(client))
+    registered = scheduler.read(session_id)
+
+    entry = refresh(scheduler, session_id)
+
+    assert entry['state'] == 'live'
+    assert entry['refreshed'] > registered['refreshed']
+    assert entry['due'] > entry['refreshed'] + 1000 * (1 - keepalive.JITTER) - 1
+    assert session_id in scheduler.sessions
+
+
+def test_refresh_signed_out(scheduler):
+    session_id = register(scheduler, signed_out_session())
+    entry = refresh(scheduler, session_id)
+
+    assert entry['state'] == 'signed_out'
+    assert entry['session'] is None
+    assert session_id not in scheduler.sessions
+
+
+def test_refresh_unreachable(client, scheduler, monkeypatch):
+    session_id = register(scheduler, signed_in_session(client))
+    registered = scheduler.read(session_id)
+
+    # nothing listens on the port of a closed server.
+    monkeypatch.setenv('PY_GOOGLE_AUTH_ACCOUNTS_URL', 'http://127.0.0.1:9')
+
+    entry = refresh(scheduler, session_id)
+
+    # tried again sooner.
+    assert entry['state'] == 'live'
+    assert entry['refreshed'] == registered['refreshed']
+    assert entry['due'] < time.time() + 1000 * keepalive.RETRY_FRACTION * (1 + keepalive.JITTER)
+
+
+def test_refresh_unregistered(client, scheduler):
+    session_id = register(scheduler, signed_in_session(client))
+    scheduler.backend.delete(session_id)
+
+    assert refresh(scheduler, session_id) is None
+    assert session_id not in scheduler.sessions
+
+
+def test_refresh_taken_over(client, scheduler):
+    session_id = register(scheduler, signed_in_session(client))
+    entry = scheduler.read(session_id)
+    entry['owner'] = 'other'
+    scheduler.write(session_id, entry)
+
+    assert refresh(scheduler, session_id) == entry
+    assert session_id not in scheduler.sessions
+
+
+def test_oldest_stopped(environment):
+    scheduler = make_scheduler(size=2)
+    session_ids = [register(scheduler, signed_out_session()) for _ in range(3)]
+
+    assert list(scheduler.sessions) == session_ids[1:]
+    assert scheduler.read(session_ids[0])['state'] == 'stopped'
+
+
+def test_sweep(client, scheduler):
+    encoded = signed_in_session(client)
+    now = time.time()
+
+    def entry(**values):
+        entry = {'state': 'live', 'session': encoded, 'refreshed': now, 'due': now,
+                 'until': now + 3600, 'owner': 'gone'}
+        entry.update(values)
+        return entry
+
+    scheduler.write('overdue', entry(due=now - keepalive.TAKEOVER_DELAY - 1))
+    scheduler.write('due', entry())
+    scheduler.write('signed_out', entry(state='signed_out', due=0))
+    scheduler.write('expired', entry(until=now - 1))
+
+    scheduler.sweep()
+
+    assert list(scheduler.sessions) == ['overdue']
+    assert scheduler.read('overdue')['owner'] == scheduler.owner
+    assert scheduler.read('due')['owner'] == 'gone'
+    assert scheduler.read('signed_out')['owner'] == 'gone'
+    assert scheduler.read('expired') is None
+
+
+def test_refreshed_when_due(client, environment):
+    scheduler = make_scheduler(interval=0.05)
+    session_id = register(scheduler, signed_in_session(client))
+    registered = scheduler.read(session_id)
+
+    for _ in range(100):
+        if scheduler.read(session_id)['refreshed'] > registered['refreshed']:
+            break
+        time.sleep(0.05)
+
+    assert scheduler.read(session_id)['refreshed'] > registered['refreshed']
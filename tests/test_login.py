@@ -0,0 +1,118 @@
+'''
+Login flows end to end: `/login`, `/step_two_login` and `/change_method` against the stand-in.
+'''
+
+from py_google_auth import stub
+from py_google_auth import utils
+
+
+def is_signed_in(encoded):
+    cookies = utils.decode_session(encoded).cookies
+    return all(name in cookies for name in stub.SIGNED_IN_COOKIES)
+
+
+def test_login(client):
+    response = client.post('/login', email='user@example.com', password='secret')
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
+
+
+def test_login_wrong_password(client):
+    response = client.post('/login', email='user@example.com', password='wrong')
+
+    assert response.code == 401
+
+
+def test_login_captcha(client):
+    response = client.post('/login', email='captcha@example.com', password='secret')
+
+    assert response.code == 429
+
+
+def test_login_without_password(client):
+    response = client.post('/login', email='user@example.com')
+
+    assert response.code == 400
+
+
+def test_login_wrong_token(client):
+    response = client.simulate('POST', '/login',
+                               body='{"token": "nope", "email": "a", "password": "b"}')
+
+    assert response.code == 400
+    assert response.json['title'] == 'Invalid Token'
+
+
+def test_login_two_factor(client):
+    response = client.post('/login', email='user+totp@example.com', password='secret')
+
+    assert response.code == 303
+    assert response.json['default_method'] == 2
+    assert len(response.json['methods']) == len(stub.METHODS)
+    assert response.json['session']
+
+
+def test_step_two_login(client):
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+    response = client.post('/step_two_login', session=login.json['session'], method=2,
+                           otp='123456')
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
+
+
+def test_step_two_login_wrong_code(client):
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+    response = client.post('/step_two_login', session=login.json['session'], method=2,
+                           otp='111111')
+
+    assert response.code == 406
+
+
+def test_step_two_login_blocked(client):
+    login = client.post('/login', email='user+bc@example.com', password='secret')
+
+    assert login.json['default_method'] == 4
+
+    response = client.post('/step_two_login', session=login.json['session'], method=4,
+                           otp='000000')
+
+    assert response.code == 503
+    assert len(response.json['methods']) == len(stub.METHODS)
+
+
+def test_step_two_login_prompt(client):
+    login = client.post('/login', email='user+az@example.com', password='secret')
+
+    assert login.json['default_method'] == 1
+
+    response = client.post('/step_two_login', session=login.json['session'], method=1)
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
+
+
+def test_change_method(client):
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+
+    # text message.
+    response = client.post('/change_method', session=login.json['session'],
+                           method=login.json['methods'][2])
+
+    assert response.code == 200
+    assert response.json['method'] == 3
+    assert response.json['number']
+
+    response = client.post('/step_two_login', session=response.json['session'], method=3,
+                           otp='123456')
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
+
+
+def test_change_method_unknown(client):
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+    response = client.post('/change_method', session=login.json['session'], method=3)
+
+    assert response.code == 400
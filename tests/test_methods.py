@@ -0,0 +1,118 @@
+'''
+`/methods` in every method discovery mode, and for the sessions of the logins which got 503.
+'''
+
+import pytest
+
+from py_google_auth import login_utils
+from py_google_auth import stub
+from py_google_auth import transport
+from py_google_auth import utils
+
+
+def forbid_discovery(monkeypatch):
+    def fail(*args):
+        raise AssertionError('methods were collected again')
+
+    monkeypatch.setattr(login_utils, 'select_alternate_method', fail)
+    monkeypatch.setattr(login_utils, 'get_listed_methods', fail)
+
+
+def without_methods(session):
+    '''
+    The session as sent before methods were kept in it along with the url to select them.
+    '''
+    session = utils.deserialize_session(session)
+    del session.methods
+    return utils.serialize_session(session)
+
+
+def blocked_login(client):
+    login = client.post('/login', email='user+bc@example.com', password='secret')
+    response = client.post('/step_two_login', session=login.json['session'], method=4,
+                           otp='000000')
+
+    assert response.code == 503
+    return response
+
+
+def unavailable_login(client):
+    response = client.post('/login', email='unavailable+totp@example.com', password='secret')
+
+    assert response.code == 503
+    return response
+
+
+@pytest.mark.parametrize('mode', ['lazy', 'deferred'])
+def test_methods_collected_later(client, monkeypatch, mode):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_METHOD_DISCOVERY', mode)
+
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+
+    assert login.code == 303
+    assert 'methods' not in login.json
+
+    response = client.post('/methods', session=login.json['session'])
+
+    assert response.code == 200
+    assert len(response.json['methods']) == len(stub.METHODS)
+
+    # the methods are kept in the session.
+    forbid_discovery(monkeypatch)
+    again = client.post('/methods', session=response.json['session'])
+
+    assert again.json['methods'] == response.json['methods']
+
+    # and user can still go on with the default method.
+    response = client.post('/step_two_login', session=response.json['session'], method=2,
+                           otp='123456')
+
+    assert response.code == 200
+
+
+@pytest.mark.parametrize('mode', ['sequential', 'concurrent'])
+def test_methods_collected_on_login(client, monkeypatch, mode):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_METHOD_DISCOVERY', mode)
+
+    login = client.post('/login', email='user+totp@example.com', password='secret')
+
+    assert len(login.json['methods']) == len(stub.METHODS)
+
+    forbid_discovery(monkeypatch)
+    response = client.post('/methods', session=login.json['session'])
+
+    assert response.code == 200
+    assert response.json['methods'] == login.json['methods']
+
+
+@pytest.mark.parametrize('make_login', [unavailable_login, blocked_login])
+def test_methods_of_503(client, monkeypatch, make_login):
+    login = make_login(client)
+
+    forbid_discovery(monkeypatch)
+    response = client.post('/methods', session=login.json['session'])
+
+    assert response.code == 200
+    assert response.json['methods'] == login.json['methods']
+
+
+@pytest.mark.parametrize('make_login', [unavailable_login, blocked_login])
+def test_methods_from_selection_page(client, make_login):
+    login = make_login(client)
+    response = client.post('/methods', session=without_methods(login.json['session']))
+
+    assert response.code == 200
+    assert response.json['methods'] == login.json['methods']
+
+    # text message.
+    response = client.post('/change_method', session=response.json['session'],
+                           method=response.json['methods'][2])
+
+    assert response.code == 200
+    assert response.json['method'] == 3
+
+
+def test_methods_of_other_session(client):
+    response = client.post('/methods', session=utils.encode_session(transport.new_session()))
+
+    assert response.code == 400
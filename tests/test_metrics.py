@@ -0,0 +1,96 @@
+'''
+Metrics of all the workers added up by `/metrics`.
+'''
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from py_google_auth import metrics
+
+
+@pytest.fixture
+def directory(tmpdir, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_METRICS_DIR', str(tmpdir))
+    monkeypatch.setattr(metrics, '_counters', {})
+    monkeypatch.setattr(metrics, '_histograms', {})
+
+    return str(tmpdir)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+
+    return process.pid
+
+
+def dump(directory, pid, counters=(), histograms=()):
+    '''
+    Writes the file of another worker.
+    '''
+    with open(os.path.join(directory, '%d.json' % pid), 'w') as f:
+        json.dump({'counters': list(counters), 'histograms': list(histograms)}, f)
+
+
+def test_workers_added_up(directory):
+    labels = [['resource', 'NormalLogin'], ['status', '200']]
+    histogram = [0] * len(metrics.BUCKETS) + [0.0, 0]
+    histogram[0], histogram[-2], histogram[-1] = 1, 0.0001, 1
+
+    metrics.increment(metrics.RESPONSES, resource='NormalLogin', status='200')
+    metrics.observe(metrics.PARSE_SECONDS, 0.0001, part='forms')
+
+    # the gunicorn master is a process which is alive.
+    dump(directory, os.getppid(), [[metrics.RESPONSES, labels, 2]],
+         [[metrics.PARSE_SECONDS, [['part', 'forms']], histogram]])
+
+    counters, histograms = metrics.collect()
+
+    assert counters[(metrics.RESPONSES, tuple(tuple(label) for label in labels))] == 3
+    assert histograms[(metrics.PARSE_SECONDS, (('part', 'forms'),))][-1] == 2
+
+    rendered = metrics.render()
+
+    assert 'py_google_auth_responses_total{resource="NormalLogin",status="200"} 3' in rendered
+    assert 'py_google_auth_parse_seconds_count{part="forms"} 2' in rendered
+
+
+def test_gone_workers_skipped(directory):
+    dump(directory, dead_pid(), [[metrics.RESPONSES, [], 5]])
+
+    counters, histograms = metrics.collect()
+
+    assert (metrics.RESPONSES, ()) not in counters
+
+
+def test_reset(directory):
+    dump(directory, os.getppid())
+    dump(directory, dead_pid())
+    open(os.path.join(directory, 'other.txt'), 'w').close()
+
+    metrics.reset()
+
+    # the file of this process may have been dumped again since.
+    assert set(os.listdir(directory)) - {'%d.json' % os.getpid()} == {'other.txt'}
+
+
+def test_remove(directory):
+    dump(directory, os.getppid())
+    metrics.flush()
+
+    metrics.remove(os.getppid())
+
+    assert os.listdir(directory) == ['%d.json' % os.getpid()]
+
+
+def test_metrics_endpoint(client, directory):
+    client.post('/login', email='user@example.com', password='secret')
+    response = client.get('/metrics')
+
+    assert response.code == 200
+    assert 'py_google_auth_responses_total{resource="NormalLogin",status="200"} 1' in \
+        response.text
@@ -0,0 +1,69 @@
+import pytest
+
+from py_google_auth import outcomes
+from py_google_auth import page
+from py_google_auth import utils
+
+
+def test_first_rule_wins():
+    classifier = outcomes.Classifier('test', [('first', ['b', 'c']), ('second', ['a'])])
+
+    assert classifier.classify('abc') == 'first'
+    assert classifier.classify('a') == 'second'
+    assert classifier.classify('xyz') is None
+
+
+@pytest.mark.parametrize('text, outcome', [
+    ("<span>Wrong password. Try again.</span>", 'wrong_credentials'),
+    ("<span>Google doesn't recognize that email</span>", 'wrong_credentials'),
+    ('<p>Type the text you hear or see</p><img id="captchaimg" src="/captcha">', 'captcha'),
+    ('<div id="recaptcha"></div>', 'captcha'),
+    # wrong credentials come first.
+    ('<span>Wrong password</span><div id="captcha"></div>', 'wrong_credentials'),
+    ('<h1>Welcome</h1>', None),
+])
+def test_login(text, outcome):
+    assert outcomes.LOGIN.classify(text) == outcome
+
+
+@pytest.mark.parametrize('text, outcome', [
+    ("Check your phone, Google sent a prompt to sign in", 1),
+    ("Get a verification code from the Google Authenticator app", 2),
+    ("Enter one of your 8-digit backup codes", 4),
+    ("Choose how you want to sign in", None),
+])
+def test_default_method(text, outcome):
+    assert outcomes.DEFAULT_METHOD.classify(text) == outcome
+
+
+def test_default_method_names():
+    for method, names in utils.get_method_names().items():
+        assert outcomes.DEFAULT_METHOD.classify('<span>%s</span>' % names[0]) == method
+
+
+@pytest.mark.parametrize('text, outcome', [
+    ("Unavailable because of too many failed attempts. Resend code", 'blocked'),
+    ("Wrong code. Try again. Resend code", 'resend'),
+    ("Wrong code. Try again.", None),
+])
+def test_otp(text, outcome):
+    assert outcomes.OTP.classify(text) == outcome
+
+
+def test_page_classifies_once():
+    calls = []
+
+    class Counting(outcomes.Classifier):
+        def classify(self, text):
+            calls.append(text)
+            return super(Counting, self).classify(text)
+
+    classifier = Counting('counting', [('found', ['needle'])])
+    parsed = page.Page('hay needle hay')
+
+    assert parsed.classify(classifier) == 'found'
+    assert parsed.classify(classifier) == 'found'
+    assert len(calls) == 1
+
+    # every classifier is searched with once.
+    assert parsed.classify(outcomes.LOGIN) is None
@@ -0,0 +1,28 @@
+import pytest
+
+from py_google_auth import profiler
+
+
+@pytest.fixture
+def profiled(client, monkeypatch):
+    monkeypatch.setattr(profiler, '_profile', None)
+
+    response = client.get('/debug/profile', 'mode=cprofile&resource=NormalLogin&requests=1')
+    assert response.code == 202
+
+    client.post('/login', email='user@example.com', password='secret')
+
+    return client
+
+
+@pytest.mark.parametrize('sort', ['cumulative', 'tottime', 'calls'])
+def test_sort(profiled, sort):
+    response = profiled.get('/debug/profile', 'mode=cprofile&sort=' + sort)
+
+    assert response.code == 200
+
+
+def test_unknown_sort(profiled):
+    response = profiled.get('/debug/profile', 'mode=cprofile&sort=unknown')
+
+    assert response.code == 400
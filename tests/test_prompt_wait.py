@@ -0,0 +1,109 @@
+'''
+Waiting for Google prompt in background: `/step_two_login` jobs, `/jobs/<id>` and its events.
+'''
+
+import concurrent.futures
+import json
+import time
+
+import pytest
+
+from py_google_auth import jobs
+from py_google_auth import prompt_wait
+from py_google_auth import session_store
+
+from .test_login import is_signed_in
+
+
+@pytest.fixture(params=['threads', 'asyncio'])
+def background(client, monkeypatch, request):
+    if request.param == 'asyncio':
+        pytest.importorskip('aiohttp')
+
+    monkeypatch.setenv('PY_GOOGLE_AUTH_PROMPT_WAIT', 'background')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_PROMPT_ENGINE', request.param)
+
+    return client
+
+
+def start_job(client):
+    login = client.post('/login', email='user+az@example.com', password='secret')
+    response = client.post('/step_two_login', session=login.json['session'], method=1)
+
+    assert response.code == 202
+    return response.json['job']
+
+
+def test_job(background):
+    job_id = start_job(background)
+    jobs.get(job_id).result(timeout=30)
+
+    response = background.get('/jobs/' + job_id)
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
+
+
+def test_job_events(background):
+    job_id = start_job(background)
+    response = background.get('/jobs/%s/events' % job_id)
+
+    assert response.code == 200
+
+    event, data = response.text.split('\n')[-4:-2]
+    result = json.loads(data[len('data: '):])
+
+    assert event == 'event: result'
+    assert result['status'] == 200
+    assert is_signed_in(result['body']['session'])
+
+
+def test_pending_job(client):
+    future = concurrent.futures.Future()
+    job_id = jobs.register(future)
+
+    assert client.get('/jobs/' + job_id).code == 202
+
+    events = prompt_wait.stream_events(job_id, interval=0)
+
+    assert next(events) == b': pending\n\n'
+
+    future.set_result(prompt_wait.to_result('200 OK', {'session': 'session'}))
+
+    assert next(events).startswith(b'event: result\n')
+    assert list(events) == []
+
+
+def test_failed_job(client):
+    future = concurrent.futures.Future()
+    future.set_exception(ValueError('failed'))
+
+    assert client.get('/jobs/' + jobs.register(future)).code == 500
+
+
+@pytest.mark.parametrize('path', ['/jobs/unknown', '/jobs/unknown/events'])
+def test_unknown_job(client, path):
+    assert client.get(path).code == 404
+
+
+def test_state_kept_in_store(client, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_PROMPT_WAIT', 'background')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_PROMPT_ENGINE', 'threads')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_STORE', 'memory')
+
+    job_id = start_job(client)
+    jobs.get(job_id).result(timeout=30)
+
+    # the final state is saved by a callback of the job.
+    for _ in range(100):
+        state = session_store.get_store().backend.get('job-' + job_id)
+        if state is not None and json.loads(state)['state'] == 'done':
+            break
+        time.sleep(0.05)
+
+    # as another worker sharing the store would see it.
+    jobs.pop(job_id)
+    response = client.get('/jobs/' + job_id)
+
+    assert response.code == 200
+    assert is_signed_in(response.json['session'])
@@ -0,0 +1,108 @@
+import pytest
+
+from py_google_auth import session_cache
+from py_google_auth import session_store
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_CACHE', 'memory')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_CACHE_KEY', 'cache-secret')
+    monkeypatch.setattr(session_cache, '_cache', None)
+
+    return session_cache.get_cache()
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.delenv('PY_GOOGLE_AUTH_SESSION_CACHE', raising=False)
+    monkeypatch.setattr(session_cache, '_cache', None)
+
+    assert session_cache.get_cache() is None
+    assert session_cache.get_key('user@example.com', 'secret') is None
+    assert session_cache.hold('key') is None
+
+
+def test_secret_required(monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_CACHE', 'memory')
+    monkeypatch.delenv('PY_GOOGLE_AUTH_SESSION_CACHE_KEY', raising=False)
+    monkeypatch.setattr(session_cache, '_cache', None)
+
+    with pytest.raises(ValueError):
+        session_cache.get_cache()
+
+
+def test_keys(cache):
+    key = session_cache.get_key('User@Example.com ', 'secret')
+
+    assert key == session_cache.get_key('user@example.com', 'secret')
+    assert key != session_cache.get_key('user@example.com', 'other')
+    assert 'user' not in key and 'secret' not in key
+
+
+def test_keys_depend_on_secret(cache):
+    other = session_cache.SessionCache(cache.backend, 'other-secret')
+
+    assert other.get_key('user@example.com', 'secret') != \
+        session_cache.get_key('user@example.com', 'secret')
+
+
+def test_lookup(cache):
+    key = session_cache.get_key('user@example.com', 'secret')
+
+    assert session_cache.lookup(key, lambda session: True) is None
+
+    session_cache.store(key, 'encoded-session')
+
+    assert session_cache.lookup(key, lambda session: True) == 'encoded-session'
+
+
+def test_lookup_unchecked_keeps_session(cache):
+    key = session_cache.get_key('user@example.com', 'secret')
+    session_cache.store(key, 'encoded-session')
+
+    # google could not be reached.
+    assert session_cache.lookup(key, lambda session: None) is None
+    assert session_cache.lookup(key, lambda session: True) == 'encoded-session'
+
+
+def test_lookup_signed_out_drops_session(cache):
+    key = session_cache.get_key('user@example.com', 'secret')
+    session_cache.store(key, 'encoded-session')
+
+    assert session_cache.lookup(key, lambda session: False) is None
+    assert session_cache.lookup(key, lambda session: True) is None
+
+
+def test_hold_and_release(cache):
+    key = session_cache.get_key('user@example.com', 'secret')
+    handle = session_cache.hold(key)
+
+    assert session_store.is_handle(handle)
+    assert key not in handle
+    assert session_cache.release(handle) == key
+
+    # a handle is released once.
+    assert session_cache.release(handle) is None
+
+
+@pytest.mark.parametrize('handle', [None, 'not a handle', 'pga:unknown'])
+def test_release_unknown(cache, handle):
+    assert session_cache.release(handle) is None
+
+
+def test_encrypted():
+    pytest.importorskip('cryptography')
+
+    backend = session_store.create_backend('memory', 60, 10, 'test')
+    cache = session_cache.SessionCache(backend, 'secret',
+                                       session_cache.create_cipher('secret', 'memory'))
+    cache.put('key', 'encoded-session')
+
+    assert backend.get('key') != 'encoded-session'
+    assert cache.get('key') == 'encoded-session'
+
+    other = session_cache.SessionCache(backend, 'other',
+                                       session_cache.create_cipher('other', 'memory'))
+
+    assert other.get('key') is None
+    assert backend.get('key') is None
@@ -0,0 +1,62 @@
+import pytest
+
+from py_google_auth import session_codec
+from py_google_auth import transport
+
+
+def make_session():
+    session = transport.new_session()
+    session.headers['User-Agent'] = 'tests'
+    session.cookies.set('GAPS', 'gaps-value', domain='accounts.google.com', path='/')
+    session.cookies.set('NID', 'nid-value', domain='.google.com', path='/', secure=True)
+
+    # stuffed in the session for the next step of login.
+    session.next_url = 'https://accounts.google.com/signin/challenge/totp/2'
+    session.prev_payload = {'TL': 'tl-value', 'gxf': 'gxf-value'}
+    session.query_params = None
+
+    return session
+
+
+@pytest.mark.parametrize('format, prefix', [('compact', 'pga1:z:'), ('json', 'pga1:j:'),
+                                            ('jsonpickle', '{')])
+def test_round_trip(format, prefix):
+    encoded = session_codec.encode(make_session(), format)
+    session = session_codec.decode(encoded)
+
+    assert encoded.startswith(prefix)
+    assert session.headers['User-Agent'] == 'tests'
+    assert session.cookies.get('GAPS', domain='accounts.google.com') == 'gaps-value'
+    assert session.cookies.get('NID', domain='.google.com') == 'nid-value'
+    assert session.next_url == 'https://accounts.google.com/signin/challenge/totp/2'
+    assert session.prev_payload == {'TL': 'tl-value', 'gxf': 'gxf-value'}
+    assert session.query_params is None
+
+
+def test_secure_cookie_kept_secure():
+    session = session_codec.decode(session_codec.encode(make_session(), 'compact'))
+    secure = {cookie.name: cookie.secure for cookie in session.cookies}
+
+    assert secure == {'GAPS': False, 'NID': True}
+
+
+def test_decoded_session_uses_shared_adapters():
+    session = session_codec.decode(session_codec.encode(make_session(), 'compact'))
+
+    assert session.get_adapter('https://accounts.google.com') is transport.get_adapter()
+
+
+def test_configured_format(monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_FORMAT', 'json')
+
+    assert session_codec.encode(make_session()).startswith('pga1:j:')
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        session_codec.encode(make_session(), 'pickle')
+
+
+def test_unknown_encoding():
+    with pytest.raises(ValueError):
+        session_codec.decode('pga1:x:abc')
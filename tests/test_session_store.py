@@ -0,0 +1,131 @@
+import os
+import time
+
+import pytest
+
+from py_google_auth import session_store
+
+
+class Clock(object):
+    '''
+    Stands in for `time.time`, moved forward by tests.
+    '''
+
+    def __init__(self):
+        self.now = time.time()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, 'time', clock)
+
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_backend(request, tmpdir):
+    def make_backend(ttl, size):
+        spec = request.param
+        if spec == 'sqlite':
+            spec = 'sqlite:' + str(tmpdir.join('store.db'))
+        return session_store.create_backend(spec, ttl, size)
+
+    return make_backend
+
+
+def set_used(backend, key, used):
+    '''
+    Marks a value of a shm backend as last used at `used`.
+    '''
+    os.utime(backend.path(key), (used, used))
+
+
+def test_expire(make_backend, clock):
+    backend = make_backend(60, 10)
+    backend.set('a', 'value')
+
+    clock.now += 50
+    assert backend.get('a') == 'value'
+
+    # use keeps it.
+    clock.now += 50
+    assert backend.get('a') == 'value'
+
+    clock.now += 61
+    assert backend.get('a') is None
+    assert 'a' not in backend.keys()
+
+
+def test_evict_least_recently_used(make_backend, clock):
+    backend = make_backend(60, 2)
+    backend.set('a', 'value-a')
+    clock.now += 1
+    backend.set('b', 'value-b')
+    clock.now += 1
+    backend.get('a')
+    clock.now += 1
+    backend.set('c', 'value-c')
+
+    assert backend.get('b') is None
+    assert backend.get('a') == 'value-a'
+    assert backend.get('c') == 'value-c'
+
+
+def test_shm_expire(tmpdir):
+    backend = session_store.create_backend('shm:' + str(tmpdir), 60, 10)
+    backend.set('a', 'value')
+
+    set_used(backend, 'a', time.time() - 50)
+    assert backend.get('a') == 'value'
+
+    set_used(backend, 'a', time.time() - 61)
+    assert backend.get('a') is None
+    assert backend.keys() == []
+
+
+def test_shm_evict_least_recently_used(tmpdir):
+    backend = session_store.create_backend('shm:' + str(tmpdir), 60, 2)
+    backend.evict_every = 1
+    now = time.time()
+
+    backend.set('a', 'value-a')
+    set_used(backend, 'a', now - 3)
+    backend.set('b', 'value-b')
+    set_used(backend, 'b', now - 2)
+
+    # marks it as used now.
+    assert backend.get('a') == 'value-a'
+
+    backend.set('c', 'value-c')
+
+    assert sorted(backend.keys()) == ['a', 'c']
+
+
+@pytest.mark.parametrize('handle', ['pga:', 'pga:../store.db', 'pga:a/b', 'pga:unknown'])
+def test_unknown_handle(tmpdir, handle):
+    store = session_store.SessionStore(session_store.create_backend('shm:' + str(tmpdir), 60, 2))
+
+    with pytest.raises(session_store.SessionExpired):
+        store.get(handle)
+
+
+def test_handles(tmpdir):
+    store = session_store.SessionStore(session_store.create_backend('shm:' + str(tmpdir), 60, 2))
+    handle = store.put('value')
+
+    assert session_store.is_handle(handle)
+    assert store.get(handle) == 'value'
+
+    store.delete(handle)
+
+    with pytest.raises(session_store.SessionExpired):
+        store.get(handle)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        session_store.create_backend('redis', 60, 10)
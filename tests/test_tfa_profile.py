@@ -0,0 +1,129 @@
+import pytest
+
+from py_google_auth import login_utils
+from py_google_auth import metrics
+from py_google_auth import tfa_profile
+
+
+@pytest.fixture
+def profiles(environment, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TFA_PROFILES', 'memory')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TFA_PROFILE_KEY', 'profile-secret')
+
+
+def test_disabled_without_secret(environment, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TFA_PROFILES', 'memory')
+
+    assert tfa_profile.get_backend() is None
+    assert tfa_profile.get_key('user@example.com') is None
+
+
+def test_session_cache_secret(environment, monkeypatch):
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TFA_PROFILES', 'memory')
+    monkeypatch.setenv('PY_GOOGLE_AUTH_SESSION_CACHE_KEY', 'cache-secret')
+
+    assert tfa_profile.get_key('user@example.com') is not None
+
+
+def test_keys(profiles, monkeypatch):
+    key = tfa_profile.get_key('User@Example.com ')
+
+    assert key == tfa_profile.get_key('user@example.com')
+    assert 'user' not in key
+
+    # clients know the access token, keys are not made with it.
+    monkeypatch.setenv('PY_GOOGLE_AUTH_TFA_PROFILE_KEY', 'other-secret')
+
+    assert tfa_profile.get_key('user@example.com') != key
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    counters = {}
+    monkeypatch.setattr(metrics, '_counters', counters)
+
+    return counters
+
+
+def counted(counters, result):
+    return counters.get((metrics.TFA_PROFILES, (('result', result),)), 0)
+
+
+TOTP_URL = 'https://accounts.google.com/signin/challenge/totp/2'
+
+
+def test_lookup(profiles, counters):
+    key = tfa_profile.get_key('user@example.com')
+
+    assert tfa_profile.lookup(key, TOTP_URL) is None
+    assert counted(counters, 'miss') == 1
+
+    tfa_profile.save(key, 2, ['Google Authenticator', 'text message'], '** 12')
+
+    assert tfa_profile.lookup(key, TOTP_URL) == {
+        'default_method': 2, 'methods': ['Google Authenticator', 'text message'],
+        'number': '** 12'}
+    assert counted(counters, 'hit') == 1
+
+
+def test_lookup_stale(profiles, counters):
+    key = tfa_profile.get_key('user@example.com')
+    tfa_profile.save(key, 2)
+
+    # google shows the challenge of another default method.
+    assert tfa_profile.lookup(key, 'https://accounts.google.com/signin/challenge/ipp/3') is None
+    assert counted(counters, 'stale') == 1
+
+    assert tfa_profile.lookup(key, TOTP_URL) is None
+
+
+def test_save_keeps_methods(profiles):
+    key = tfa_profile.get_key('user@example.com')
+    tfa_profile.save(key, 2, ['Google Authenticator'])
+    tfa_profile.save(key, 2)
+
+    assert tfa_profile.lookup(key, TOTP_URL)['methods'] == ['Google Authenticator']
+
+    tfa_profile.save_methods(key, ['Google Authenticator', 'backup code'])
+
+    assert tfa_profile.lookup(key, TOTP_URL)['methods'] == ['Google Authenticator', 'backup code']
+
+
+def test_invalidate(profiles, counters):
+    key = tfa_profile.get_key('user@example.com')
+    tfa_profile.save(key, 2)
+    tfa_profile.invalidate(key)
+
+    assert counted(counters, 'invalidated') == 1
+    assert tfa_profile.lookup(key, TOTP_URL) is None
+
+
+def test_hold(profiles):
+    key = tfa_profile.get_key('user@example.com')
+    handle = tfa_profile.hold(key)
+
+    assert key not in handle
+    assert tfa_profile.resolve(handle) == key
+
+    tfa_profile.release(handle)
+
+    assert tfa_profile.resolve(handle) is None
+
+
+def test_login_from_profile(client, profiles, monkeypatch):
+    first = client.post('/login', email='user+totp@example.com', password='secret')
+
+    # the methods are not collected again.
+    monkeypatch.setattr(login_utils, 'select_alternate_method',
+                        lambda *args: pytest.fail('methods were collected again'))
+
+    second = client.post('/login', email='user+totp@example.com', password='secret')
+
+    assert second.code == 303
+    assert second.json['default_method'] == first.json['default_method']
+    assert second.json['methods'] == first.json['methods']
+
+    response = client.post('/step_two_login', session=second.json['session'], method=2,
+                           otp='123456')
+
+    assert response.code == 200
@@ -0,0 +1,68 @@
+import pytest
+
+from py_google_auth import transport
+from py_google_auth import utils
+from py_google_auth import validate
+
+
+def signed_in_session(client):
+    return client.post('/login', email='user@example.com', password='secret').json['session']
+
+
+@pytest.mark.parametrize('session', ['123', 'null', '[1]', 'not json', 'pga1:x:abc',
+                                     'pga1:z:abc', 'pga1:z:eJw=', 'pga1:j:{}', '{"cookies": 1}',
+                                     'pga1:j:{"cookies": 1, "headers": {}, "flow": {}}'])
+def test_undecodable_session_is_invalid(session):
+    assert validate.check_session(session) == 'invalid'
+
+
+def test_live_session(client):
+    assert validate.check_session(signed_in_session(client)) == 'live'
+
+
+def test_signed_out_session(client):
+    assert validate.check_session(utils.encode_session(transport.new_session())) == 'expired'
+
+
+def test_unreachable_google(environment, monkeypatch):
+    session = utils.encode_session(transport.new_session())
+
+    # nothing listens on the port of a closed server.
+    monkeypatch.setenv('PY_GOOGLE_AUTH_ACCOUNTS_URL', 'http://127.0.0.1:9')
+
+    assert validate.check_session(session) == 'unknown'
+
+
+def test_validate_sessions(client):
+    live = signed_in_session(client)
+    signed_out = utils.encode_session(transport.new_session())
+
+    response = client.post('/sessions/validate', sessions=[live, '123', signed_out, live])
+
+    assert response.code == 200
+    assert response.json['sessions'] == [{'index': 0, 'status': 'live'},
+                                         {'index': 1, 'status': 'invalid'},
+                                         {'index': 2, 'status': 'expired'},
+                                         {'index': 3, 'status': 'live'}]
+
+
+def test_sessions_checked_once(environment, monkeypatch):
+    checked = []
+    monkeypatch.setattr(validate, 'check_session',
+                        lambda session: checked.append(session) or 'live')
+
+    assert validate.check_sessions(['a', 'b', 'a', 'a'], 4) == ['live'] * 4
+    assert sorted(checked) == ['a', 'b']
+
+
+@pytest.mark.parametrize('sessions', [None, [], 'session', [1], ['session'] * 1001])
+def test_invalid_request(client, sessions):
+    response = client.post('/sessions/validate', sessions=sessions)
+
+    assert response.code == 400
+
+
+def test_invalid_concurrency(client):
+    response = client.post('/sessions/validate', sessions=['session'], concurrency=0)
+
+    assert response.code == 400